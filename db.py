@@ -1,21 +1,27 @@
 # from https://stackoverflow.com/questions/1977362/how-to-create-module-wide-variables-in-python
 import sys
+import atexit
 import pandas as pd
 from source.gui.settings import user_folder
+from source.utils.database_store import Database_store, Write_behind, apply_schema
+from source.utils.variable_store import Variable_store
 
+# {table_name: (name of module DataFrame, csv file setting used by earlier versions)}
+TABLES = {
+    "tasks": ("task_df", "task_dir_dataframe_filepath"),
+    "experiments": ("exp_df", "experiment_dataframe_filepath"),
+    "setups": ("setup_df", "setup_dir_dataframe_filepath"),
+    "mice": ("mouse_df", "mice_dataframe_filepath"),
+}
 
-def load_data_csv():
+# {table_name: columns of the table's module DataFrame that are indexed}
+INDEXED_COLUMNS = {
+    "mice": ["RFID", "Mouse_ID", "Setup_ID"],
+    "setups": ["Setup_ID", "COM", "COM_AC"],
+}
 
-    task_df = pd.read_csv(user_folder("task_dir_dataframe_filepath"))
-    exp_df = pd.read_csv(user_folder("experiment_dataframe_filepath"))
-    setup_df = pd.read_csv(user_folder("setup_dir_dataframe_filepath"))
-    mouse_df = pd.read_csv(user_folder("mice_dataframe_filepath"))
-
-    for col in mouse_df.columns:
-        if "Unnamed" in col:
-            mouse_df.drop(col, inplace=True, axis=1)
-
-    return task_df, exp_df, setup_df, mouse_df
+# {name of module index: table_name}
+INDEX_NAMES = {"mouse_index": "mice", "setup_index": "setups"}
 
 
 # this is a pointer to the module object instance itself.
@@ -29,4 +35,219 @@ this.message_queue = []
 # These are print consumers that ensure that things are printer to the correct place
 this.print_consumers = {}
 
-this.task_df, this.exp_df, this.setup_df, this.mouse_df = load_data_csv()
+this.store = Database_store(user_folder("database_filepath"))
+
+# Writes to the database are made in the background by the writer, see flush().
+this.writer = Write_behind(this.store)
+
+# The module DataFrames (task_df, exp_df, setup_df, mouse_df), their indexes (mouse_index,
+# setup_index) and the store of typed task variables (variables) are loaded on first use.
+this.indexes = {}  # {table_name: Table_index}
+
+
+def _load_table(table):
+    """Read table from the database into its module DataFrame, importing the csv file saved by
+    earlier versions on first use."""
+    df_name, csv_setting = TABLES[table]
+    this.store.import_csv(table, user_folder(csv_setting))
+    df = this.store.read_table(table)
+    setattr(this, df_name, df)
+    if table in INDEXED_COLUMNS:
+        this.indexes[table] = Table_index(table, INDEXED_COLUMNS[table])
+    return df
+
+
+def __getattr__(name):
+    """Load the module DataFrames, indexes and variable store when they are first used."""
+    for table, (df_name, _) in TABLES.items():
+        if name == df_name:
+            return _load_table(table)
+    if name in INDEX_NAMES:
+        table = INDEX_NAMES[name]
+        getattr(this, TABLES[table][0])
+        setattr(this, name, this.indexes[table])
+        return this.indexes[table]
+    if name == "variables":
+        this.store.import_csv("mice", user_folder(TABLES["mice"][1]))
+        this.variables = Variable_store(this.store, this.writer)
+        this.variables.import_mouse_columns()
+        return this.variables
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+# ----------------------------------------------------------------------------------------
+#  Indexes of the module DataFrames.
+# ----------------------------------------------------------------------------------------
+
+
+class Table_index:
+    """Hash index from the values of columns of a module DataFrame to the labels of the rows
+    holding them, so rows can be found without scanning the table.  The index is kept
+    consistent by insert, delete and update below, rebuild() must be called after changing an
+    indexed column of the DataFrame directly."""
+
+    def __init__(self, table, columns):
+        self.table = table
+        self.columns = columns
+        self.rebuild()
+
+    def rebuild(self):
+        self.labels = {column: {} for column in self.columns}  # {column: {value: [row_labels]}}
+        df = getattr(this, TABLES[self.table][0])
+        for label, row in df.iterrows():
+            self._add(label, row)
+
+    def _add(self, label, row):
+        for column in self.columns:
+            value = row.get(column)
+            if not pd.isnull(value):
+                self.labels[column].setdefault(value, []).append(label)
+
+    def _remove(self, labels):
+        labels = set(labels)
+        for column_labels in self.labels.values():
+            for value in list(column_labels):
+                column_labels[value] = [label for label in column_labels[value] if label not in labels]
+                if not column_labels[value]:
+                    del column_labels[value]
+
+    def find(self, column, value):
+        """Return list of the labels of the rows where column == value."""
+        return list(self.labels[column].get(value, []))
+
+    def row(self, column, value):
+        """Return a Row_handle for the first row where column == value, None if there is no such row."""
+        labels = self.labels[column].get(value)
+        if not labels:
+            return None
+        return Row_handle(self.table, labels[0], column, value)
+
+
+class Row_handle:
+    """Handle on a single row of a module DataFrame, looked up once via a Table_index and then
+    used to read and write the row's values without searching the table again.  Writes to the
+    database identify the row by the indexed column value it was looked up with."""
+
+    def __init__(self, table, label, column, value):
+        self.table = table
+        self.label = label
+        self.column = column
+        self.value = value
+
+    @property
+    def df(self):
+        return getattr(this, TABLES[self.table][0])
+
+    def __getitem__(self, column):
+        return self.df.at[self.label, column]
+
+    def get(self, column, default=None):
+        """Return the row's value in column, default if the column does not exist or the value is null."""
+        if column not in self.df.columns:
+            return default
+        value = self.df.at[self.label, column]
+        return default if pd.isnull(value) else value
+
+    def to_dict(self):
+        return self.df.loc[self.label].to_dict()
+
+    def update(self, values):
+        """Set values {column: value} in the row, in the module DataFrame and the database."""
+        for column, value in values.items():
+            _set_value(self.df, self.label, column, value)
+        this.writer.update_rows(self.table, self.column, self.value, values)
+        _reindex(self.table, values)
+
+    def save(self):
+        """Write the row to the database, used after modifying the DataFrame row directly."""
+        row = {column: value for column, value in self.to_dict().items() if not column.startswith("Unnamed")}
+        this.writer.replace_rows(self.table, self.column, self.value, [row])
+
+
+def _row_labels(table, column, value):
+    """Return the labels of the rows of the module DataFrame where column == value, using the
+    table's index if the column is indexed."""
+    df = getattr(this, TABLES[table][0])
+    index = this.indexes.get(table)
+    if index and column in index.columns:
+        return index.find(column, value)
+    return df.index[df[column] == value].tolist()
+
+
+def _set_value(df, labels, column, value):
+    """Set column of the rows with labels to value, changing the column's dtype if the value
+    does not fit it (e.g. a new category)."""
+    try:
+        df.loc[labels, column] = value
+    except (TypeError, ValueError):
+        if isinstance(df[column].dtype, pd.CategoricalDtype) and not pd.isnull(value):
+            df[column] = df[column].cat.add_categories([value])
+        else:
+            df[column] = df[column].astype(object)
+        df.loc[labels, column] = value
+
+
+def _reindex(table, values):
+    """Rebuild the index of table if values {column: value} changed an indexed column."""
+    index = this.indexes.get(table)
+    if index and any(column in index.columns for column in values):
+        index.rebuild()
+
+
+# ----------------------------------------------------------------------------------------
+#  Row level updates of the DataFrames and database.
+#
+#  The module DataFrames are updated immediately, the database is updated by the writer
+#  thread shortly afterwards.
+# ----------------------------------------------------------------------------------------
+
+
+def update(table, column, value, values):
+    """Set values {column: value} in the rows of table where column == value, in the
+    module DataFrame and the database."""
+    df = getattr(this, TABLES[table][0])
+    labels = _row_labels(table, column, value)
+    for v_column, v_value in values.items():
+        _set_value(df, labels, v_column, v_value)
+    this.writer.update_rows(table, column, value, values)
+    _reindex(table, values)
+
+
+def insert(table, row):
+    """Append row, a dict {column: value}, to table in the module DataFrame and the database.
+    Existing rows keep their labels so row handles stay valid."""
+    df_name = TABLES[table][0]
+    df = getattr(this, df_name)
+    label = df.index.max() + 1 if len(df) else 0
+    setattr(this, df_name, apply_schema(pd.concat([df, pd.DataFrame([row], index=[label])]), table))
+    this.writer.insert_rows(table, [row])
+    if table in this.indexes:
+        this.indexes[table]._add(label, row)
+
+
+def delete(table, column, values):
+    """Delete the rows of table where column is in values from the module DataFrame and the database."""
+    df_name = TABLES[table][0]
+    df = getattr(this, df_name)
+    deleted = df[column].isin(values)
+    setattr(this, df_name, df.loc[~deleted])
+    this.writer.delete_rows(table, column, values)
+    if table in this.indexes:
+        this.indexes[table]._remove(df.index[deleted])
+
+
+def save_rows(table, column, value):
+    """Write the rows of the module DataFrame where column == value to the database, used after
+    modifying the DataFrame directly."""
+    df = getattr(this, TABLES[table][0])
+    rows = df.loc[_row_labels(table, column, value)]
+    rows = rows.loc[:, ~rows.columns.str.contains("^Unnamed")]
+    this.writer.replace_rows(table, column, value, rows.to_dict("records"))
+
+
+def flush():
+    """Write all pending changes to the database now."""
+    this.writer.flush()
+
+
+atexit.register(this.writer.close)  # Write any pending changes on exit.
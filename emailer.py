@@ -10,7 +10,9 @@ from email.mime.multipart import MIMEMultipart
 
 from source.utils import get_users, get_user_dicts
 from source.gui.settings import user_folder
+from source.utils.database_store import Database_store
 
+store = Database_store(user_folder("database_filepath"))  # Mice and setups tables written by the GUI.
 lines_ = open(user_folder("user_path"), "r").readlines()
 users = get_users()
 sender_email = [re.findall('"(.*)"', l)[0] for l in lines_ if "system_email" in l][0]
@@ -111,7 +113,7 @@ if __name__ == "__main__":
     users = get_users()  # get all users
     user_dicts = get_user_dicts()
 
-    setup_df = pd.read_csv(os.path.join(user_folder("setup_dir"), "setups.csv"))
+    setup_df = store.read_table("setups")
     for user in users:
         send_mouse_df = pd.DataFrame(
             columns=[
@@ -140,7 +142,7 @@ if __name__ == "__main__":
                 mouse_dict = get_weight_history(tmp_logP)
                 # print(mouse_dict)
 
-                mouse_df = pd.read_csv(os.path.join(user_folder("mice_dir"), "mice.csv"))
+                mouse_df = store.read_table("mice")
                 # print(mouse_df)
 
                 # print(mouse_dict.keys())
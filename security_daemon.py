@@ -3,7 +3,6 @@ import os
 import re
 import smtplib
 import ssl
-import time
 from datetime import date, timedelta
 from datetime import datetime
 from email.mime.multipart import MIMEMultipart
@@ -14,29 +13,37 @@ import pandas as pd
 
 from source.utils import get_user_dicts, get_users
 from source.gui.settings import user_folder
+from source.utils.database_store import Database_store, Change_listener
+from source.utils.session_log import Session_log
 
 # This is a basic script that runs, independently of pycontrol and looks for errors
 
+store = Database_store(user_folder("database_filepath"))  # Mice, setups and setup status tables written by the GUI.
 
-def check_loggers_running(user):
+
+def _user_setup_status(user, setup_df, status_df):
+    """Return list of (Setup_ID, status) of the user's setups, where status is the row of the
+    setup in the setup_status table published by the GUI, None if it has not published one."""
+    status_rows = {row["Setup_ID"]: row for _, row in status_df.iterrows()}
+    return [(setup_ID, status_rows.get(setup_ID)) for setup_ID in setup_df.loc[setup_df["User"] == user, "Setup_ID"]]
+
+
+def check_loggers_running(user, setup_df, status_df):
     """run through active loggers and ensure that
     baseline weight message has been received recently
     """
-    setup_df = pd.read_csv(os.path.join(user_folder("setup_dir"), "setups.csv"))
-    setup_rows = setup_df.loc[setup_df["User"] == user]
     active_dict = {}
     warn = False
     now = datetime.now()
-    for _, setup_row in setup_rows.iterrows():
-
-        logger_path = setup_row["logger_path"]
-        with open(logger_path, "r") as lgF:
-            logger_line = lgF.readlines()[-1]
-        last_time_str = re.findall(r"_-(20.*)", logger_line)[0]  # -2021-03-19-125542
-        last_time = datetime.strptime(last_time_str, "%Y-%m-%d-%H%M%S")
+    for setup_ID, status in _user_setup_status(user, setup_df, status_df):
+        if status is None or pd.isnull(status["Last_message_time"]):
+            active_dict[setup_ID] = "No messages received"
+            warn = True
+            continue
+        last_time = datetime.strptime(status["Last_message_time"], "%Y-%m-%d-%H%M%S")
 
         last_delta = (now - last_time).total_seconds()
-        active_dict[setup_row["Setup_ID"]] = last_time.strftime("%m/%d/%Y, %H:%M:%S")
+        active_dict[setup_ID] = last_time.strftime("%m/%d/%Y, %H:%M:%S")
 
         # extended the time until warning message comes on to 5 minutes
         # for mice who linger in the training apparatus.
@@ -45,33 +52,18 @@ def check_loggers_running(user):
     return active_dict, warn
 
 
-def check_ac_status(user):
+def check_ac_status(user, setup_df, status_df):
     """Check system state to ensure that no warning message
     has been received
     """
-
-    setup_df = pd.read_csv(os.path.join(user_folder("setup_dir"), "setups.csv"))
-    setup_rows = setup_df.loc[setup_df["User"] == user]
-    # print(setup_rows)
     logger_state = {}
     warn = False
-    for _, setup_row in setup_rows.iterrows():
-
-        logger_path = setup_row["logger_path"]
-        with open(logger_path, "r") as lgF:
-            logger_lines = lgF.readlines()
-
-        for l in reversed(logger_lines):
-
-            if "state" in l:
-                current_state = re.findall("state:(.*)_-2", l)[0]
-                break
-
-        if current_state == "error_state":
-            logger_state[setup_row["Setup_ID"]] = current_state
+    for setup_ID, status in _user_setup_status(user, setup_df, status_df):
+        if status is not None and status["State"] == "error_state":
+            logger_state[setup_ID] = status["State"]
             warn = True
         else:
-            logger_state[setup_row["Setup_ID"]] = "System state healthy"
+            logger_state[setup_ID] = "System state healthy"
     return logger_state, warn
 
 
@@ -85,13 +77,13 @@ def check_mouse_weights(user, all_mouse_csv, logger_start):
                 mouseID = mouse_row["Mouse_ID"]
                 baseline = mouse_row["Start_weight"]
                 start_time = datetime.strptime(mouse_row["Start_date"], "%m/%d/%Y, %H:%M:%S")
-                mouse_csv = pd.read_csv(os.path.join(user_folder("mice_dir"), mouseID + ".csv"))
-                now_weight = mouse_csv.iloc[-1]["weight"]
+                last_session = Session_log(user_folder("mice_dir"), mouseID)[-1]
+                now_weight = last_session["weight"]
 
-                if mouse_csv.iloc[-1]["entry_time"][0] != "2":
-                    last_seen = mouse_csv.iloc[-1]["entry_time"][1:]
+                if last_session["entry_time"][0] != "2":
+                    last_seen = last_session["entry_time"][1:]
                 else:
-                    last_seen = mouse_csv.iloc[-1]["entry_time"]
+                    last_seen = last_session["entry_time"]
                 frac_baseline = float(now_weight) / float(baseline)
                 last_seen_datetime = datetime.strptime(last_seen, "%Y-%m-%d-%H%M%S")
 
@@ -207,49 +199,49 @@ if __name__ == "__main__":
     daemon_start_time = datetime.now()
     users = get_users()
     user_dicts = get_user_dicts()
-    # DATA_DIR,task_dir,experiment_dir,user_folder("setup_dir"),user_folder("mice_dir"),data_dir,AC_logger_dir,protocol_dir = all_paths
 
-    last_check = datetime.now() - timedelta(seconds=20)
+    # The checks are run whenever the GUI changes the tables, and at least every CHECK_INTERVAL
+    # seconds so that setups that have stopped sending messages are noticed.
+    CHECK_INTERVAL = 600
+    listener = Change_listener(store, ["setups", "mice", "setup_status"], poll_interval=2)
+    tables = {}  # {table_name: DataFrame}, re-read only when the table has changed.
+
     warning_checkDict = {}
     for u in users:
         if u not in warning_checkDict.keys():
             warning_checkDict[u] = datetime.now() - timedelta(days=1)
 
     last_regular_update = datetime.now() - timedelta(days=2)
-    last_post = datetime.now() - timedelta(days=2)
     _, error_log_on_startup = check_GUI_error_log(user_folder("setup_dir"))
     while True:
+        changed_tables = listener.wait(timeout=CHECK_INTERVAL)
+        with store.snapshot():
+            for table in changed_tables:
+                tables[table] = store.read_table(table)
         now = datetime.now()
-        # print(now,last_check)
-        if abs((now - last_check)).total_seconds() > 10:
-            print(now)
-            users = get_users()
-            user_dicts = get_user_dicts()
-            for u in users:
-                if u not in warning_checkDict.keys():
-                    warning_checkDict[u] = datetime.now() - timedelta(days=1)
-
-            all_mice_csv = pd.read_csv(os.path.join(user_folder("mice_dir"), "mice.csv"))
-
-            for user in users:
+        print(now)
+        users = get_users()
+        user_dicts = get_user_dicts()
+        for u in users:
+            if u not in warning_checkDict.keys():
+                warning_checkDict[u] = datetime.now() - timedelta(days=1)
 
-                logger_active, w1 = check_loggers_running(user)
+        for user in users:
 
-                ac_state, w2 = check_ac_status(user)
+            logger_active, w1 = check_loggers_running(user, tables["setups"], tables["setup_status"])
 
-                weight_dict, w3 = check_mouse_weights(user, all_mice_csv, daemon_start_time)
+            ac_state, w2 = check_ac_status(user, tables["setups"], tables["setup_status"])
 
-                w4, message = check_GUI_error_log(user_folder("setup_dir"), error_log_on_startup)
-                if (abs(now - last_regular_update).total_seconds() / 3600.0) > 24:
-                    send_regular_update(weight_dict, user_dicts[user])
-                    last_regular_update = datetime.now()
+            weight_dict, w3 = check_mouse_weights(user, tables["mice"], daemon_start_time)
 
-                if any([w1, w2, w3]) and (((datetime.now() - warning_checkDict[u]).total_seconds() / 3600.0) > 1):
-                    print("SENDING WARNING")
-                    warning_message0 = construct_warning_message(logger_active, ac_state, weight_dict)
-                    warning_message = MIMEText(warning_message0)
-                    send_email(warning_message, "WARNING", user_dicts[user])
-                    warning_checkDict[u] = datetime.now()
+            w4, message = check_GUI_error_log(user_folder("setup_dir"), error_log_on_startup)
+            if (abs(now - last_regular_update).total_seconds() / 3600.0) > 24:
+                send_regular_update(weight_dict, user_dicts[user])
+                last_regular_update = datetime.now()
 
-            last_check = datetime.now()
-        time.sleep(600)
+            if any([w1, w2, w3]) and (((datetime.now() - warning_checkDict[user]).total_seconds() / 3600.0) > 1):
+                print("SENDING WARNING")
+                warning_message0 = construct_warning_message(logger_active, ac_state, weight_dict)
+                warning_message = MIMEText(warning_message0)
+                send_email(warning_message, "WARNING", user_dicts[user])
+                warning_checkDict[user] = datetime.now()
@@ -1,13 +1,13 @@
 import os
-import re
 import time
 import inspect
 from datetime import datetime
 
 from serial import SerialException
 from .pyboard import Pyboard, PyboardError
-from .pycboard import Pycboard, _djb2_file, _receive_file
+from .pycboard import Pycboard, _djb2_file, _receive_file, _folder_manifest
 from .system_handler import system_controller
+from .frame_decoder import AC_frame_decoder
 import db as database
 from source.gui.settings import user_folder
 from source.communication.messages import (
@@ -16,6 +16,10 @@ from source.communication.messages import (
     emit_print_message,
 )
 
+# The last message time is published to the setup_status table at most every STATUS_INTERVAL seconds, as
+# each write wakes the security daemon, changes of state are published immediately.
+STATUS_INTERVAL = 60
+
 # ----------------------------------------------------------------------------------------
 #  Access_control class.
 # ----------------------------------------------------------------------------------------
@@ -35,6 +39,9 @@ class Access_control(Pycboard):
         self.rfid = None
         self.weight = None
         self.status = {"serial": None, "framework": None, "usb_mode": None}
+        self.ac_decoder = AC_frame_decoder()
+        self.published_state = None  # Access control state last published to the setup_status table.
+        self.status_publish_time = 0  # time.monotonic() when the setup_status table was last written.
 
         self._init_logger()
         # Initialise Serial connection
@@ -57,8 +64,10 @@ class Access_control(Pycboard):
         self.enter_raw_repl()  # Soft resets pyboard.
         self.exec(inspect.getsource(_djb2_file))  # define djb2 hashing function.
         self.exec(inspect.getsource(_receive_file))  # define receive file function.
+        self.exec(inspect.getsource(_folder_manifest))  # define folder manifest function.
         self.exec("import os; import gc; import sys; import pyb")
         self.status["usb_mode"] = self.eval("pyb.usb_mode()").decode()
+        self.ac_decoder.reset()
         if (
             self.data_logger
         ):  # This is required since the system handler requires both the pycboard and the acboard to init
@@ -76,17 +85,22 @@ class Access_control(Pycboard):
             raise IndexError(
                 f"No entry found in setups_df for COM_AC = {self.serial_port}. Available access controls: {available_controls}"
             )
+        self.setup_ID = name_
         now = datetime.now().strftime("-%Y-%m-%d-%H%M%S")
         self.logger_dir = user_folder("AC_logger_dir")
         self.logger_path = os.path.join(self.logger_dir, name_ + "_" + now + ".txt")
 
-        database.setup_df.loc[database.setup_df["COM_AC"] == self.serial_port, "logger_path"] = self.logger_path
-        database.setup_df.to_csv(user_folder("setup_dir_dataframe_filepath"))
+        database.update("setups", "COM_AC", self.serial_port, {"logger_path": self.logger_path})
 
         with open(self.logger_path, "w") as f:
             f.write("Start" + "\n")
             f.write(now + "\n")
 
+        # The state of the access control is also published to the database for the security daemon.
+        status = {"Setup_ID": name_, "Logger_start": now[1:], "Last_message_time": now[1:]}
+        database.writer.replace_rows("setup_status", "Setup_ID", name_, [status])
+        self.status_publish_time = time.monotonic()
+
     # ------------------------------------------------------------------------------------
     # Access Control operations.
     # ------------------------------------------------------------------------------------
@@ -128,44 +142,61 @@ class Access_control(Pycboard):
         """Here process data from buffer to update dataframes
         This is not where the data updates anything about the states of the
         """
-        # Just send each message as being 16 characters long. That way
-        # can just check padding. Should be fine
-
-        if self.serial.inWaiting() > 0:
-            read = str(self.serial.read(self.serial.inWaiting()))
-
-            messages = re.findall("start_(.*?)_end", read)
-            print(f"messages:{messages}")
+        self.dispatch_messages(self.read_messages())
+
+    def read_messages(self) -> list:
+        """Read available data from the serial line and return the list of complete messages.
+        Safe to call from a background reader thread."""
+        if self.serial.in_waiting > 0:
+            self.ac_decoder.feed(self.serial.read(self.serial.in_waiting))
+            return self.ac_decoder.decode()
+        return []
+
+    def dispatch_messages(self, messages: list) -> None:
+        """Log messages to the logger file and pass them on to the GUI and system controller."""
+        if not messages:
+            return
+        print(f"messages:{messages}")
+        status = {}
+        with open(self.logger_path, "a") as f:
             for msg in messages:
                 print(f"msg:{msg}")
-                with open(self.logger_path, "a") as f:
-                    f.write(msg + "_" + datetime.now().strftime("-%Y-%m-%d-%H%M%S") + "\n")
-
-            for msg in messages:
-                # This is a horrible information flow. The point is simply to print
-                # into the calibrate dialog
-                if "cal" in msg:
-                    """
-                    datbase.print_consumers is a list of callable functions. They are specifically being used to print to
-                    different parts of the GUI depending on what the recipient of the message should be.
-                    The reason for the if statement below is that these print functions are only used if they are defined during the initalisation.
-                    If they are not then the `emit_print_message` function can not work.
-                    """
-                    if MessageRecipient.calibrate_dialog in database.print_consumers:
-                        emit_print_message(
-                            print_text=msg,
-                            target=MessageRecipient.calibrate_dialog,
-                            data_source=MessageSource.ACBoard,
-                        )
-                    if MessageRecipient.configure_box_dialog in database.print_consumers:
-                        emit_print_message(
-                            print_text=msg,
-                            target=MessageRecipient.configure_box_dialog,
-                            data_source=MessageSource.ACBoard,
-                        )
-
-                # The message is passed to another function to be 'processed'
-                self.data_logger.process_data_AC(messages)
+                now = datetime.now().strftime("%Y-%m-%d-%H%M%S")
+                f.write(msg + "_-" + now + "\n")
+                status.update({"Last_message": msg, "Last_message_time": now})
+                if "state:" in msg:
+                    status["State"] = msg.split("state:", 1)[1]
+        state_changed = status.get("State", self.published_state) != self.published_state
+        if state_changed or time.monotonic() - self.status_publish_time > STATUS_INTERVAL:
+            database.writer.update_rows("setup_status", "Setup_ID", self.setup_ID, status)
+            self.published_state = status.get("State", self.published_state)
+            self.status_publish_time = time.monotonic()
+
+        for msg in messages:
+            # This is a horrible information flow. The point is simply to print
+            # into the calibrate dialog
+            if "cal" in msg:
+                """
+                datbase.print_consumers is a list of callable functions. They are specifically being used to print to
+                different parts of the GUI depending on what the recipient of the message should be.
+                The reason for the if statement below is that these print functions are only used if they are defined during the initalisation.
+                If they are not then the `emit_print_message` function can not work.
+                """
+                if MessageRecipient.calibrate_dialog in database.print_consumers:
+                    emit_print_message(
+                        print_text=msg,
+                        target=MessageRecipient.calibrate_dialog,
+                        data_source=MessageSource.ACBoard,
+                    )
+                if MessageRecipient.configure_box_dialog in database.print_consumers:
+                    emit_print_message(
+                        print_text=msg,
+                        target=MessageRecipient.configure_box_dialog,
+                        data_source=MessageSource.ACBoard,
+                    )
+
+        # The messages are passed to another function to be 'processed'
+        self.data_logger.process_data_AC(messages)
 
     # ------------------------------------------------------------------------------------
     # Getting and setting access control hardware information.
@@ -0,0 +1,282 @@
+"""
+asyncio pyboard interface
+This module provides the AsyncPyboard class, a coroutine based counterpart of Pyboard and
+Pycboard that lets many boards be controlled concurrently from a single event loop.  The
+serial port is opened non-blocking and polled, so waiting on one board never blocks the others.
+Example usage:
+    async def connect(port):
+        board = AsyncPyboard(port)
+        await board.reset()
+        await board.transfer_file("tasks/poke4water.py", "task_file.py")
+        return board
+
+    boards = await asyncio.gather(*[connect(port) for port in serial_ports])
+"""
+
+import os
+import time
+import asyncio
+import inspect
+import serial
+from .pyboard import PyboardError
+from .pycboard import _djb2_file, _receive_file, _folder_manifest, TRANSFER_CHUNK_SIZE, TRANSFER_WINDOW
+from .frame_decoder import Frame_decoder
+from .message import MsgType, Datatuple
+
+# ----------------------------------------------------------------------------------------
+#  AsyncPyboard class.
+# ----------------------------------------------------------------------------------------
+
+
+class AsyncPyboard:
+    """Pyboard interface with coroutine versions of the raw REPL operations, file transfer
+    and an asynchronous stream of pyControl framework data."""
+
+    def __init__(self, serial_device, baudrate=115200, poll_interval=0.005):
+        self.serial = serial.Serial(serial_device, baudrate=baudrate, timeout=0)
+        self.poll_interval = poll_interval  # Seconds between polls of the serial port when no data available.
+        self.rx_buffer = bytearray()  # Bytes read from the serial port but not yet consumed.
+        self.frame_decoder = Frame_decoder(board=self)
+        self.framework_running = False
+        self.sm_info = None  # State_machine_info of the task on the board, must be set before streaming data.
+        self.timestamp = 0
+        self.last_message_time = 0
+
+    def close(self):
+        self.serial.close()
+
+    # ------------------------------------------------------------------------------------
+    # Serial reading.
+    # ------------------------------------------------------------------------------------
+
+    def _read_available(self):
+        """Move all bytes waiting on the serial port into rx_buffer, return number of bytes added."""
+        bytes_waiting = self.serial.in_waiting
+        if bytes_waiting:
+            self.rx_buffer += self.serial.read(bytes_waiting)
+        return bytes_waiting
+
+    async def read(self, num_bytes, timeout=10):
+        """Read num_bytes from the board, returning fewer if timeout elapses first."""
+        deadline = time.monotonic() + timeout
+        while len(self.rx_buffer) < num_bytes:
+            if not self._read_available():
+                if time.monotonic() > deadline:
+                    break
+                await asyncio.sleep(self.poll_interval)
+        data = bytes(self.rx_buffer[:num_bytes])
+        del self.rx_buffer[:num_bytes]
+        return data
+
+    async def read_until(self, min_num_bytes, ending, timeout=10, data_consumer=None):
+        """Read until data ends with ending, any bytes received after ending are kept for
+        the next read.  Returns the data read so far if no new data arrives for timeout seconds."""
+        data = await self.read(min_num_bytes, timeout)
+        if data_consumer:
+            data_consumer(data)
+        last_data_time = time.monotonic()
+        while not data.endswith(ending):
+            if self.rx_buffer or self._read_available():
+                search_start = max(0, len(data) - len(ending) + 1)
+                combined = data + self.rx_buffer
+                end_index = combined.find(ending, search_start)
+                new_len = (end_index + len(ending) if end_index >= 0 else len(combined)) - len(data)
+                new_data = bytes(self.rx_buffer[:new_len])
+                del self.rx_buffer[:new_len]
+                data += new_data
+                if data_consumer:
+                    data_consumer(new_data)
+                last_data_time = time.monotonic()
+            else:
+                if timeout is not None and time.monotonic() - last_data_time >= timeout:
+                    break
+                await asyncio.sleep(self.poll_interval)
+        return data
+
+    # ------------------------------------------------------------------------------------
+    # Raw REPL operations.
+    # ------------------------------------------------------------------------------------
+
+    async def enter_raw_repl(self):
+        self.serial.write(b"\r\x03\x03")  # ctrl-C twice: interrupt any running program
+        await asyncio.sleep(self.poll_interval)
+        self._read_available()  # flush input
+        self.rx_buffer.clear()
+        self.serial.write(b"\r\x01")  # ctrl-A: enter raw REPL
+        data = await self.read_until(1, b"to exit\r\n>")
+        if not data.endswith(b"raw REPL; CTRL-B to exit\r\n>"):
+            raise PyboardError("could not enter raw repl")
+        self.serial.write(b"\x04")  # ctrl-D: soft reset
+        data = await self.read_until(1, b"to exit\r\n>")
+        if not data.endswith(b"raw REPL; CTRL-B to exit\r\n>"):
+            raise PyboardError("could not enter raw repl")
+
+    def exit_raw_repl(self):
+        self.serial.write(b"\r\x02")  # ctrl-B: enter friendly REPL
+
+    async def follow(self, timeout, data_consumer=None):
+        # wait for normal output
+        data = await self.read_until(1, b"\x04", timeout=timeout, data_consumer=data_consumer)
+        if not data.endswith(b"\x04"):
+            raise PyboardError("timeout waiting for first EOF reception")
+        data = data[:-1]
+
+        # wait for error output
+        data_err = await self.read_until(2, b"\x04>", timeout=timeout)
+        if not data_err.endswith(b"\x04>"):
+            raise PyboardError("timeout waiting for second EOF reception")
+        data_err = data_err[:-2]
+
+        # return normal and error output
+        return data, data_err
+
+    async def exec_raw_no_follow(self, command):
+        if isinstance(command, bytes):
+            command_bytes = command
+        else:
+            command_bytes = bytes(command, encoding="utf8")
+
+        # write command
+        for i in range(0, len(command_bytes), 256):
+            self.serial.write(command_bytes[i : min(i + 256, len(command_bytes))])
+            await asyncio.sleep(0.01)
+        self.serial.write(b"\x04")
+
+        # check if we could exec command
+        data = await self.read(2)
+        if data != b"OK":
+            raise PyboardError("could not exec command")
+
+    async def exec_raw(self, command, timeout=10, data_consumer=None):
+        await self.exec_raw_no_follow(command)
+        return await self.follow(timeout, data_consumer)
+
+    async def eval(self, expression):
+        ret = await self.exec("print({})".format(expression))
+        return ret.strip()
+
+    async def exec(self, command):
+        ret, ret_err = await self.exec_raw(command)
+        if ret_err:
+            raise PyboardError("exception", ret, ret_err)
+        return ret
+
+    async def reset(self):
+        """Enter raw repl (soft reboots pyboard), define file transfer functions and import modules."""
+        await self.enter_raw_repl()
+        await self.exec(inspect.getsource(_djb2_file))  # define djb2 hashing function.
+        await self.exec(inspect.getsource(_receive_file))  # define receive file function.
+        await self.exec(inspect.getsource(_folder_manifest))  # define folder manifest function.
+        await self.exec("import os; import gc; import sys; import pyb")
+        self.framework_running = False
+
+    # ------------------------------------------------------------------------------------
+    # File transfer.
+    # ------------------------------------------------------------------------------------
+
+    async def get_file_hash(self, target_path):
+        """Get the djb2 hash of a file on the pyboard."""
+        try:
+            return int((await self.eval("_djb2_file('{}')".format(target_path))).decode())
+        except PyboardError:  # File does not exist.
+            return -1
+
+    async def get_folder_manifest(self, folder_path):
+        """Get a dict {relative_path: (file_size, file_hash)} of all files in folder tree on the
+        pyboard in a single REPL call, returns None if the folder does not exist."""
+        return eval((await self.eval("_folder_manifest({})".format(repr(folder_path)))).decode())
+
+    async def transfer_file(self, file_path, target_path=None, chunk_size=TRANSFER_CHUNK_SIZE, window=TRANSFER_WINDOW):
+        """Copy file at file_path to location target_path on pyboard using the same windowed
+        protocol as Pycboard.transfer_file."""
+        if not target_path:
+            target_path = os.path.split(file_path)[-1]
+        file_size = os.path.getsize(file_path)
+        file_hash = _djb2_file(file_path)
+        if file_hash == await self.get_file_hash(target_path):
+            return  # File already on board.
+        ack_interval = max(1, window // 2)
+        ack_bytes = chunk_size * ack_interval
+        max_unacked = chunk_size * window
+        # Try to load file, return once hash of received file matches that on computer.
+        for i in range(10):
+            await self.exec_raw_no_follow(
+                "_receive_file('{}',{},{},{})".format(target_path, file_size, chunk_size, ack_interval)
+            )
+            bytes_sent = 0
+            bytes_acked = 0
+            response_bytes = b"OK"
+            with open(file_path, "rb") as f:
+                while bytes_acked < file_size:
+                    if bytes_sent < file_size and bytes_sent - bytes_acked < max_unacked:
+                        chunk = f.read(chunk_size)
+                        self.serial.write(chunk)
+                        bytes_sent += len(chunk)
+                        continue
+                    response_bytes = await self.read(2, timeout=5)
+                    if response_bytes != b"OK":
+                        break  # Board stopped receiving the file.
+                    bytes_acked = min(bytes_acked + ack_bytes, file_size)
+            try:
+                data, data_err = await self.follow(3)
+            except PyboardError:
+                data, data_err = b"", b"timeout"
+            if response_bytes == b"NS":
+                raise PyboardError("Insufficient space on pyboard filesystem to transfer file.")
+            try:
+                if not data_err and int(data.strip()) == file_hash:
+                    return
+            except ValueError:
+                pass  # Board did not output a file hash.
+            # Clear any file data sent after the board stopped receiving from the REPL input, then try again.
+            self.serial.write(b"\x03")
+            await asyncio.sleep(0.01)
+            self.serial.reset_input_buffer()
+            self.rx_buffer.clear()
+        raise PyboardError("Unable to transfer file.")
+
+    # ------------------------------------------------------------------------------------
+    # pyControl framework data.
+    # ------------------------------------------------------------------------------------
+
+    def get_timestamp(self):
+        """Get the current pyControl timestamp in ms since start of framework run."""
+        seconds_elapsed = time.time() - self.last_message_time
+        return self.timestamp + round(1000 * (seconds_elapsed))
+
+    async def start_framework(self, data_output=True):
+        """Start pyControl framwork running on pyboard."""
+        await self.exec("gc.collect()")
+        await self.exec("fw.data_output = " + repr(data_output))
+        self.serial.reset_input_buffer()
+        self.rx_buffer.clear()
+        self.frame_decoder.reset()
+        self.last_message_time = 0
+        await self.exec_raw_no_follow("fw.run()")
+        self.framework_running = True
+
+    def stop_framework(self):
+        """Stop framework running on pyboard by sending stop command."""
+        self.serial.write(b"\x03")  # Stop signal
+
+    async def data_stream(self):
+        """Asynchronous generator yielding lists of Datatuples output by the framework until
+        the run ends.  If an error occurs during the run it is yielded as an ERROR Datatuple."""
+        while self.framework_running:
+            if self.rx_buffer or self._read_available():
+                self.frame_decoder.feed(self.rx_buffer)
+                self.rx_buffer.clear()
+                new_data = self.frame_decoder.decode()
+                if self.frame_decoder.run_ended:  # End of framework run.
+                    self.framework_running = False
+                    self.frame_decoder.run_ended = False
+                    self.rx_buffer += self.frame_decoder.take_remaining()
+                    data_err = await self.read_until(2, b"\x04>", timeout=10)
+                    if len(data_err) > 2:  # Error during framework run.
+                        new_data.append(
+                            Datatuple(time=self.get_timestamp(), type=MsgType.ERROR, content=data_err[:-3].decode())
+                        )
+                if new_data:
+                    yield new_data
+            else:
+                await asyncio.sleep(self.poll_interval)
@@ -1,9 +1,15 @@
 import os
 import json
+import time
+import struct
+import atexit
+import threading
+import traceback
 import numpy as np
 from datetime import datetime
-from shutil import copyfile
+from shutil import copyfile, copyfileobj
 from .message import MsgType, Datatuple
+from source.utils.session_file import MAGIC, TRAILER, RECORD_DTYPE, RECORD_TYPES, SUBTYPES, encode_header, build_indices
 
 # ----------------------------------------------------------------------------------------
 #  Data_logger
@@ -24,6 +30,10 @@ def ms_to_readable_time(milliseconds):
 class Data_logger:
     """Class for logging data from a pyControl setup to disk"""
 
+    _row_ends_sm_info = None  # State machine the cached row ends were formatted for.
+    session_file = None  # Session_file_writer if sessions are also saved as binary session files.
+    save_session_file = False  # Set from the data_logging binary_session_file setting by the owner of the logger.
+
     def __init__(self, board, print_func=None):
         self.board = board
         self.print_func = print_func
@@ -48,7 +58,7 @@ class Data_logger:
         self.end_timestamp = None
         file_name = self.subject_ID + datetime_now.strftime("-%Y-%m-%d-%H%M%S") + ".tsv"
         self.file_path = os.path.join(self.data_dir, file_name)
-        self.data_file = open(self.file_path, "w", encoding="utf-8", newline="\n")
+        self.data_file = Buffered_writer(self.file_path)
         self.data_file.write(
             self.tsv_row_str(
                 time="time", rtype="type", subtype="subtype", content="content"
@@ -61,7 +71,27 @@ class Data_logger:
         self.write_info_line("framework_version", self.board.sm_info.framework_version)
         self.write_info_line("micropython_version", self.board.sm_info.micropython_version)
         self.write_info_line("subject_id", self.subject_ID)
-        self.write_info_line("start_time", datetime.utcnow().isoformat(timespec="milliseconds"))
+        start_time = datetime.utcnow().isoformat(timespec="milliseconds")
+        self.write_info_line("start_time", start_time)
+        if self.save_session_file:
+            self.session_file = Session_file_writer(
+                os.path.splitext(self.file_path)[0] + ".session",
+                {
+                    "experiment_name": self.experiment_name,
+                    "task_name": self.board.sm_info.name,
+                    "task_file_hash": self.board.sm_info.task_hash,
+                    "setup_id": self.setup_ID,
+                    "framework_version": self.board.sm_info.framework_version,
+                    "micropython_version": self.board.sm_info.micropython_version,
+                    "subject_id": self.subject_ID,
+                    "start_time": start_time,
+                    "states": self.board.sm_info.states,
+                    "events": self.board.sm_info.events,
+                    "analog_inputs": self.board.sm_info.analog_inputs,
+                    "record_types": RECORD_TYPES,
+                    "subtypes": SUBTYPES,
+                },
+            )
         self.write_to_file(self.pre_run_prints)
         self.pre_run_prints = []
         self.analog_writers = {
@@ -89,70 +119,122 @@ class Data_logger:
 
     def close_files(self):
         if self.data_file:
-            self.write_info_line("end_time", self.end_datetime.isoformat(timespec="milliseconds"), self.end_timestamp)
-            self.data_file.close()
-            self.data_file = None
+            try:
+                self.write_info_line(
+                    "end_time", self.end_datetime.isoformat(timespec="milliseconds"), self.end_timestamp
+                )
+            finally:  # Commit the data written so far even if the session ended with an error.
+                self.data_file.close()
+                self.data_file = None
+        self.close_session_file()
         for analog_writer in self.analog_writers.values():
             analog_writer.close_files()
         self.analog_writers = {}
 
+    def close_session_file(self):
+        if self.session_file:
+            end_datetime = getattr(self, "end_datetime", None)
+            footer = {
+                "end_time": end_datetime.isoformat(timespec="milliseconds") if end_datetime else None,
+                "end_timestamp": self.end_timestamp,
+            }
+            try:
+                self.session_file.close(footer)
+            finally:
+                self.session_file = None
+
     def process_data(self, new_data):
         """If data_file is open new data is written to file.  If print_func is specified
         human readable data strings are passed to it."""
+        data_string, pretty_string = self.format_data(new_data, tsv=bool(self.data_file), pretty=bool(self.print_func))
         if self.data_file:
-            self.write_to_file(new_data)
+            self.write_to_file(new_data, data_string)
         if self.print_func:
-            self.print_func(self.data_to_string(new_data, prettify=True), end="")
+            self.print_func(pretty_string, end="")
 
-    def write_to_file(self, new_data):
-        data_string = self.data_to_string(new_data)
+    def write_to_file(self, new_data, data_string=None):
+        if data_string is None:
+            data_string = self.data_to_string(new_data)
         if data_string:
             self.data_file.write(data_string)
-            self.data_file.flush()
+        if self.session_file:
+            self.session_file.write(new_data)
         for nd in new_data:
             if nd.type == MsgType.ANLOG:
                 writer_id, data = nd.content
                 self.analog_writers[writer_id].save_analog_chunk(timestamp=nd.time, data_array=data)
+            elif nd.type in (MsgType.ERROR, MsgType.STOPF):  # Commit the data up to the error or stop now.
+                self.data_file.flush()
+                if self.session_file:
+                    self.session_file.flush()
 
     def data_to_string(self, new_data, prettify=False, max_len=60):
         """Convert list of data tuples into a string.  If prettify is True the string is formatted
         for the GUI data log, if False for the tsv data file."""
-        data_string = ""
+        data_string, pretty_string = self.format_data(new_data, tsv=not prettify, pretty=prettify, max_len=max_len)
+        return pretty_string if prettify else data_string
+
+    def _row_ends(self):
+        """Return dict {(type, subtype, ID): row end} of the part after the time of the state and
+        event rows of the current state machine, filled in as rows are first formatted."""
+        if self._row_ends_sm_info is not self.board.sm_info:
+            self._row_ends_sm_info = self.board.sm_info
+            self._row_ends_cache = {}
+        return self._row_ends_cache
+
+    def format_data(self, new_data, tsv=True, pretty=False, max_len=60):
+        """Convert list of data tuples into (tsv_string, pretty_string) in a single pass, where
+        tsv_string is formatted for the tsv data file and pretty_string for the GUI data log.
+        The parts of rows that are the same in both formats are only formatted once, strings
+        not requested are None."""
+        tsv_rows, pretty_rows = [], []
+        row_ends = self._row_ends()
         for nd in new_data:
-            time = ms_to_readable_time(nd.time) if prettify else nd.time
-            if nd.type == MsgType.STATE:  # State entry.
-                data_string += self.tsv_row_str("state", time, content=self.board.sm_info.ID2name[nd.content])
-            elif nd.type == MsgType.EVENT:  # Event.
-                data_string += self.tsv_row_str("event", time, nd.subtype, self.board.sm_info.ID2name[nd.content])
+            if nd.type in (MsgType.STATE, MsgType.EVENT):
+                key = (nd.type, nd.subtype, nd.content)
+                row_end = row_ends.get(key)
+                if row_end is None:
+                    name = self.board.sm_info.ID2name[nd.content]
+                    if nd.type == MsgType.STATE:
+                        row_end = f"\tstate\t\t{name}\n"
+                    else:
+                        row_end = f"\tevent\t{nd.subtype}\t{name}\n"
+                    row_ends[key] = row_end
+                tsv_row_end = pretty_row_end = row_end
             elif nd.type == MsgType.PRINT:  # User print output.
-                if prettify:
-                    print_str = nd.content.replace("\n", "\n\t\t\t")
-                else:
-                    print_str = nd.content.replace("\n", "|").replace("\r", "|")
-                data_string += self.tsv_row_str("print", time, nd.subtype, content=print_str)
+                tsv_row_end = pretty_row_end = f"\tprint\t{nd.subtype}\t"
+                if tsv:
+                    tsv_row_end += nd.content.replace("\n", "|").replace("\r", "|") + "\n"
+                if pretty:
+                    pretty_row_end += nd.content.replace("\n", "\n\t\t\t") + "\n"
             elif nd.type == MsgType.VARBL:  # Variable.
-                var_str = nd.content
-                if prettify:
+                tsv_row_end = pretty_row_end = f"\tvariable\t{nd.subtype}\t{nd.content}\n"
+                if pretty:
                     variables_dict = json.loads(nd.content)
                     if len(repr(variables_dict)) > max_len:  # Wrap variables across multiple lines.
-                        var_str = "{\n"
+                        var_lines = [f"\tvariable\t{nd.subtype}\t{{\n"]
                         for var_name, var_value in sorted(variables_dict.items(), key=lambda x: x[0].lower()):
-                            var_str += f'\t\t\t"{var_name}": {var_value}\n'
-                        var_str += "\t\t\t}"
-                data_string += self.tsv_row_str("variable", time, nd.subtype, content=var_str)
+                            var_lines.append(f'\t\t\t"{var_name}": {var_value}\n')
+                        var_lines.append("\t\t\t}\n")
+                        pretty_row_end = "".join(var_lines)
             elif nd.type == MsgType.WARNG:  # Warning
-                data_string += self.tsv_row_str("warning", time, content=nd.content)
+                tsv_row_end = pretty_row_end = f"\twarning\t\t{nd.content}\n"
             elif nd.type in (MsgType.ERROR, MsgType.STOPF):  # Error or stop framework.
                 self.end_datetime = datetime.utcnow()
                 self.end_timestamp = nd.time
-                if nd.type == MsgType.ERROR:
-                    content = nd.content
-                    if prettify:
-                        content = f"\n\n{content}"
-                    else:
-                        content = content.replace("\n", "|").replace("\r", "|")
-                    data_string += self.tsv_row_str("error", time, content=content)
-        return data_string
+                if nd.type != MsgType.ERROR:
+                    continue
+                tsv_row_end = "\terror\t\t" + nd.content.replace("\n", "|").replace("\r", "|") + "\n"
+                pretty_row_end = f"\terror\t\t\n\n{nd.content}\n"
+            else:
+                continue
+            if tsv:
+                tsv_rows.append(f"{nd.time/1000:.3f}")
+                tsv_rows.append(tsv_row_end)
+            if pretty:
+                pretty_rows.append(ms_to_readable_time(nd.time))
+                pretty_rows.append(pretty_row_end)
+        return ("".join(tsv_rows) if tsv else None), ("".join(pretty_rows) if pretty else None)
 
     def print_message(self, msg, source="u"):
         """Print a message to the log and data file. If called pre-run message is logged when
@@ -184,8 +266,15 @@ class Data_logger:
 # ----------------------------------------------------------------------------------------
 
 
+# Segments of an analog recording sampled at a constant rate, written when the recording starts
+# and at each discontinuity. Sample times are start time + (sample - first sample) / sampling rate.
+TIME_SEGMENT_DTYPE = np.dtype([("sample", "<i8"), ("time", "<f8"), ("sampling_rate", "<f8")])
+
+
 class Analog_writer:
-    """Class for writing data from one analog input to disk."""
+    """Class for writing data from one analog input to disk.  Samples are saved to
+    <session>_<name>.data.npy and the segments of samples recorded at a constant rate to
+    <session>_<name>.time_segments.npy, see source/utils/analog_data.py for reading them."""
 
     def __init__(self, name, sampling_rate, data_type, session_filepath):
         self.name = name
@@ -196,34 +285,312 @@ class Analog_writer:
     def open_data_files(self, session_filepath):
         ses_path_stem, file_ext = os.path.splitext(session_filepath)
         self.path_stem = ses_path_stem + f"_{self.name}"
-        self.t_tempfile_path = self.path_stem + ".time.temp"
-        self.d_tempfile_path = self.path_stem + f".data-1{self.data_type}.temp"
-        self.time_tempfile = open(self.t_tempfile_path, "wb")
-        self.data_tempfile = open(self.d_tempfile_path, "wb")
+        self.segments_file = Npy_writer(self.path_stem + ".time_segments.npy", TIME_SEGMENT_DTYPE)
+        self.data_file = Npy_writer(self.path_stem + ".data.npy", self.data_type)
         self.next_chunk_start_time = 0
 
     def close_files(self):
-        """Close data files. Convert temp files to numpy."""
-        self.time_tempfile.close()
-        self.data_tempfile.close()
-        with open(self.t_tempfile_path, "rb") as f:
-            times = np.frombuffer(f.read(), dtype="float64")
-            np.save(self.path_stem + ".time.npy", times)
-        with open(self.d_tempfile_path, "rb") as f:
-            data = np.frombuffer(f.read(), dtype=self.data_type)
-            np.save(self.path_stem + ".data.npy", data)
-        os.remove(self.t_tempfile_path)
-        os.remove(self.d_tempfile_path)
+        """Close data files, writing the number of samples to their headers."""
+        try:
+            self.segments_file.close()
+        finally:
+            self.data_file.close()
 
     def save_analog_chunk(self, timestamp, data_array):
-        """Save a chunk of analog data to .pca data file."""
-        if np.abs(self.next_chunk_start_time - timestamp / 1000) < 0.001:
-            chunk_start_time = self.next_chunk_start_time
-        else:
-            chunk_start_time = timestamp / 1000
-        times = (np.arange(len(data_array), dtype="float64") / self.sampling_rate) + chunk_start_time  # Seconds
-        self.time_tempfile.write(times.tobytes())
-        self.data_tempfile.write(data_array.tobytes())
-        self.time_tempfile.flush()
-        self.data_tempfile.flush()
+        """Save a chunk of analog data, starting a new time segment if it does not follow on from
+        the previous chunk."""
+        continuous = np.abs(self.next_chunk_start_time - timestamp / 1000) < 0.001
+        chunk_start_time = self.next_chunk_start_time if continuous else timestamp / 1000
+        if not (continuous and self.data_file.n_samples):  # Start of recording or discontinuity.
+            segment = np.array([(self.data_file.n_samples, chunk_start_time, self.sampling_rate)], TIME_SEGMENT_DTYPE)
+            self.segments_file.write(segment)
+        self.data_file.write(data_array)
         self.next_chunk_start_time = chunk_start_time + len(data_array) / self.sampling_rate
+
+
+# ----------------------------------------------------------------------------------------
+#  Session_file_writer
+# ----------------------------------------------------------------------------------------
+
+SESSION_RECORD_TYPES = {
+    MsgType.STATE: RECORD_TYPES.index("state"),
+    MsgType.EVENT: RECORD_TYPES.index("event"),
+    MsgType.PRINT: RECORD_TYPES.index("print"),
+    MsgType.VARBL: RECORD_TYPES.index("variable"),
+    MsgType.WARNG: RECORD_TYPES.index("warning"),
+    MsgType.ERROR: RECORD_TYPES.index("error"),
+    MsgType.STOPF: RECORD_TYPES.index("stop"),
+}
+SUBTYPE_CODES = {subtype: i for i, subtype in enumerate(SUBTYPES)}
+
+
+class Session_file_writer:
+    """Writes the records of a session to a binary session file, see source/utils/session_file.py
+    for the format and reader.  Records are written to the file and the contents of print,
+    variable, warning and error records to a .heap file as they are received, the heap and the
+    indices are added to the file when it is closed."""
+
+    def __init__(self, file_path, header):
+        self.file_path = file_path
+        self.heap_path = file_path + ".heap"
+        header_bytes = encode_header(header)
+        self.records_offset = len(header_bytes)
+        self.n_records = 0
+        self.heap_size = 0
+        self.file = Buffered_writer(file_path)
+        self.heap_file = Buffered_writer(self.heap_path)
+        self.file.write(header_bytes)
+
+    def write(self, new_data):
+        """Write the records for new_data, a list of Datatuples."""
+        records = []
+        for nd in new_data:
+            record_type = SESSION_RECORD_TYPES.get(nd.type)
+            if record_type is None:
+                continue  # Analog data is saved by the Analog_writers.
+            ID, offset, length = 0, 0, 0
+            if nd.type in (MsgType.STATE, MsgType.EVENT):
+                ID = nd.content
+            elif nd.type != MsgType.STOPF:
+                content = nd.content.encode("utf-8")
+                offset, length = self.heap_size, len(content)
+                self.heap_file.write(content)
+                self.heap_size += length
+            records.append((nd.time, record_type, SUBTYPE_CODES.get(nd.subtype, 0), ID, offset, length))
+        if records:
+            self.file.write(np.array(records, RECORD_DTYPE).tobytes())
+            self.n_records += len(records)
+
+    def flush(self):
+        self.heap_file.flush()
+        self.file.flush()
+
+    def close(self, footer):
+        """Append the heap, indices, footer and trailer to the file and close it.  If this fails
+        the file is left as it was while the session was running."""
+        heap_offset = self.records_offset + self.n_records * RECORD_DTYPE.itemsize
+        try:
+            self.heap_file.close()
+            self.file.flush()
+            records = np.fromfile(self.file_path, RECORD_DTYPE, self.n_records, offset=self.records_offset)
+            type_index, time_index = build_indices(records)
+            with open(self.heap_path, "rb") as heap_file:
+                copyfileobj(heap_file, self.file)
+            type_index_offset = heap_offset + self.heap_size
+            time_index_offset = type_index_offset + len(type_index)
+            footer_offset = time_index_offset + len(time_index)
+            footer_json = json.dumps(footer, default=str).encode()
+            offsets = (heap_offset, type_index_offset, time_index_offset, footer_offset)
+            trailer = TRAILER.pack(self.n_records, *offsets, len(footer_json), MAGIC)
+            self.file.write(type_index + time_index + footer_json + trailer)
+            self.file.close()
+        except Exception:
+            self.file.close()
+            os.truncate(self.file_path, heap_offset)
+            raise
+        os.remove(self.heap_path)
+
+
+# ----------------------------------------------------------------------------------------
+#  Buffered_writer
+# ----------------------------------------------------------------------------------------
+
+FSYNC_POLICIES = ("never", "close", "commit")
+
+
+class Buffered_writer:
+    """File writer that buffers data in memory and commits it to the file in large writes.
+
+    Buffered data is committed once it exceeds max_bytes, or by a background thread shared by
+    all open writers once it has been buffered for max_delay seconds, so a busy setup makes a
+    few large writes per second rather than one per message and at most max_delay seconds of
+    data are lost if the program stops.  flush() commits buffered data immediately and close()
+    commits it before closing the file, open writers are closed when the program exits.  fsync
+    sets when committed data is forced to disk: after every commit ('commit'), when the file is
+    closed ('close') or only when the OS does it ('never').  Strings are written utf-8 encoded.
+    """
+
+    def __init__(self, file_path, mode="w", max_bytes=65536, max_delay=0.2, fsync="close"):
+        assert fsync in FSYNC_POLICIES, "fsync must be one of {}".format(FSYNC_POLICIES)
+        self.file_path = file_path
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.fsync = fsync
+        self.file = open(file_path, mode.replace("b", "") + "b", buffering=0)  # Buffered here instead.
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.n_bytes = 0
+        self.first_write_time = None  # Time the oldest buffered data was written.
+        self.closed = False
+        _flusher.add(self)
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        with self.lock:
+            if self.closed:
+                raise ValueError("write to closed file " + self.file_path)
+            if not self.buffer:
+                self.first_write_time = time.monotonic()
+            self.buffer.append(data)
+            self.n_bytes += len(data)
+            if self.n_bytes >= self.max_bytes:
+                self._commit()
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def write_at(self, offset, data):
+        """Commit the buffered data and overwrite the file at offset with data."""
+        with self.lock:
+            if self.closed:
+                raise ValueError("write to closed file " + self.file_path)
+            self._commit()
+            self.file.seek(offset)
+            data = memoryview(data)
+            while data:
+                data = data[self.file.write(data) :]
+            self.file.seek(0, os.SEEK_END)
+
+    def _commit(self):
+        """Write the buffered data to the file, called with the lock held.  If the write fails the
+        data not yet written to the file is kept in the buffer."""
+        if not self.buffer:
+            return
+        data = memoryview(b"".join(self.buffer))
+        try:
+            while data:
+                data = data[self.file.write(data) :]  # The file is unbuffered so may write part of the data.
+        finally:
+            if data:
+                self.buffer, self.n_bytes = [bytes(data)], len(data)
+            else:
+                self.buffer, self.n_bytes, self.first_write_time = [], 0, None
+        if self.fsync == "commit":
+            os.fsync(self.file.fileno())
+
+    def due(self, now):
+        """Return True if data has been buffered for more than max_delay seconds at time now."""
+        first_write_time = self.first_write_time
+        return first_write_time is not None and now - first_write_time >= self.max_delay
+
+    def flush(self):
+        """Commit the buffered data to the file."""
+        with self.lock:
+            if not self.closed:
+                self._commit()
+
+    def close(self):
+        """Commit the buffered data and close the file."""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            try:
+                self._commit()
+                if self.fsync != "never":
+                    os.fsync(self.file.fileno())
+            finally:
+                self.file.close()
+                _flusher.remove(self)
+
+
+class Npy_writer:
+    """Writes a 1D array to a .npy file as it is recorded, so closing the file takes the same
+    time however long the recording.  The header is written with a length of 0 and rewritten
+    with the number of samples written on close, padded to the size of the header of the largest
+    possible array so the samples do not move.  If the program stops before the file is closed
+    the samples are recovered from the file size by source/utils/analog_data.load_npy."""
+
+    def __init__(self, file_path, dtype, **kwargs):
+        self.dtype = np.dtype(dtype)
+        self.n_samples = 0
+        # Header length (excluding the 10 byte preamble) making the header a multiple of 64 bytes.
+        self.header_len = -(-(len(self._header_dict(2**63)) + 11) // 64) * 64 - 10
+        self.writer = Buffered_writer(file_path, **kwargs)
+        self.writer.write(self._header())
+
+    def _header_dict(self, n_samples):
+        return "{{'descr': {!r}, 'fortran_order': False, 'shape': ({},), }}".format(
+            np.lib.format.dtype_to_descr(self.dtype), n_samples
+        )
+
+    def _header(self):
+        """Return the .npy version 1.0 header for the samples written."""
+        header = self._header_dict(self.n_samples).ljust(self.header_len - 1) + "\n"
+        preamble = np.lib.format.MAGIC_PREFIX + bytes([1, 0]) + struct.pack("<H", self.header_len)
+        return preamble + header.encode("latin1")
+
+    def write(self, samples):
+        """Append samples, an array whose raw data is samples of the file's dtype."""
+        data = samples.tobytes()
+        self.writer.write(data)
+        self.n_samples += len(data) // self.dtype.itemsize
+
+    def close(self):
+        try:
+            self.writer.write_at(0, self._header())
+        finally:
+            self.writer.close()
+
+
+class _Flusher:
+    """Background thread that commits the data buffered by open Buffered_writers once it is due.
+    If a writer's commit fails the error is printed once and the commit retried with a delay that
+    doubles on each failure up to max_retry_delay seconds."""
+
+    def __init__(self, interval=0.05, max_retry_delay=5):
+        self.interval = interval
+        self.max_retry_delay = max_retry_delay
+        self.writers = set()
+        self.failures = {}  # {writer: (retry_time, retry_delay)} of writers whose last commit failed.
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def add(self, writer):
+        with self.lock:
+            self.writers.add(writer)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._flush_loop, daemon=True)
+                self.thread.start()
+
+    def remove(self, writer):
+        with self.lock:
+            self.writers.discard(writer)
+            self.failures.pop(writer, None)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.monotonic()
+            with self.lock:
+                writers = list(self.writers)
+            for writer in writers:
+                retry_time, retry_delay = self.failures.get(writer, (now, None))
+                if now < retry_time or not writer.due(now):
+                    continue
+                try:
+                    writer.flush()
+                except Exception:
+                    if retry_delay is None:  # First failure.
+                        traceback.print_exc()  # Data is kept and retried on the next commit.
+                    retry_delay = min(2 * (retry_delay or self.interval), self.max_retry_delay)
+                    with self.lock:
+                        if writer in self.writers:
+                            self.failures[writer] = (now + retry_delay, retry_delay)
+                else:
+                    if retry_delay is not None:
+                        with self.lock:
+                            self.failures.pop(writer, None)
+
+    def close_all(self):
+        """Close all open writers, committing their buffered data."""
+        with self.lock:
+            writers = list(self.writers)
+        for writer in writers:
+            writer.close()
+
+
+_flusher = _Flusher()
+atexit.register(_flusher.close_all)
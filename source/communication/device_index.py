@@ -0,0 +1,108 @@
+import os
+import re
+import ast
+import json
+
+# ----------------------------------------------------------------------------------------
+#  Device_index
+# ----------------------------------------------------------------------------------------
+
+
+def _parse_file(file_path):
+    """Parse python file, return (classes, names) where classes is a list of the classes defined
+    at module level and names a list of the names and attributes referenced in the file.  Names
+    imported from modules in the devices package are included as 'devices.<module>'."""
+    with open(file_path, "r", encoding="utf-8") as f:
+        file_content = f.read()
+    try:
+        tree = ast.parse(file_content)
+    except SyntaxError:  # Fall back on treating every word in the file as a reference.
+        classes = re.findall(r"^class\s+(\w+)", file_content, re.MULTILINE)
+        return classes, sorted(set(re.findall(r"\w+", file_content)))
+    classes = [node.name for node in tree.body if isinstance(node, ast.ClassDef)]
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            names.add(node.id)
+        elif isinstance(node, ast.Attribute):
+            names.add(node.attr)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            if node.module.startswith("devices."):
+                names.add(node.module)
+            names.update(alias.name for alias in node.names)
+    return classes, sorted(names)
+
+
+class Device_index:
+    """Index of the device classes defined in the devices folder and the names referenced by
+    task, hardware definition and device driver files, used to find which device driver files
+    a file needs.  Files are parsed with the ast module, so only real references to a device
+    class are matched.  Parse results are cached in memory and in a json file at index_path,
+    keyed by file modification time and size, so each file is only parsed again when it changes.
+    """
+
+    def __init__(self, devices_dir, index_path=None):
+        self.devices_dir = devices_dir
+        self.index_path = index_path
+        self.files = {}  # {file_path: {"stat": [mtime_ns, size], "classes": [...], "names": [...]}}
+        self.class2file = {}  # {device_class_name: device_file_name}
+        self.changed = False
+        if index_path and os.path.exists(index_path):
+            try:
+                with open(index_path, "r") as f:
+                    self.files = json.load(f)
+            except (OSError, ValueError):
+                self.files = {}
+
+    def _file_info(self, file_path):
+        """Return parsed info for file, parsing it only if it has changed since last parsed."""
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        file_stat = [stat.st_mtime_ns, stat.st_size]
+        info = self.files.get(file_path)
+        if info is None or info["stat"] != file_stat:
+            classes, names = _parse_file(file_path)
+            info = {"stat": file_stat, "classes": classes, "names": names}
+            self.files[file_path] = info
+            self.changed = True
+        return info
+
+    def update(self):
+        """Update the map of device classes to the files in the devices folder that define them."""
+        self.class2file = {}
+        for device_file in sorted(os.listdir(self.devices_dir)):
+            if device_file.endswith(".py"):
+                for device_class in self._file_info(os.path.join(self.devices_dir, device_file))["classes"]:
+                    self.class2file[device_class] = device_file
+        self.save()
+
+    def used_device_files(self, ref_file_path):
+        """Return a sorted list of device driver file names that define device classes used by
+        ref_file, or by the device driver files it uses."""
+        used_files = set()
+        files_to_check = [ref_file_path]
+        while files_to_check:
+            file_path = files_to_check.pop()
+            file_name = os.path.split(file_path)[-1]
+            for name in self._file_info(file_path)["names"]:
+                if name.startswith("devices."):
+                    device_file = name[len("devices.") :] + ".py"
+                    if not os.path.exists(os.path.join(self.devices_dir, device_file)):
+                        continue
+                else:
+                    device_file = self.class2file.get(name)
+                if device_file and device_file != file_name and device_file not in used_files:
+                    used_files.add(device_file)
+                    files_to_check.append(os.path.join(self.devices_dir, device_file))
+        self.save()
+        return sorted(used_files)
+
+    def save(self):
+        """Write the index to disk if it has changed."""
+        if self.changed and self.index_path:
+            try:
+                with open(self.index_path, "w") as f:
+                    json.dump(self.files, f)
+            except OSError:
+                pass  # Index is only a cache.
+            self.changed = False
@@ -0,0 +1,214 @@
+import json
+import time
+import struct
+from array import array
+from .message import MsgType, Datatuple
+from source.pyAccessControl import ac_protocol
+
+# ----------------------------------------------------------------------------------------
+#  Frame_decoder
+# ----------------------------------------------------------------------------------------
+
+FRAME_START = 0x07  # First byte of a pyControl data message.
+RUN_END = 0x04  # First byte sent by the raw REPL when the framework run ends.
+HEADER_LEN = 5  # Start byte + 2 checksum bytes + 2 message length bytes.
+
+
+class Frame_decoder:
+    """Incremental decoder for the data stream output by the pyControl framework.
+
+    Bytes read from the serial line are appended to a reusable buffer with feed(), decode()
+    then converts every complete message in the buffer into a Datatuple, parsing the message
+    in place via a memoryview.  Incomplete messages are kept in the buffer until the
+    remaining bytes arrive.  The framework message format is:
+        b'\\x07' + checksum (2 bytes) + message_len (2 bytes) + message
+    where message = timestamp (4 bytes) + type (1 byte) + subtype (1 byte) + content.
+    """
+
+    def __init__(self, board):
+        self.board = board
+        self.buffer = bytearray()
+        self.reset()
+
+    def reset(self):
+        self.buffer.clear()
+        self.run_ended = False  # Set True when the end of framework run byte is decoded.
+
+    def feed(self, data):
+        """Append bytes read from the serial line to the buffer."""
+        self.buffer += data
+
+    def take_remaining(self):
+        """Return and clear any bytes left in the buffer, used to get the error output
+        that follows the end of a framework run."""
+        remaining = bytes(self.buffer)
+        self.buffer.clear()
+        return remaining
+
+    def decode(self):
+        """Decode all complete messages in the buffer, return list of Datatuples."""
+        new_data = []
+        unexpected_start = None  # Buffer index of first byte of unexpected input.
+        buf_len = len(self.buffer)
+        i = 0
+        with memoryview(self.buffer) as mv:
+            while i < buf_len:
+                first_byte = mv[i]
+                if first_byte == FRAME_START:  # Start of pyControl message.
+                    if i + HEADER_LEN > buf_len:
+                        break  # Header incomplete.
+                    message_len = mv[i + 3] | (mv[i + 4] << 8)
+                    message_end = i + HEADER_LEN + message_len
+                    if message_end > buf_len:
+                        break  # Message incomplete.
+                    # Output any unexpected characters recived prior to message start.
+                    if unexpected_start is not None:
+                        new_data.append(self._unexpected_input(mv[unexpected_start:i]))
+                        unexpected_start = None
+                    checksum = mv[i + 1] | (mv[i + 2] << 8)
+                    new_data.append(self._decode_message(checksum, mv[i + HEADER_LEN : message_end]))
+                    i = message_end
+                elif first_byte == RUN_END:  # End of framework run.
+                    self.run_ended = True
+                    i += 1
+                    break
+                else:
+                    if unexpected_start is None:
+                        unexpected_start = i
+                    i += 1
+            if unexpected_start is not None:  # Unexpected input not followed by a complete message.
+                unexpected_end = i - 1 if self.run_ended else i
+                new_data.append(self._unexpected_input(mv[unexpected_start:unexpected_end]))
+        del self.buffer[:i]  # Discard decoded bytes, keeping any partial message.
+        return new_data
+
+    def _unexpected_input(self, input_bytes):
+        return Datatuple(
+            time=self.board.get_timestamp(),
+            type=MsgType.WARNG,
+            content="Unexpected input received from board: " + str(input_bytes, "utf-8", "replace"),
+        )
+
+    def _decode_message(self, checksum, message):
+        """Convert a single message (memoryview excluding header) into a Datatuple."""
+        msg_type = MsgType.from_byte(bytes(message[4:5]))
+        msg_subtype = msg_type.get_subtype(chr(message[5]))
+        content_bytes = message[6:]
+        # Compute checksum
+        if msg_type == MsgType.ANLOG:  # Need to extract analog data to compute checksum.
+            ID = content_bytes[0] | (content_bytes[1] << 8)
+            data = array(self.board.sm_info.analog_inputs[ID]["dtype"])
+            data.frombytes(content_bytes[2:])
+            content = (ID, data)
+            message_sum = sum(message[:8]) + sum(data)
+        else:
+            message_sum = sum(message)
+        if checksum != message_sum & 0xFFFF:  # Bad checksum
+            return Datatuple(time=self.board.get_timestamp(), type=MsgType.WARNG, content="Bad data checksum.")
+        self.board.last_message_time = time.time()
+        self.board.timestamp = int.from_bytes(message[:4], "little")
+        if msg_type in (MsgType.EVENT, MsgType.STATE):
+            content = int(str(content_bytes, "utf-8"))  # Event/state ID.
+        elif msg_type in (MsgType.PRINT, MsgType.WARNG):
+            content = str(content_bytes, "utf-8")  # Print or error string.
+        elif msg_type == MsgType.VARBL:
+            content = str(content_bytes, "utf-8")  # JSON string
+            self.board.sm_info.variables.update(json.loads(content))
+        elif msg_type == MsgType.STOPF:
+            content = None  # Stop framework message has no content.
+        return Datatuple(time=self.board.timestamp, type=msg_type, subtype=msg_subtype, content=content)
+
+
+# ----------------------------------------------------------------------------------------
+#  AC_frame_decoder
+# ----------------------------------------------------------------------------------------
+
+
+def _format_float(value_bytes):
+    """Return the shortest string that converts back to the same 4 byte float."""
+    value = struct.unpack("<f", value_bytes)[0]
+    for precision in range(6, 10):
+        value_str = "{:.{}g}".format(value, precision)
+        if struct.pack("<f", float(value_str)) == value_bytes:
+            return value_str
+    return repr(value)
+
+
+class AC_frame_decoder:
+    """Incremental decoder for the binary messages output by the access control board (see
+    source/pyAccessControl/ac_protocol.py for the frame format).
+
+    Bytes read from the serial line are appended to a reusable buffer with feed(), decode()
+    then converts every complete frame into a 'key:value' message string, the format used
+    by the access control logger files and system_controller.process_data_AC.  Incomplete
+    frames are kept in the buffer until the remaining bytes arrive, bytes outside of frames
+    (e.g. plain text written by the board) and frames with bad checksums or lengths longer
+    than the longest message are discarded, decoding resumes at the next start byte.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.timestamp = 0  # Board time (ms) of the most recently decoded message.
+
+    def reset(self):
+        self.buffer.clear()
+
+    def feed(self, data):
+        """Append bytes read from the serial line to the buffer."""
+        self.buffer += data
+
+    def decode(self):
+        """Decode all complete frames in the buffer, return list of message strings."""
+        messages = []
+        buf_len = len(self.buffer)
+        i = 0
+        with memoryview(self.buffer) as mv:
+            while i < buf_len:
+                if mv[i] != ac_protocol.FRAME_START:
+                    i += 1
+                    continue
+                if i + ac_protocol.HEADER_LEN > buf_len:
+                    break  # Header incomplete.
+                message_len = mv[i + 3] | (mv[i + 4] << 8)
+                if not 6 <= message_len <= ac_protocol.MAX_MESSAGE_LEN:
+                    i += 1  # Not a valid frame, resync on the next start byte.
+                    continue
+                message_end = i + ac_protocol.HEADER_LEN + message_len
+                if message_end > buf_len:
+                    break  # Message incomplete.
+                checksum = mv[i + 1] | (mv[i + 2] << 8)
+                with mv[i + ac_protocol.HEADER_LEN : message_end] as message:
+                    msg = None
+                    if checksum == sum(message) & 0xFFFF:
+                        msg = self._decode_message(message)
+                if msg is not None:
+                    messages.append(msg)
+                    i = message_end
+                else:  # Not a valid frame, resync on the next start byte.
+                    i += 1
+        del self.buffer[:i]  # Discard decoded bytes, keeping any partial frame.
+        return messages
+
+    def _decode_message(self, message):
+        """Convert a single message (memoryview excluding header) into a message string."""
+        if message[4] >= len(ac_protocol.MSG_KEYS):
+            return None
+        key = ac_protocol.MSG_KEYS[message[4]]
+        payload_type = message[5]
+        payload = message[6:]
+        if payload_type == ac_protocol.FLOAT and len(payload) == 4:
+            value = _format_float(bytes(payload))
+        elif payload_type == ac_protocol.INT and len(payload) == 4:
+            value = str(int.from_bytes(payload, "little", signed=True))
+        elif payload_type == ac_protocol.ENUM and len(payload) == 1 and payload[0] < len(ac_protocol.STATES):
+            value = ac_protocol.STATES[payload[0]]
+        elif payload_type == ac_protocol.STRING:
+            value = str(payload, "utf-8", "replace")
+        elif payload_type == ac_protocol.NONE:
+            value = "None"
+        else:
+            return None
+        self.timestamp = int.from_bytes(message[:4], "little")
+        if key == "error":
+            return value  # Error messages are sent without a key.
+        return key + ":" + value
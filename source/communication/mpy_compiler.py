@@ -0,0 +1,59 @@
+import os
+import shutil
+import hashlib
+import subprocess
+
+# ----------------------------------------------------------------------------------------
+#  Mpy_compiler
+# ----------------------------------------------------------------------------------------
+
+
+class Mpy_compiler:
+    """Cross compiles python files to MicroPython .mpy bytecode using mpy-cross.
+
+    Compiled files are cached in cache_dir under a key made from the hash of the file
+    name, file contents and compiler version, so each file is only compiled once.  If
+    mpy-cross is not installed, a file fails to compile, or the compiled bytecode version
+    does not match the version supported by the board, compile() returns None and the
+    caller should fall back to uploading the source file.
+    """
+
+    def __init__(self, cache_dir, board_mpy_version):
+        self.cache_dir = cache_dir
+        self.board_mpy_version = board_mpy_version  # .mpy version supported by the board, None if unknown.
+        self.executable = shutil.which("mpy-cross")
+        self.compiler_version = None
+        if self.executable:
+            try:
+                self.compiler_version = subprocess.run(
+                    [self.executable, "--version"], capture_output=True, check=True
+                ).stdout.strip()
+            except (OSError, subprocess.CalledProcessError):
+                self.executable = None
+        self.available = bool(self.executable and self.board_mpy_version)
+        if self.available and not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def compile(self, file_path):
+        """Return the path of the compiled .mpy version of file_path, or None if unavailable."""
+        if not self.available:
+            return None
+        file_name = os.path.split(file_path)[-1]
+        with open(file_path, "rb") as f:
+            source = f.read()
+        key = hashlib.sha1(file_name.encode() + self.compiler_version + source).hexdigest()
+        mpy_path = os.path.join(self.cache_dir, key + ".mpy")
+        if not os.path.exists(mpy_path):
+            temp_path = mpy_path + ".temp"
+            try:
+                subprocess.run(
+                    [self.executable, "-s", file_name, "-o", temp_path, file_path], capture_output=True, check=True
+                )
+            except (OSError, subprocess.CalledProcessError):
+                return None  # Compilation failed, e.g. syntax error in file.
+            os.replace(temp_path, mpy_path)
+        with open(mpy_path, "rb") as f:
+            header = f.read(2)
+        if len(header) < 2 or header[1] != self.board_mpy_version:
+            return None  # Bytecode version not supported by board.
+        return mpy_path
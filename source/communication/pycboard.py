@@ -1,16 +1,20 @@
 import os
-import re
+import ast
 import time
-import json
 import inspect
 from serial import SerialException
-from array import array
 from .pyboard import Pyboard, PyboardError
 from .data_logger import Data_logger
 from .message import MsgType, Datatuple
-from source.gui.settings import VERSION, user_folder
+from .frame_decoder import Frame_decoder
+from .mpy_compiler import Mpy_compiler
+from .device_index import Device_index
+from source.gui.settings import VERSION, user_folder, get_setting
 from dataclasses import dataclass
 
+TRANSFER_CHUNK_SIZE = 512  # Bytes per chunk sent to board during file transfer.
+TRANSFER_WINDOW = 8  # Maximum number of unacknowledged chunks in flight during file transfer.
+
 # ----------------------------------------------------------------------------------------
 #  Helper functions.
 # ----------------------------------------------------------------------------------------
@@ -28,29 +32,58 @@ def _djb2_file(file_path):
     return h
 
 
-# Used on pyboard for file transfer.
-def _receive_file(file_path, file_size):
+# Used on pyboard for file transfer.  Data is received in chunks of chunk_size bytes and a
+# cumulative b"OK" acknowledgement is sent each time a further ack_interval chunks have been
+# received, so the computer can have several chunks in flight.  The djb2 hash of the written
+# file is printed once the transfer is complete.  If no data is received for 500ms the
+# transfer is abandoned and b"ER" sent, so the computer can try again.
+def _receive_file(file_path, file_size, chunk_size=512, ack_interval=1):
     usb = pyb.USB_VCP()
     usb.setinterrupt(-1)
-    buf_size = 512
-    buf = bytearray(buf_size)
+    buf = bytearray(chunk_size)
     buf_mv = memoryview(buf)
-    bytes_remaining = file_size
+    ack_bytes = chunk_size * ack_interval
+    next_ack = min(ack_bytes, file_size)
+    bytes_received = 0
     try:
         with open(file_path, "wb") as f:
-            while bytes_remaining > 0:
-                bytes_read = usb.recv(buf, timeout=5)
-                usb.write(b"OK")
-                if bytes_read:
-                    bytes_remaining -= bytes_read
-                    f.write(buf_mv[:bytes_read])
+            while bytes_received < file_size:
+                bytes_read = usb.recv(buf_mv[: min(chunk_size, file_size - bytes_received)], timeout=500)
+                if not bytes_read:
+                    raise OSError  # Receive timed out.
+                f.write(buf_mv[:bytes_read])
+                bytes_received += bytes_read
+                if bytes_received >= next_ack:
+                    usb.write(b"OK")
+                    next_ack = min(next_ack + ack_bytes, file_size)
     except:
         fs_stat = os.statvfs("/flash")
         fs_free_space = fs_stat[0] * fs_stat[3]
-        if fs_free_space < bytes_remaining:
+        if fs_free_space < file_size - bytes_received:
             usb.write(b"NS")  # Out of space.
         else:
             usb.write(b"ER")
+        return
+    print(_djb2_file(file_path))
+
+
+# Used on pyboard to get the contents of a folder tree in a single call.  Returns a dict
+# {relative_path: (file_size, file_hash)}, or None if the folder does not exist.
+def _folder_manifest(folder_path):
+    manifest = {}
+    folders = [folder_path]
+    try:
+        while folders:
+            folder = folders.pop()
+            for entry in os.ilistdir(folder):
+                path = folder + "/" + entry[0]
+                if entry[1] == 0x4000:  # Directory.
+                    folders.append(path)
+                else:
+                    manifest[path[len(folder_path) + 1 :]] = (os.stat(path)[6], _djb2_file(path))
+    except OSError:
+        return None
+    return manifest
 
 
 @dataclass
@@ -76,16 +109,19 @@ class Pycboard(Pyboard):
     and pyControl operations.
     """
 
-    device_class2file = {}  # Dict mapping device classes to file where they are defined {class_name: device_file}
+    device_index = None  # Device_index used to find the device driver files used by a file.
 
     def __init__(self, serial_port, baudrate=115200, verbose=True, print_func=print, data_consumers=None):
         self.serial_port = serial_port
         self.print = print_func  # Function used for print statements.
         self.data_logger = Data_logger(board=self, print_func=print_func)
+        self.data_logger.save_session_file = get_setting("data_logging", "binary_session_file")
+        self.frame_decoder = Frame_decoder(board=self)
         self.data_consumers = data_consumers
         self.status = {"serial": None, "framework": None, "usb_mode": None}
         self.device_files_on_pyboard = {}  # Dict {file_name:file_hash} of files in devices folder on pyboard.
-        if not Pycboard.device_class2file:  # Scan devices folder to find files where device classes are defined.
+        self.staged_tasks = {}  # Dict {task_name:file_hash} of tasks pre-uploaded to tasks folder on pyboard.
+        if Pycboard.device_index is None:  # Scan devices folder to find files where device classes are defined.
             self.make_device_class2file_map()
         try:
             super().__init__(self.serial_port, baudrate=baudrate)
@@ -96,6 +132,10 @@ class Pycboard(Pyboard):
                 self.eval("sys.implementation.version if hasattr(sys, 'implementation') else (0,0,0)").decode()
             )
             self.micropython_version = float("{}.{}{}".format(*v_tuple))
+            self.mpy_compiler = None  # Used to compile files to .mpy bytecode before upload if enabled.
+            if get_setting("pyboard", "compile_mpy"):
+                mpy_version = eval(self.eval("getattr(sys.implementation, '_mpy', 0) & 0xFF").decode())
+                self.mpy_compiler = Mpy_compiler(user_folder("mpy_cache_dir"), mpy_version)
         except SerialException as e:
             self.status["serial"] = False
             raise (e)
@@ -119,11 +159,13 @@ class Pycboard(Pyboard):
                     self.print("pyControl Framework: Import error")
                 return
 
-    def reset(self):
-        """Enter raw repl (soft reboots pyboard), import modules."""
+    def reset(self, get_device_hashes=True):
+        """Enter raw repl (soft reboots pyboard), import modules. If get_device_hashes is False
+        the device files on the pyboard are assumed unchanged since the last reset."""
         self.enter_raw_repl()  # Soft resets pyboard.
         self.exec(inspect.getsource(_djb2_file))  # define djb2 hashing function.
         self.exec(inspect.getsource(_receive_file))  # define receive file function.
+        self.exec(inspect.getsource(_folder_manifest))  # define folder manifest function.
         self.exec("import os; import gc; import sys; import pyb")
         self.framework_running = False
         error_message = None
@@ -132,7 +174,8 @@ class Pycboard(Pyboard):
         try:
             self.exec("from pyControl import *; import devices")
             self.status["framework"] = True  # Framework imported OK.
-            self.device_files_on_pyboard = self.get_folder_contents("devices", get_hash=True)
+            if get_device_hashes:
+                self.device_files_on_pyboard = self.get_folder_contents("devices", get_hash=True)
         except PyboardError as e:
             error_message = e.args[2].decode()
             if ("ImportError: no module named 'pyControl'" in error_message) or (
@@ -149,6 +192,7 @@ class Pycboard(Pyboard):
 
     def hard_reset(self, reconnect=True):
         self.print("\nResetting pyboard.")
+        self.staged_tasks = {}
         try:
             self.exec_raw_no_follow("pyb.hard_reset()")
         except PyboardError:
@@ -213,37 +257,61 @@ class Pycboard(Pyboard):
             return -1
         return file_hash
 
-    def transfer_file(self, file_path, target_path=None):
-        """Copy file at file_path to location target_path on pyboard."""
+    def transfer_file(
+        self, file_path, target_path=None, chunk_size=TRANSFER_CHUNK_SIZE, window=TRANSFER_WINDOW, check_existing=True
+    ):
+        """Copy file at file_path to location target_path on pyboard.  Up to window chunks of
+        chunk_size bytes are sent before waiting for an acknowledgement from the board, the
+        board returns the hash of the received file which is checked against the original.
+        If check_existing is True the transfer is skipped if the file is already on the board."""
         if not target_path:
             target_path = os.path.split(file_path)[-1]
         file_size = os.path.getsize(file_path)
         file_hash = _djb2_file(file_path)
+        if check_existing and file_hash == self.get_file_hash(target_path):
+            return  # File already on board.
         error_message = (
             "\n\nError: Unable to transfer file. See the troubleshooting docs:\n"
             "https://pycontrol.readthedocs.io/en/latest/user-guide/troubleshooting/"
         )
-        # Try to load file, return once file hash on board matches that on computer.
+        ack_interval = max(1, window // 2)  # Chunks received by board per acknowledgement.
+        ack_bytes = chunk_size * ack_interval
+        max_unacked = chunk_size * window
+        # Try to load file, return once hash of received file matches that on computer.
         for i in range(10):
-            if file_hash == self.get_file_hash(target_path):
-                return
-            self.exec_raw_no_follow("_receive_file('{}',{})".format(target_path, file_size))
+            self.exec_raw_no_follow(
+                "_receive_file('{}',{},{},{})".format(target_path, file_size, chunk_size, ack_interval)
+            )
+            bytes_sent = 0
+            bytes_acked = 0
+            response_bytes = b"OK"
             with open(file_path, "rb") as f:
-                while True:
-                    chunk = f.read(512)
-                    if not chunk:
-                        break
-                    self.serial.write(chunk)
+                while bytes_acked < file_size:
+                    if bytes_sent < file_size and bytes_sent - bytes_acked < max_unacked:
+                        chunk = f.read(chunk_size)
+                        self.serial.write(chunk)
+                        bytes_sent += len(chunk)
+                        continue
                     response_bytes = self.serial.read(2)
                     if response_bytes != b"OK":
-                        if response_bytes == b"NS":
-                            self.print("\n\nInsufficient space on pyboard filesystem to transfer file.")
-                        else:
-                            self.print(error_message)
-                        time.sleep(0.01)
-                        self.serial.reset_input_buffer()
-                        raise PyboardError
-                self.follow(3)
+                        break  # Board stopped receiving the file.
+                    bytes_acked = min(bytes_acked + ack_bytes, file_size)
+            try:
+                data, data_err = self.follow(3)
+            except PyboardError:
+                data, data_err = b"", b"timeout"
+            if response_bytes == b"NS":
+                self.print("\n\nInsufficient space on pyboard filesystem to transfer file.")
+                raise PyboardError
+            try:
+                if not data_err and int(data.strip()) == file_hash:
+                    return
+            except ValueError:
+                pass  # Board did not output a file hash.
+            # Clear any file data sent after the board stopped receiving from the REPL input, then try again.
+            self.serial.write(b"\x03")
+            time.sleep(0.01)
+            self.serial.reset_input_buffer()
         # Unable to transfer file.
         self.print(error_message)
         raise PyboardError
@@ -254,30 +322,60 @@ class Pycboard(Pyboard):
         """Copy a folder into the root directory of the pyboard.  Folders that
         contain subfolders will not be copied successfully.  To copy only files of
         a specific type, change the file_type argument to the file suffix (e.g. 'py').
-        To copy only specified files pass a list of file names as files argument."""
+        To copy only specified files pass a list of file names as files argument.
+        The contents of the target folder are compared with the files to send in a
+        single round trip, and only new or changed files are transferred."""
         if not target_folder:
             target_folder = os.path.split(folder_path)[-1]
         if files == "all":
             files = os.listdir(folder_path)
             if file_type != "all":
                 files = [f for f in files if f.split(".")[-1] == file_type]
-        try:
+        upload_files = dict(self._upload_version(os.path.join(folder_path, f)) for f in files)
+        target_manifest = self.get_folder_manifest(target_folder)
+        if target_manifest is None:  # Folder not on pyboard.
             self.exec("os.mkdir({})".format(repr(target_folder)))
-        except PyboardError:
-            # Folder already exists.
-            if remove_files:  # Remove any files not in sending folder.
-                target_files = self.get_folder_contents(target_folder)
-                remove_files = list(set(target_files) - set(files))
-                for f in remove_files:
-                    target_path = target_folder + "/" + f
-                    self.remove_file(target_path)
-        for f in files:
-            file_path = os.path.join(folder_path, f)
+            target_manifest = {}
+        files_to_transfer, stale_files, shadowed_files = self._diff_folder(upload_files, target_manifest)
+        if remove_files:  # Remove any files not in sending folder.
+            shadowed_files = stale_files
+        if shadowed_files:
+            self.remove_files([target_folder + "/" + f for f in shadowed_files])
+        for f in files_to_transfer:
             target_path = target_folder + "/" + f
-            self.transfer_file(file_path, target_path)
+            self.transfer_file(upload_files[f], target_path, check_existing=False)
             if show_progress:
                 self.print(".", end="")
 
+    def _upload_version(self, file_path):
+        """Return (target_file_name, local_path) for the version of file_path to upload to the
+        pyboard: the precompiled .mpy file if mpy compilation is enabled and succeeds, otherwise
+        the file itself. Package __init__ files are always uploaded as source."""
+        file_name = os.path.split(file_path)[-1]
+        if self.mpy_compiler and file_name.endswith(".py") and file_name != "__init__.py":
+            mpy_path = self.mpy_compiler.compile(file_path)
+            if mpy_path:
+                return file_name[:-3] + ".mpy", mpy_path
+        return file_name, file_path
+
+    def _diff_folder(self, upload_files, target_manifest):
+        """Compare files to upload {target_file_name: local_path} with target_manifest
+        {relative_path: (size, hash)} from the pyboard.  Return lists of files that need
+        transferring, files at the top level of the folder on the pyboard that are not being
+        uploaded, and the subset of these that would shadow an uploaded file (a .py file with the
+        same name as an uploaded .mpy or vice versa).  Files in subfolders are not compared as
+        only the top level of a folder is uploaded."""
+        files_to_transfer = []
+        for f, file_path in upload_files.items():
+            if target_manifest.get(f) != (os.path.getsize(file_path), _djb2_file(file_path)):
+                files_to_transfer.append(f)
+        stale_files = [f for f in target_manifest if "/" not in f and f not in upload_files]  # Subfolders are kept.
+        upload_stems = {os.path.splitext(f)[0] for f in upload_files}
+        shadowed_files = [
+            f for f in stale_files if f.endswith((".py", ".mpy")) and os.path.splitext(f)[0] in upload_stems
+        ]
+        return files_to_transfer, stale_files, shadowed_files
+
     def remove_file(self, file_path):
         """Remove a file from the pyboard."""
         try:
@@ -285,14 +383,25 @@ class Pycboard(Pyboard):
         except PyboardError:
             pass  # File does not exist.
 
+    def remove_files(self, file_paths):
+        """Remove a list of files from the pyboard in a single REPL call."""
+        self.exec(
+            "for f in {}:\n try:\n  os.remove(f)\n except OSError:\n  pass".format(repr(list(file_paths)))
+        )
+
     def get_folder_contents(self, folder_path, get_hash=False):
         """Get a list of the files in a folder on the pyboard, if
         get_hash=True a dict {file_name:file_hash} is returned instead"""
-        file_list = eval(self.eval("os.listdir({})".format(repr(folder_path))).decode())
         if get_hash:
-            return {file_name: self.get_file_hash(folder_path + "/" + file_name) for file_name in file_list}
+            manifest = self.get_folder_manifest(folder_path) or {}
+            return {file_name: file_hash for file_name, (file_size, file_hash) in manifest.items()}
         else:
-            return file_list
+            return eval(self.eval("os.listdir({})".format(repr(folder_path))).decode())
+
+    def get_folder_manifest(self, folder_path):
+        """Get a dict {relative_path: (file_size, file_hash)} of all files in folder tree on the
+        pyboard in a single REPL call, returns None if the folder does not exist."""
+        return eval(self.eval("_folder_manifest({})".format(repr(folder_path))).decode())
 
     # ------------------------------------------------------------------------------------
     # pyControl operations.
@@ -300,8 +409,9 @@ class Pycboard(Pyboard):
 
     def load_framework(self):
         """Copy the pyControl framework folder to the board, reset the devices folder
-        on pyboard by removing all devices files, and rebuild the device_class2file dict."""
+        on pyboard by removing all devices files, and update the device index."""
         self.print("\nTransferring pyControl framework to pyboard.", end="")
+        self.staged_tasks = {}  # Device files used by staged tasks are removed from the pyboard.
         self.transfer_folder(os.path.join("source", "pyControl"), file_type="py", show_progress=True)
         self.transfer_folder(user_folder("devices"), files=["__init__.py"], remove_files=True, show_progress=True)
         self.remove_file("hardware_definition.py")
@@ -317,6 +427,7 @@ class Pycboard(Pyboard):
     def load_hardware_definition(self, hwd_path):
         """Transfer a hardware definition file to pyboard."""
         if os.path.exists(hwd_path):
+            self.staged_tasks = {}  # Staged tasks may use device files that are replaced.
             self.transfer_device_files(hwd_path)
             self.print("\nTransferring hardware definition to pyboard.", end="")
             self.transfer_file(hwd_path, target_path="hardware_definition.py")
@@ -337,13 +448,15 @@ class Pycboard(Pyboard):
         on the computer."""
         used_device_files = self._get_used_device_files(ref_file_path)
         files_to_transfer = []
-        for device_file in used_device_files:  # File not on pyboard.
-            if device_file not in self.device_files_on_pyboard.keys():
+        for device_file in used_device_files:
+            target_file, local_path = self._upload_version(os.path.join(user_folder("devices"), device_file))
+            other_version = device_file[:-3] + ".mpy" if target_file == device_file else device_file
+            if target_file not in self.device_files_on_pyboard.keys():  # File not on pyboard.
+                files_to_transfer.append(device_file)
+            elif _djb2_file(local_path) != self.device_files_on_pyboard[target_file]:  # File has changed.
+                files_to_transfer.append(device_file)
+            elif other_version in self.device_files_on_pyboard.keys():  # Other version needs removing.
                 files_to_transfer.append(device_file)
-            else:
-                file_hash = _djb2_file(os.path.join(user_folder("devices"), device_file))
-                if file_hash != self.device_files_on_pyboard[device_file]:  # File has changed.
-                    files_to_transfer.append(device_file)
         if files_to_transfer:
             self.print(f"\nTransfering device driver files {files_to_transfer} to pyboard", end="")
             self.transfer_folder(
@@ -354,53 +467,64 @@ class Pycboard(Pyboard):
 
     def _get_used_device_files(self, ref_file_path):
         """Return a list of device driver file names containing device classes used in ref_file"""
-        ref_file_name = os.path.split(ref_file_path)[-1]
-        with open(ref_file_path, "r") as f:
-            file_content = f.read()
-        device_files = [
-            device_file
-            for device_class, device_file in Pycboard.device_class2file.items()
-            if device_class in file_content and not ref_file_name == device_file
-        ]
-        # Add any device driver files containing classes used in device_files.
-        for device_file in device_files.copy():
-            device_files += self._get_used_device_files(os.path.join(user_folder("devices"), device_file))
-        device_files = list(set(device_files))  # Remove duplicates.
-        return device_files
+        return Pycboard.device_index.used_device_files(ref_file_path)
 
     def make_device_class2file_map(self):
-        """Make dict mapping device class names to file in devices folder containing
+        """Update the device index mapping device class names to file in devices folder containing
         the class definition."""
-        Pycboard.device_class2file = {}  # Dict {device_classname: device_filename}
-        all_device_files = [f for f in os.listdir(user_folder("devices")) if f.endswith(".py")]
-        for device_file in all_device_files:
-            with open(os.path.join(user_folder("devices"), device_file), "r") as f:
-                file_content = f.read()
-            pattern = "[\n\r]class\s*(?P<dcname>\w+)\s*"
-            list(set([d_name for d_name in re.findall(pattern, file_content)]))
-            device_classes = list(set([device_class for device_class in re.findall(pattern, file_content)]))
-            for device_class in device_classes:
-                Pycboard.device_class2file[device_class] = device_file
+        if Pycboard.device_index is None:
+            Pycboard.device_index = Device_index(user_folder("devices"), user_folder("device_index_filepath"))
+        Pycboard.device_index.update()
+
+    def stage_tasks(self, sm_names, sm_dir=None):
+        """Transfer the task files sm_names and the device driver files they use to the tasks
+        folder on the pyboard, so setup_state_machine only needs to import the task when it is
+        run.  Tasks already on the pyboard are only transferred if they have changed, and tasks
+        in the tasks folder that are not in sm_names are removed."""
+        if sm_dir is None:
+            sm_dir = user_folder("tasks")
+        sm_names = sorted(set(sm_names))
+        for sm_name in sm_names:
+            self.transfer_device_files(os.path.join(sm_dir, sm_name + ".py"))
+        self.print(f"\nStaging tasks {sm_names} on pyboard", end="")
+        self.transfer_folder(sm_dir, target_folder="tasks", files=[sm_name + ".py" for sm_name in sm_names])
+        self.write_file("tasks/__init__.py", "")
+        self.staged_tasks = {sm_name: _djb2_file(os.path.join(sm_dir, sm_name + ".py")) for sm_name in sm_names}
+        self.print(" OK")
 
     def setup_state_machine(self, sm_name, sm_dir=None, uploaded=False):
         """Transfer state machine descriptor file sm_name.py from folder sm_dir
-        to board and setup state machine on pyboard."""
-        self.reset()
+        to board and setup state machine on pyboard.  If the task has been staged on
+        the pyboard with stage_tasks and is unchanged it is imported from the tasks folder."""
         if sm_dir is None:
             sm_dir = user_folder("tasks")
         sm_path = os.path.join(sm_dir, sm_name + ".py")
+        staged = (
+            not uploaded
+            and sm_name in self.staged_tasks
+            and os.path.exists(sm_path)
+            and self.staged_tasks[sm_name] == _djb2_file(sm_path)
+        )
+        self.reset(get_device_hashes=not staged)
+        task_module = "task_file"
         if uploaded:
             self.print("\nResetting task. ", end="")
+        elif staged:
+            self.print("\nSetting up staged state machine {}. ".format(sm_name), end="")
+            task_module = "tasks." + sm_name
         else:
             if not os.path.exists(sm_path):
                 self.print("Error: State machine file not found at: " + sm_path)
                 raise PyboardError("State machine file not found at: " + sm_path)
             self.transfer_device_files(sm_path)
             self.print("\nTransferring state machine {} to pyboard. ".format(sm_name), end="")
-            self.transfer_file(sm_path, "task_file.py")
+            target_file, local_path = self._upload_version(sm_path)
+            self.transfer_file(local_path, "task_file" + os.path.splitext(target_file)[1])
+            if target_file.endswith(".mpy"):
+                self.remove_file("task_file.py")  # Source version would be imported in preference to .mpy.
         self.gc_collect()
         try:
-            self.exec("import task_file")
+            self.exec("import {} as task_file".format(task_module))
             self.exec("sm.setup_state_machine(task_file)")
             self.print("OK")
         except PyboardError as e:
@@ -440,6 +564,7 @@ class Pycboard(Pyboard):
         self.gc_collect()
         self.exec("fw.data_output = " + repr(data_output))
         self.serial.reset_input_buffer()
+        self.frame_decoder.reset()
         self.last_message_time = 0
         self.exec_raw_no_follow("fw.run()")
         self.framework_running = True
@@ -452,63 +577,34 @@ class Pycboard(Pyboard):
     def process_data(self):
         """Read data from serial line, generate list new_data of data tuples,
         pass new_data to data_logger and print_func if specified, return new_data."""
+        new_data, error_message = self.read_data()
+        self.dispatch_data(new_data, error_message)
+
+    def read_data(self):
+        """Read and decode data from serial line without passing it on, return
+        (new_data, error_message). Safe to call from a background reader thread."""
         new_data = []
         error_message = None
-        unexpected_input = []
-        while self.serial.in_waiting > 0:
-            new_byte = self.serial.read(1)
-            if new_byte == b"\x07":  # Start of pyControl message.
-                # Output any unexpected characters recived prior to message start.
-                if unexpected_input:
-                    new_data.append(
-                        Datatuple(
-                            time=self.get_timestamp(),
-                            type=MsgType.WARNG,
-                            content="Unexpected input received from board: " + "".join(unexpected_input),
-                        )
-                    )
-                    unexpected_input = []
-                # Read message.
-                checksum = int.from_bytes(self.serial.read(2), "little")
-                message_len = int.from_bytes(self.serial.read(2), "little")
-                message = self.serial.read(message_len)
-                msg_type = MsgType.from_byte(message[4:5])
-                subtype_byte = message[5:6]
-                msg_subtype = msg_type.get_subtype(subtype_byte.decode())
-                content_bytes = message[6:]
-                # Compute checksum
-                if msg_type == MsgType.ANLOG:  # Need to extract analog data to compute checksum.
-                    ID = int.from_bytes(content_bytes[:2], "little")
-                    data = array(self.sm_info.analog_inputs[ID]["dtype"], content_bytes[2:])
-                    content = (ID, data)
-                    message_sum = sum(message[:8]) + sum(data)
-                else:
-                    message_sum = sum(message)
-                # Process message.
-                if checksum == message_sum & 0xFFFF:  # Checksum OK.
-                    self.last_message_time = time.time()
-                    self.timestamp = int.from_bytes(message[:4], "little")
-                    if msg_type in (MsgType.EVENT, MsgType.STATE):
-                        content = int(content_bytes.decode())  # Event/state ID.
-                    elif msg_type in (MsgType.PRINT, MsgType.WARNG):
-                        content = content_bytes.decode()  # Print or error string.
-                    elif msg_type == MsgType.VARBL:
-                        content = content_bytes.decode()  # JSON string
-                        self.sm_info.variables.update(json.loads(content))
-                    new_data.append(Datatuple(time=self.timestamp, type=msg_type, subtype=msg_subtype, content=content))
-                else:  # Bad checksum
-                    new_data.append(
-                        Datatuple(time=self.get_timestamp(), type=MsgType.WARNG, content="Bad data checksum.")
-                    )
-            elif new_byte == b"\x04":  # End of framework run.
-                self.framework_running = False
-                data_err = self.read_until(2, b"\x04>", timeout=10)
-                if len(data_err) > 2:  # Error during framework run.
-                    error_message = data_err[:-3].decode()
-                    new_data.append(Datatuple(time=self.get_timestamp(), type=MsgType.ERROR, content=error_message))
-                break
-            else:
-                unexpected_input.append(new_byte.decode())
+        bytes_waiting = self.serial.in_waiting
+        if bytes_waiting > 0:  # Read all available data in a single call.
+            self.frame_decoder.feed(self.serial.read(bytes_waiting))
+            new_data = self.frame_decoder.decode()
+        if self.frame_decoder.run_ended:  # End of framework run.
+            self.framework_running = False
+            self.frame_decoder.run_ended = False
+            data_err = self.frame_decoder.take_remaining()
+            if data_err.endswith(b"\x04"):
+                data_err += self.read_until(1, b">", timeout=10)
+            elif not data_err.endswith(b"\x04>"):
+                data_err += self.read_until(2, b"\x04>", timeout=10)
+            if len(data_err) > 2:  # Error during framework run.
+                error_message = data_err[:-3].decode()
+                new_data.append(Datatuple(time=self.get_timestamp(), type=MsgType.ERROR, content=error_message))
+        return new_data, error_message
+
+    def dispatch_data(self, new_data, error_message=None):
+        """Pass new_data to data_logger and data_consumers, raise PyboardError if
+        an error occured during the framework run."""
         if new_data:
             self.data_logger.write_and_emit_data(new_data)
             if self.data_consumers:
@@ -532,7 +628,7 @@ class Pycboard(Pyboard):
         """Send data to the pyboard while framework is running."""
         encoded_data = cmd_type.encode() + data.encode()
         data_len = len(encoded_data).to_bytes(2, "little")
-        checksum = sum(encoded_data).to_bytes(2, "little")
+        checksum = (sum(encoded_data) & 0xFFFF).to_bytes(2, "little")
         self.serial.write(command.encode() + data_len + encoded_data + checksum)
 
     # ------------------------------------------------------------------------------------
@@ -554,6 +650,22 @@ class Pycboard(Pyboard):
                 self.sm_info.variables[v_name] = v_value
             return set_OK
 
+    def set_variables(self, variables, source="s"):
+        """Set the values of several state machine variables {v_name: v_value} with a single
+        command. If framework is not running returns dict {v_name: set_OK}.  Returns None if
+        framework running, but the variables set OK are later output by board in one
+        variable event."""
+        for v_name in variables:
+            if v_name not in self.sm_info.variables:
+                raise PyboardError("Invalid variable name: {}".format(v_name))
+        if self.framework_running:  # Set variables with serial command.
+            self.send_serial_data(repr(variables), "V", "S" + source)
+            return None
+        else:  # Set variables using REPL.
+            set_OK = ast.literal_eval(self.eval(f"sm.set_variables({repr(variables)})").decode())
+            self.sm_info.variables.update({k: v for k, v in variables.items() if set_OK[k]})
+            return set_OK
+
     def get_variable(self, v_name):
         """Get the value of a state machine variable. If framework not running returns
         variable value if got OK, None if get fails.  Returns None if framework
@@ -569,6 +681,18 @@ class Pycboard(Pyboard):
             except Exception:  # Variable is a string.
                 return var_str
 
-    def get_variables(self):
-        """Return variables as a dictionary {v_name: v_value}"""
-        return eval(self.eval("{k: v for k, v in sm.variables.__dict__.items() if not hasattr(v, '__init__')}"))
+    def get_variables(self, v_names=None):
+        """Get the values of the state machine variables in list v_names, or of all variables if
+        v_names is None, with a single command.  If framework not running returns dictionary
+        {v_name: v_value}, with value None for variables the get failed for.  Returns None if
+        framework running, but the values are later output by board in one variable event."""
+        if v_names is not None:
+            v_names = list(v_names)
+            for v_name in v_names:
+                if v_name not in self.sm_info.variables:
+                    raise PyboardError("Invalid variable name: {}".format(v_name))
+        if self.framework_running:  # Get variables with serial command.
+            self.send_serial_data(repr(v_names), "V", "G")
+            return None
+        else:  # Get variables using REPL.
+            return ast.literal_eval(self.eval(f"sm.get_variables({repr(v_names)})").decode())
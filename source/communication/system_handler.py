@@ -1,19 +1,26 @@
-import json
 import os
+import queue
+import threading
 import time
 from datetime import datetime
 
 import pandas as pd
+from serial import SerialException
 
 from ..utils import get_path
 import db as database
-from source.gui.settings import user_folder
+from source.gui.settings import user_folder, get_setting
+from source.utils.session_log import Session_log
+from source.utils.protocol_cache import load_protocol
 from source.communication.messages import (
     MessageRecipient,
     MessageSource,
     emit_print_message,
 )
 from source.communication.data_logger import Data_logger, Analog_writer
+from source.communication.pyboard import PyboardError
+
+READ_INTERVAL = 0.005  # Seconds the reader thread waits when neither board has data.
 
 
 class system_controller(Data_logger):
@@ -24,6 +31,11 @@ class system_controller(Data_logger):
     - Control a whole pycboard and acboard system
     - Log what is does to disk
     - setup tasks from the data base correctly.
+
+    Serial data from both boards is read and decoded continuously by a background reader thread
+    and posted to data_queue.  The GUI thread drains the queue in process_data().  serial_lock is
+    held by the reader while it reads and by the GUI thread while it handles data, so REPL commands
+    sent to the boards while handling data (e.g. uploading a task) are not interleaved with reads.
     """
 
     def __init__(self, AC, PYC, print_func=print, setup_ID=None) -> None:
@@ -33,22 +45,102 @@ class system_controller(Data_logger):
         self.AC.data_logger = self
         self.board = PYC  # board refers to pyControl board. This name inherits from Data_logger class
         self.board.data_logger = self
-        self.analog_files = {}
+        self.analog_writers = {}
         self.sm_info = {}
         self.print_func = print_func
+        self.save_session_file = get_setting("data_logging", "binary_session_file")
         self.active = False
         self.mouse_in_AC = None
+        self.mouse_row = None  # database.Row_handle of the mouse in the training chamber.
         self.data_dir = get_path("data")
         self.data_file = None
+        self.data_queue = queue.Queue()  # Decoded data from reader thread: (source, data, error_message)
+        self.serial_lock = threading.RLock()
+        self.reader_thread = threading.Thread(target=self._read_data_loop, daemon=True)
+        self.reader_thread.start()
 
     # ------------------------------------------------------------------------------------
     # Saving data
     # ------------------------------------------------------------------------------------
 
     def process_data(self):
-        """check whether either AC or the PYC board have data to deliver"""
-        self.AC.process_data()
-        self.board.process_data()
+        """Handle all data posted to the data queue by the reader thread since the last call."""
+        with self.serial_lock:
+            while True:
+                try:
+                    source, data, error_message = self.data_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if source == "AC":
+                    self.AC.dispatch_messages(data)
+                else:
+                    self.board.dispatch_data(data, error_message)
+
+    def stop_session(self):
+        """Stop the framework, handle data remaining from the pyControl board and close the data files."""
+        with self.serial_lock:
+            self.board.stop_framework()
+            time.sleep(0.05)
+            # Board data already queued by the reader thread is handled before reading the serial line.
+            pending_ac = []
+            while True:
+                try:
+                    source, data, error_message = self.data_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if source == "AC":
+                    pending_ac.append((source, data, error_message))
+                else:
+                    self.board.dispatch_data(data, error_message)
+            for item in pending_ac:
+                self.data_queue.put(item)
+            self.board.process_data()
+            self.close_files()
+
+    def stage_experiment_tasks(self) -> None:
+        """Pre-upload every task that the protocols of the mice assigned to this setup can run
+        to the pyControl board, so that on entry the task only needs to be imported."""
+        tasks = set()
+        setup_mice = database.mouse_df.loc[database.mouse_index.find("Setup_ID", self.setup_ID)]
+        for protocol, task in setup_mice[["Protocol", "Task"]].values:
+            if pd.isnull(protocol):
+                continue
+            if "task" in protocol:  # All tasks have "task" as a substring of their name
+                if not pd.isnull(task):
+                    tasks.add(task)
+            else:
+                # Compiles the protocol so that it is cached when mice enter.
+                tasks.update(load_protocol(os.path.join(user_folder("protocol_dir"), protocol)).tasks)
+        if tasks:
+            with self.serial_lock:
+                self.board.stage_tasks(tasks)
+
+    def _read_data_loop(self):
+        """Run by the reader thread. Read and decode data from both boards and post it to the data queue.
+        The pyControl board is only read while the framework is running, as otherwise its serial line is
+        used for REPL commands."""
+        while self.on:
+            ac_messages = []
+            try:
+                with self.serial_lock:
+                    ac_messages = self.AC.read_messages()
+                    pyc_data, error_message = [], None
+                    if self.board.framework_running:
+                        pyc_data, error_message = self.board.read_data()
+            except SerialException as e:
+                self.print_func(f"Serial connection to setup {self.setup_ID} lost: {e}")
+                break
+            except PyboardError as e:
+                pyc_data, error_message = [], str(e)
+            except Exception as e:  # Report the error and keep reading rather than silently ending the thread.
+                self.print_func(f"Error reading data from setup {self.setup_ID}: {e!r}")
+                pyc_data, error_message = [], None
+            if ac_messages:
+                self.data_queue.put(("AC", ac_messages, None))
+            if pyc_data or error_message:
+                self.data_queue.put(("PYC", pyc_data, error_message))
+            if not (ac_messages or pyc_data):
+                time.sleep(READ_INTERVAL)
 
     def write_and_emit_data(self, new_data):
         """If data _file is open new data is written to file."""
@@ -79,81 +171,35 @@ class system_controller(Data_logger):
 
         if self.data_file:
             RUN_ERROR = False
+            mouse_ID, task = self.mouse_row["Mouse_ID"], self.mouse_row["Task"]
+            persistent_variables = database.variables.get(mouse_ID, "persistent", task)
             try:
                 v_ = self.board.get_variables()
                 self.data_file.writelines("Variables")
                 self.data_file.writelines(repr(v_))
-                if (
-                    not database.mouse_df.loc[
-                        database.mouse_df["RFID"] == self.mouse_data["RFID"],
-                        "persistent_variables",
-                    ]
-                    .isnull()
-                    .values.any()
-                ):
-                    persistent_variables = eval(
-                        database.mouse_df.loc[
-                            database.mouse_df["RFID"] == self.mouse_data["RFID"],
-                            "persistent_variables",
-                        ].values[0]
-                    )
-                else:
-                    persistent_variables = {}
-                for k, v__ in v_.items():
-                    k = "v." + k
-                    if k in persistent_variables.keys():
-                        persistent_variables[k] = v__
-                database.mouse_df.loc[
-                    database.mouse_df["RFID"] == self.mouse_data["RFID"],
-                    "persistent_variables",
-                ] = json.dumps(
-                    persistent_variables
-                )  # ignore this line
-                # JSON.dumps is a string representation of a dictionary. that is put into a column of a dataframe. This is probably not the most elegant solution...
+                if persistent_variables:
+                    # Save the end of session values of the persistent variables for the next session.
+                    persistent_variables = {k: v_.get(k[2:], v) for k, v in persistent_variables.items()}
+                    database.variables.set(mouse_ID, "persistent", persistent_variables, task)
             except Exception as e:
                 print(e)
-                if (
-                    not (
-                        database.mouse_df.loc[
-                            database.mouse_df["RFID"] == self.mouse_data["RFID"],
-                            "persistent_variables",
-                        ]
-                    )
-                    .isnull()
-                    .values.any()
-                ):
-                    v_ = eval(
-                        database.mouse_df.loc[
-                            database.mouse_df["RFID"] == self.mouse_data["RFID"],
-                            "persistent_variables",
-                        ].values[0]
-                    )
+                v_ = dict(persistent_variables)
                 self.board.reset()
                 RUN_ERROR = True
 
             self.data_file.close()
+            self.close_session_file()
             self.update_mouse_log(v_, RUN_ERROR)
 
             self.data_file = None
             self.file_path = None
-            if "RUN_ERROR" not in database.mouse_df.columns:
-                database.mouse_df.insert(len(database.mouse_df.columns), "RUN_ERROR", pd.Series(), True)
 
-            # Selects the `RUN_ERROR` column for the appropriate row of the mouse_df and sets its value to the `RUN_ERROR` value
-            database.mouse_df.loc[database.mouse_df["RFID"] == self.mouse_data["RFID"], "RUN_ERROR"] = RUN_ERROR
-            database.mouse_df.loc[database.mouse_df["RFID"] == self.mouse_data["RFID"], "is_training"] = False
-            # Removes columns from the mouse_df that are unnamed ???
-            database.mouse_df = database.mouse_df.loc[:, ~database.mouse_df.columns.str.contains("^Unnamed")]
-            database.mouse_df.to_csv(user_folder("mice_dataframe_filepath"))
+            self.mouse_row.update({"RUN_ERROR": RUN_ERROR, "is_training": False})
+            database.update("setups", "COM", self.board.serial_port, {"Mouse_training": ""})
 
-            database.setup_df.loc[database.setup_df["COM"] == self.board.serial_port, "Mouse_training"] = ""
-            database.setup_df = database.setup_df.loc[:, ~database.setup_df.columns.str.contains("^Unnamed")]
-            database.setup_df.to_csv(user_folder("setup_dir_dataframe_filepath"))
-
-        for analog_file in self.analog_files.values():
-            if analog_file:
-                analog_file.close()
-                analog_file = None
+        for analog_writer in self.analog_writers.values():
+            analog_writer.close_files()
+        self.analog_writers = {}
 
     def update_mouse_log(self, v_, RUN_ERROR):
         """Update the log of mouse behavior. v_ are the variables
@@ -162,26 +208,14 @@ class system_controller(Data_logger):
         session
         """
 
-        mouse_row = database.mouse_df.loc[database.mouse_df["RFID"] == self.mouse_data["RFID"]]
-        mouse_ID = mouse_row["Mouse_ID"].values[0]
-
-        logPth = os.path.join(get_path("mice"), mouse_ID + ".csv")
-        df_mouseLog = pd.read_csv(logPth)
-
-        entry_nr = len(df_mouseLog)
-        df_mouseLog._append(pd.Series(), ignore_index=True)
-        if "RUN_ERROR" not in df_mouseLog.columns:
-            df_mouseLog.insert(len(df_mouseLog.columns), "RUN_ERROR", pd.Series(), True)
+        mouse_ID = self.mouse_row["Mouse_ID"]
 
-        for k in self.mouse_data.keys():
-            if k in df_mouseLog.columns:
-                df_mouseLog.loc[entry_nr, k] = self.mouse_data[k]
-
-        df_mouseLog.loc[entry_nr, "Variables"] = repr(v_)
-        df_mouseLog.loc[entry_nr, "RUN_ERROR"] = RUN_ERROR
-
-        df_mouseLog = df_mouseLog.loc[:, ~df_mouseLog.columns.str.contains("^Unnamed")]
-        df_mouseLog.to_csv(logPth)
+        session = {
+            k: v.strftime("%Y-%m-%d-%H%M%S") if isinstance(v, datetime) else v for k, v in self.mouse_data.items()
+        }
+        session["Variables"] = v_
+        session["RUN_ERROR"] = RUN_ERROR
+        Session_log(user_folder("mice_dir"), mouse_ID).append(session)
 
     # ------------------------------------------------------------------------------------
     # Pycboard and Access control commands
@@ -189,6 +223,8 @@ class system_controller(Data_logger):
 
     def disconnect(self):
         """This needs to be done for when we have multiple setups"""
+        self.on = False
+        self.reader_thread.join(timeout=1)
         self.board.close()  # This closes the connection to the behaviour board
         self.AC.close()  # This closes the connection to AC board by pyboard class
 
@@ -221,14 +257,11 @@ class system_controller(Data_logger):
         to handle these states.
         """
         # update access control state in the database
-        database.setup_df.loc[database.setup_df["COM"] == self.board.serial_port, "AC_state"] = state
+        database.update("setups", "COM", self.board.serial_port, {"AC_state": state})
 
         if state == "error_state":
             # Handle error state from Access control board
-            self.board.stop_framework()  # stops the task
-            time.sleep(0.05)
-            self.board.process_data()
-            self.close_files()
+            self.stop_session()
         if state == "allow_entry":
             # Reset the mouse information on entry
             self.mouse_data = {
@@ -238,6 +271,7 @@ class system_controller(Data_logger):
                 "exit_time": None,
                 "task": None,
             }
+            self.mouse_row = None
 
         # first entry in this state is when the mouse first enters the apparatus
         elif state == "mouse_training":
@@ -250,23 +284,21 @@ class system_controller(Data_logger):
             self.mouse_data["exit_time"] = datetime.now().strftime("%Y-%m-%d-%H%M%S")
 
             if self.data_file:
-                self.board.stop_framework()
-                time.sleep(0.05)
-                self.board.process_data()
-                self.close_files()
+                self.stop_session()
 
     def _handle_mouse_training(self) -> None:
         """Handles the process of starting a training or task protocol for a mouse based on its RFID."""
-        # Get the mouse row from the RFID number
-        mouse_row = database.mouse_df.loc[database.mouse_df["RFID"] == self.mouse_data["RFID"]]
-        # Raise an exception if mouse_row is empty
-        if mouse_row.empty:
+        # Get a handle on the mouse row from the RFID number, used for all reads and writes of the row this session.
+        mouse_row = database.mouse_index.row("RFID", self.mouse_data["RFID"])
+        # Raise an exception if there is no mouse row
+        if mouse_row is None:
             raise Exception(f"Error: No mouse found with the given RFID ({self.mouse_data['RFID']}) in the database.")
+        self.mouse_row = mouse_row
         # Get the mouse ID and protocol frpom the mouse row.
-        mouse_ID, protocol = mouse_row[["Mouse_ID", "Protocol"]].values[0]
+        mouse_ID, protocol = mouse_row["Mouse_ID"], mouse_row["Protocol"]
 
         # if a task has been assigned to this mouse
-        if mouse_row["is_assigned"].values[0]:
+        if mouse_row["is_assigned"]:
             # if the current protocol is a task do so.
             if "task" in protocol:  # All tasks have "task" as a substring of their name
                 task = self.run_mouse_task(mouse_info_row=mouse_row)
@@ -276,10 +308,10 @@ class system_controller(Data_logger):
             self.mouse_data["entry_time"] = datetime.now()
             self.mouse_data["task"] = task
 
-            mouse_ID = mouse_row["Mouse_ID"].values[0]
-            experiment_name = mouse_row["Experiment"].values[0]
-            protocol = mouse_row["Protocol"].values[0]
-            task = mouse_row["Task"].values[0]
+            mouse_ID = mouse_row["Mouse_ID"]
+            experiment_name = mouse_row["Experiment"]
+            protocol = mouse_row["Protocol"]
+            task = mouse_row["Task"]
 
             # Save a copy of the taskfile that was run
             with open(os.path.join(get_path("tasks"), task + ".py"), "r") as f_:
@@ -304,24 +336,21 @@ class system_controller(Data_logger):
             self.board.start_framework()
 
             #  --------------- Update database on entry -------------------
-            database.mouse_df.loc[database.mouse_df["RFID"] == self.mouse_data["RFID"], "Current_weight"] = (
-                self.mouse_data["weight"]
-            )
-            database.mouse_df.loc[database.mouse_df["RFID"] == self.mouse_data["RFID"], "is_training"] = True
-            database.setup_df.loc[database.setup_df["COM"] == self.board.serial_port, "Mouse_training"] = mouse_ID
+            mouse_row.update({"Current_weight": self.mouse_data["weight"], "is_training": True})
+            database.update("setups", "COM", self.board.serial_port, {"Mouse_training": mouse_ID})
             # Update the tables from queue
             database.update_table_queue.append("setup_tab.list_of_setups")
             database.update_table_queue.append("system_tab.list_of_setups")
 
-    def run_mouse_task(self, mouse_info_row: pd.Series) -> None:
+    def run_mouse_task(self, mouse_info_row: "database.Row_handle") -> None:
         """
         Runs Mouse task from the information in the `mouse_info_row`
 
         Args:
-            mouse_info (pd.Series): Row of the database.mouse_df that corresponds the mouse that entered the experiment room
+            mouse_info (database.Row_handle): Row of the database.mouse_df that corresponds the mouse that entered the experiment room
         """
         # Get the name of the task
-        task = mouse_info_row["Task"].values[0]
+        task = mouse_info_row["Task"]
         # self.GUI.print_msg("Uploading: " + str(task), ac_pyc='pyc')
         emit_print_message(
             "Uploading: " + str(task),
@@ -331,84 +360,36 @@ class system_controller(Data_logger):
         #################################### Not working!
         # Set the state machine for the task
         self.board.setup_state_machine(sm_name=task)
-        # Set the `set_variables` for the task
-        if not pd.isnull(mouse_info_row["set_variables"].values):
-            # Dictionary of set variables are used to set Pycontrol board
-            set_variables = eval(mouse_info_row["set_variables"].values[0])
-            if set_variables:
-                for k, v in set_variables.items():
-                    self.board.set_variable(k[2:], eval(v))
-        # Set the `persistent_variables` for the task
-        if not pd.isnull(mouse_info_row["persistent_variables"].values):
-            persistent_variables = eval(mouse_info_row["persistent_variables"].values[0])
-            if persistent_variables:
-                for k, v in persistent_variables.items():
-                    if v != "auto":
-                        self.board.set_variable(k[2:], eval(v))
-
-    def run_mouse_protocol(self, mouse_info_row: pd.Series) -> str:
+        # Set the `set_variables` and then the `persistent_variables` for the task with a single board command.
+        mouse_ID = mouse_info_row["Mouse_ID"]
+        variables = {k[2:]: v for k, v in database.variables.get(mouse_ID, "set", task).items()}
+        for k, v in database.variables.get(mouse_ID, "persistent", task).items():
+            if v != "auto":
+                variables[k[2:]] = v
+        if variables:
+            self.board.set_variables(variables)
+
+    def run_mouse_protocol(self, mouse_info_row: "database.Row_handle") -> str:
         # If running a real protocol, handle (potential) update of protocol.
-        newStage = False
         try:
-            stage = int(mouse_info_row["Stage"].values[0])
+            stage = int(mouse_info_row["Stage"])
         except ValueError:
             # info
             print("ERROR:Stage not valid!!")
-        prot = mouse_info_row["Protocol"].values[0]
-        mouse_ID = mouse_info_row["Mouse_ID"].values[0]
-
-        protocol_path = os.path.join(get_path("prot"), prot)
-        mouse_prot = pd.read_csv(protocol_path, index_col=0)
-
-        # read last stage of training
-        logPth = os.path.join(get_path("mice"), mouse_ID + ".csv")
-        mouse_df_log = pd.read_csv(logPth)
-
-        # Protocol Stage row
-        current_protocol_stage = mouse_prot.iloc[stage]
-
-        ####################### LOGIC FOR CHECKING IF STAGE SHOULD BE INCREASED #################
-        ######### This logic is not tested as I do not know how to get things into the log for the mouse
-        # If the number of columns is more that 0:
-        if len(mouse_df_log) > 0:
-            # Get the final row of the dataframe (since this is the most up to date one.)
-            mouse_df_log = mouse_df_log.iloc[-1]
-            # Turn the string of a dict that is saved in the log into a variables dictionary
-            pycontrol_variables_dict = eval(mouse_df_log["Variables"])
-
-            if not pd.isnull(current_protocol_stage["threshV"]):
-                # Load in the String of list of lists
-                for k, thresh in eval(mouse_prot.loc[str(stage), "threshV"]):
-                    print(
-                        float(pycontrol_variables_dict[k]),
-                        float(thresh),
-                        float(pycontrol_variables_dict[k]) >= float(thresh),
-                    )
-                    if float(pycontrol_variables_dict[k]) >= float(thresh):
-                        newStage = True
-                        stage += 1
-
-        ########################################################################################
-
-        updated_stage_row = mouse_prot.iloc[stage]
-
-        task = updated_stage_row["task"]
+        mouse_ID = mouse_info_row["Mouse_ID"]
+        protocol = load_protocol(os.path.join(user_folder("protocol_dir"), mouse_info_row["Protocol"]))
+
+        # The stage is advanced if the variables at the end of the last session reached its thresholds.
+        mouse_log = Session_log(user_folder("mice_dir"), mouse_ID)
+        last_variables = mouse_log[-1]["Variables"] if len(mouse_log) > 0 else None
+        stage, task, variables = protocol.session_setup(stage, last_variables)
 
         # Updates the mouse_df to reflect any changes in the task stage or the mouse is in.
-        database.mouse_df.loc[database.mouse_df["RFID"] == self.mouse_data["RFID"], "Task"] = task
-        database.mouse_df.loc[database.mouse_df["RFID"] == self.mouse_data["RFID"], "Stage"] = stage
+        mouse_info_row.update({"Task": task, "Stage": stage})
 
         self.board.setup_state_machine(sm_name=task)
 
-        # handle setting varibles
-
-        for k, defV in eval(updated_stage_row["defaultV"]):
-            # Persistant veriables. They are set the same for every instance of the pycontrol statemachine
-            self.board.set_variable(k, float(defV))
-
-        if len(mouse_df_log) > 0:
-            if not newStage:  # newStage is False
-                for k in updated_stage_row["trackV"]:
-                    # Updated variables. They are changed based on the behaviour of the animal.
-                    self.board.set_variable(k, float(pycontrol_variables_dict[k]))
+        # Default variables and, if the stage has not changed, tracked variables are sent to the
+        # board with a single command.
+        self.board.set_variables(variables)
         return task
@@ -64,8 +64,10 @@ class ConfigureBoxDialog(QDialog):
 
     def load_access_control_framework(self):
         self.log_textbox.insertPlainText("Loading access control framework...")
-        database.controllers[self.setup_id].AC.reset()
-        database.controllers[self.setup_id].AC.load_framework()
+        controller = database.controllers[self.setup_id]
+        with controller.serial_lock:  # Stop the reader thread reading the board during REPL commands.
+            controller.AC.reset()
+            controller.AC.load_framework()
         self.log_textbox.insertPlainText("done!")
 
     def load_pyc_framework(self):
@@ -75,7 +77,9 @@ class ConfigureBoxDialog(QDialog):
         self.log_textbox.moveCursor(QTextCursor.MoveOperation.End)
 
     def disable_flashdrive(self):
-        database.controllers[self.setup_id].board.disable_flashdrive()
+        controller = database.controllers[self.setup_id]
+        with controller.serial_lock:
+            controller.board.disable_flashdrive()
 
     def load_hardware_definition(self):
         """Load a hardware definition for the Setup's pyControl board"""
@@ -89,7 +93,9 @@ class ConfigureBoxDialog(QDialog):
         self.log_textbox.insertPlainText("uploading hardware definition...")
         self.log_textbox.moveCursor(QTextCursor.MoveOperation.End)
 
-        database.controllers[self.setup_id].board.load_hardware_definition(hwd_path)
+        controller = database.controllers[self.setup_id]
+        with controller.serial_lock:
+            controller.board.load_hardware_definition(hwd_path)
         self.log_textbox.insertPlainText("done!")
 
     # ------------------------------------
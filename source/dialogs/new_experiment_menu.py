@@ -13,6 +13,7 @@ from source.tables.MouseListTable import MouseListTable
 
 import db as database
 from source.gui.settings import user_folder
+from source.utils.session_log import Session_log
 from . import InformationDialog
 
 
@@ -419,18 +420,7 @@ class NewExperimentDialog(QtWidgets.QDialog):
         self.CLT.fill_table()
 
     def _create_mouse_exp_log(self, mouse_ID):
-        df_ = pd.DataFrame(
-            columns=[
-                "entry_time",
-                "exit_time",
-                "weight",
-                "task",
-                "Variables",
-                "data_path",
-            ]
-        )
-        pth_ = os.path.join(user_folder("mice_dir"), mouse_ID + ".csv")
-        df_.to_csv(pth_)
+        Session_log(user_folder("mice_dir"), mouse_ID).clear()
 
     def run_experiment(self):
         """
@@ -451,47 +441,46 @@ class NewExperimentDialog(QtWidgets.QDialog):
                 if not os.path.isdir(mouse_exp_task_path):
                     os.mkdir(mouse_exp_task_path)
 
-                entry_nr = len(database.mouse_df)
-
-                database.mouse_df._append(pd.Series(), ignore_index=True)
-                # database.mouse_df.loc[entry_nr]
-                for col in database.mouse_df.columns:
-                    # conv_col_ix = self.mouse_df_tmp.col     #convereted column index
-                    if col in self.df_mouse_tmp.columns:
-                        database.mouse_df.loc[entry_nr, col] = row[col]
+                mouse_row = {col: row[col] for col in database.mouse_df.columns if col in self.df_mouse_tmp.columns}
+                database.insert("mice", mouse_row)
 
                 self._create_mouse_exp_log(row["Mouse_ID"])
 
-            database.mouse_df.to_csv(user_folder("mice_dataframe_filepath"))
             self.GUI.mouse_tab.mouse_table_widget.fill_table()
 
             # update experiment information
-            entry_nr = len(database.exp_df)
-            database.exp_df = pd.concat([database.exp_df, pd.Series(dtype="float64").to_frame().T], ignore_index=True)
-            database.exp_df.loc[entry_nr, "Name"] = self.set_experiment_name
-            database.exp_df.loc[entry_nr, "Setups"] = repr(self.df_setup_tmp["Setup_ID"].tolist())
-            database.exp_df.loc[entry_nr, "User"] = self.GUI.active_user
-            database.exp_df.loc[entry_nr, "Protocol"] = self.set_protocol
-            database.exp_df.loc[entry_nr, "Subjects"] = repr(self.df_mouse_tmp["Mouse_ID"].tolist())
-            database.exp_df.loc[entry_nr, "n_subjects"] = len(self.df_mouse_tmp["Mouse_ID"].values)
-            database.exp_df.loc[entry_nr, "Active"] = True
+            exp_row = {
+                "Name": self.set_experiment_name,
+                "Setups": repr(self.df_setup_tmp["Setup_ID"].tolist()),
+                "User": self.GUI.active_user,
+                "Protocol": self.set_protocol,
+                "Subjects": repr(self.df_mouse_tmp["Mouse_ID"].tolist()),
+                "n_subjects": len(self.df_mouse_tmp["Mouse_ID"].values),
+                "Active": True,
+            }
+            database.insert("experiments", exp_row)
 
             for stup in self.df_setup_tmp["Setup_ID"].values:
-                database.setup_df.loc[database.setup_df["Setup_ID"] == stup, "User"] = self.GUI.active_user
-
-                database.setup_df.loc[database.setup_df["Setup_ID"] == stup, "in_use"] = "Y"
-
-                database.setup_df.loc[database.setup_df["Setup_ID"] == stup, "Experiment"] = self.set_experiment_name
-                database.setup_df.loc[database.setup_df["Setup_ID"] == stup, "AC_state"] = "allow_entry"
-                database.setup_df.loc[database.setup_df["Setup_ID"] == stup, "Door_Mag"] = "0111"
-                database.setup_df.loc[database.setup_df["Setup_ID"] == stup, "Door_Sensor"] = "1111"
-                database.setup_df.loc[database.setup_df["Setup_ID"] == stup, "Protocol"] = self.set_protocol
-
                 mices_ = self.df_mouse_tmp["Mouse_ID"].loc[self.df_mouse_tmp["Setup_ID"] == stup].values
-                database.setup_df.loc[database.setup_df["Setup_ID"] == stup, "mice_in_setup"] = str(mices_)[1:-1]
-
-            database.exp_df.to_csv(user_folder("experiment_dataframe_filepath"))
-            database.setup_df.to_csv(user_folder("setup_dir_dataframe_filepath"))
+                database.update(
+                    "setups",
+                    "Setup_ID",
+                    stup,
+                    {
+                        "User": self.GUI.active_user,
+                        "in_use": "Y",
+                        "Experiment": self.set_experiment_name,
+                        "AC_state": "allow_entry",
+                        "Door_Mag": "0111",
+                        "Door_Sensor": "1111",
+                        "Protocol": self.set_protocol,
+                        "mice_in_setup": str(mices_)[1:-1],
+                    },
+                )
+            # Pre-upload the experiment's tasks to any setups that are already connected.
+            for stup in self.df_setup_tmp["Setup_ID"].values:
+                if stup in database.controllers:
+                    database.controllers[stup].stage_experiment_tasks()
             self.GUI.setup_tab.setup_table_widget.fill_table()
             self.GUI.system_tab.setup_table_widget.fill_table()
             self.GUI.system_tab.experiement_overview_table.fill_table()
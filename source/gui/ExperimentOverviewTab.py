@@ -16,7 +16,6 @@ from PyQt6 import QtWidgets
 from source.tables import ExperimentOverviewTable
 from source.dialogs import AreYouSureDialog, InformationDialog
 import db as database
-from source.gui.settings import user_folder
 
 
 class ExperimentOverviewTab(QtWidgets.QWidget):
@@ -120,9 +119,7 @@ class ExperimentOverviewTab(QtWidgets.QWidget):
         if not isinstance(running, bool):
             raise TypeError(f"The argument 'running' must be a bool. It is currently '{type(running)}'")
 
-        database.exp_df.loc[database.exp_df["Name"] == experiment_name, "Active"] = running
-        # write to disk
-        database.exp_df.to_csv(user_folder("experiment_dataframe_filepath"))
+        database.update("experiments", "Name", experiment_name, {"Active": running})
 
     def _get_mice_in_experiment(self, exp_row: pd.Series) -> List[str]:
         """Returns a list of mice in an experiement as a list of strings"""
@@ -166,21 +163,15 @@ class ExperimentOverviewTab(QtWidgets.QWidget):
         """
         for mouse in mice_in_exp:
             # Update status of mouse
-            database.mouse_df.loc[database.mouse_df["Mouse_ID"] == mouse, "is_assigned"] = assigned
-            database.mouse_df.loc[database.mouse_df["Mouse_ID"] == mouse, "in_system"] = assigned
-            # Save to disk
-            database.mouse_df.to_csv(user_folder("mice_dataframe_filepath"))
+            database.update("mice", "Mouse_ID", mouse, {"is_assigned": assigned, "in_system": assigned})
 
     def _update_setups(self, setups_in_exp, experiment=None):
         """Update the `setups_df`  to be assigned to tne experiment (argument to the function).
         Save this updated table to disk.
         """
         for setup in setups_in_exp:
-            # Update which experiment is the setup is assigned to.
-            database.setup_df.loc[database.setup_df["Setup_ID"] == setup, "Experiment"] = experiment
-            # If the setup has an experiment, then it is also in use.
-            database.setup_df.loc[database.setup_df["Setup_ID"] == setup, "in_use"] = experiment is not None
-            database.setup_df.to_csv(user_folder("setup_dir_dataframe_filepath"))
+            # Update which experiment is the setup is assigned to, if the setup has an experiment it is also in use.
+            database.update("setups", "Setup_ID", setup, {"Experiment": experiment, "in_use": experiment is not None})
 
     def _refresh(self):
         pass
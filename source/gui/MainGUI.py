@@ -25,7 +25,8 @@ class MainGUI(QMainWindow):
         self.setWindowTitle("pyControlHomeCage: Please log in")
         self.setGeometry(10, 30, 900, 800)  # Left, top, width, height.
 
-        database.setup_df["connected"] = False
+        for setup_id in database.setup_df["Setup_ID"].tolist():
+            database.update("setups", "Setup_ID", setup_id, {"connected": False})
 
         # Initialise tabs
         self.mouse_tab = MouseOverViewTab(self)
@@ -183,3 +184,9 @@ class MainGUI(QMainWindow):
         self.system_tab.logout_button.setEnabled(False)
         self.system_tab.login_button.setEnabled(True)
         self.system_tab.add_user_button.setEnabled(True)
+
+    ### Shutdown -------------------------------------------------------------------------------
+
+    def closeEvent(self, event) -> None:
+        database.flush()  # Write pending database changes before the application exits.
+        event.accept()
@@ -1,7 +1,5 @@
 import numpy as np
 import os
-import pandas as pd
-import json
 
 from PyQt6.QtWidgets import (
     QWidget,
@@ -23,6 +21,7 @@ from source.dialogs import (
 )
 from source.tables import MouseTable, VariablesTable
 from ..utils import get_variables_and_values_from_taskfile
+from source.utils.variable_store import parse_value
 import db as database
 from source.gui.settings import user_folder
 
@@ -118,7 +117,7 @@ class MouseOverViewTab(QWidget):
             # all_variables =  self.variables_table.subject_variable_names[ms_rfid]
             persistent_variables_dict = dict(
                 [
-                    (str(i["name"]), i["value"].strip())
+                    (str(i["name"]), parse_value(i["value"]))
                     for i in all_variables
                     if ((i["subject"] == ms_rfid) and (i["persistent"]))
                 ]
@@ -126,7 +125,7 @@ class MouseOverViewTab(QWidget):
             # summary variables are send with the data
             summary_variables_dict = dict(
                 [
-                    (str(i["name"]), i["value"].strip())
+                    (str(i["name"]), parse_value(i["value"]))
                     for i in all_variables
                     if ((i["subject"] == ms_rfid) and (i["summary"]))
                 ]
@@ -134,23 +133,18 @@ class MouseOverViewTab(QWidget):
             # set variables are different to default values in the task file but not persistent across sessions
             set_variables_dict = dict(
                 [
-                    (str(i["name"]), i["value"].strip())
+                    (str(i["name"]), parse_value(i["value"]))
                     for i in all_variables
                     if ((i["subject"] == ms_rfid) and not (i["persistent"]) and i["set"])
                 ]
             )
 
-            database.mouse_df.loc[database.mouse_df["RFID"] == float(ms_rfid), "summary_variables"] = json.dumps(
-                summary_variables_dict
-            )
-            database.mouse_df.loc[database.mouse_df["RFID"] == float(ms_rfid), "persistent_variables"] = json.dumps(
-                persistent_variables_dict
-            )
-            database.mouse_df.loc[database.mouse_df["RFID"] == float(ms_rfid), "set_variables"] = json.dumps(
-                set_variables_dict
-            )
-
-            database.mouse_df.to_csv(user_folder("mice_dataframe_filepath"))
+            # Variables are saved for the task the mouse is currently running.
+            mouse_row = database.mouse_index.row("RFID", float(ms_rfid))
+            mouse_ID, task = mouse_row["Mouse_ID"], mouse_row["Task"]
+            database.variables.set(mouse_ID, "summary", summary_variables_dict, task)
+            database.variables.set(mouse_ID, "persistent", persistent_variables_dict, task)
+            database.variables.set(mouse_ID, "set", set_variables_dict, task)
 
     def update_variables_filter(self):
         self.variables_table.setEnabled(True)
@@ -183,21 +177,15 @@ class MouseOverViewTab(QWidget):
 
         self.variables_table.set_available_subjects(RFIDs)
         for sel_RFID in RFIDs:
-            mouseRow = database.mouse_df.loc[database.mouse_df["RFID"] == float(sel_RFID)]
+            mouseRow = database.mouse_index.row("RFID", float(sel_RFID))
             # print(mouseRow)
-            mouseTask = mouseRow["Task"].values[0] + ".py"
-
-            summary_variables = {}
-            persistent_variables = {}
-            set_variables = {}
-            if not pd.isnull(mouseRow["summary_variables"].values):
-                summary_variables = eval(mouseRow["summary_variables"].values[0])
-            if not pd.isnull(mouseRow["persistent_variables"].values):
-                persistent_variables = eval(mouseRow["persistent_variables"].values[0])
-            if not pd.isnull(mouseRow["set_variables"].values):
-                set_variables = eval(
-                    mouseRow["set_variables"].values[0]
-                )  # set variables are persistent variables that are not updated. Is this necessary?? YES
+            mouseID, mouseTask = mouseRow["Mouse_ID"], mouseRow["Task"]
+
+            summary_variables = database.variables.get(mouseID, "summary", mouseTask)
+            persistent_variables = database.variables.get(mouseID, "persistent", mouseTask)
+            # set variables are persistent variables that are not updated. Is this necessary?? YES
+            set_variables = database.variables.get(mouseID, "set", mouseTask)
+            mouseTask = mouseTask + ".py"
 
             task_dir = user_folder("task_dir")
             task_path = os.path.join(task_dir, mouseTask)
@@ -215,11 +203,11 @@ class MouseOverViewTab(QWidget):
 
                     # set varaible has lesser priority than persistent
                     if k in set_variables.keys():
-                        v = set_variables[k]
+                        v = repr(set_variables[k])
                         set_var = True
                     # if the variable in persistent, store that it is persistent and store its value
                     if k in persistent_variables.keys():
-                        v = persistent_variables[k]
+                        v = repr(persistent_variables[k])
                         persistent = True
                     if k in summary_variables.keys():
                         summary = True
@@ -266,8 +254,7 @@ class MouseOverViewTab(QWidget):
             sure.exec()
             if sure.GO:
                 for ch_ in isChecked:
-                    database.mouse_df.loc[database.mouse_df["RFID"] == ch_, "in_system"] = False
-                    database.mouse_df.to_csv(user_folder("mice_dataframe_filepath"))
+                    database.update("mice", "RFID", ch_, {"in_system": False})
 
                     self.mouse_table_widget.fill_table()
 
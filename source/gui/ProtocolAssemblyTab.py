@@ -16,7 +16,7 @@ from functools import partial
 import pandas as pd
 
 from ..utils import get_variables_from_taskfile, get_tasks
-from ..utils import validate_lineedit_number
+from ..utils import validate_lineedit_number, write_csv_atomic
 from source.tables import ProtocolTable
 from source.dialogs import InformationDialog
 from source.gui.settings import user_folder
@@ -323,7 +323,7 @@ class ProtocolAssemblyTab(QWidget):
         save_path = os.path.join(user_folder("protocol_dir"), self.protocol_name + ".prot")
         print("Saving protocol:", save_path)
         # Save the protocal as a CSV with the extension as .prot
-        self.protocol_df.to_csv(save_path)
+        write_csv_atomic(self.protocol_df, save_path)
 
     def load_protocol(self):
         protocol_dir = user_folder("protocol_dir")
@@ -26,7 +26,6 @@ from source.dialogs import (
 from source.tables import SetupTable
 from ..utils import find_pyboards
 import db as database
-from source.gui.settings import user_folder
 
 
 class SetupsOverviewTab(QWidget):
@@ -174,28 +173,22 @@ class SetupsOverviewTab(QWidget):
             info.exec()
 
     def add_cage(self):
-        entry_nr = len(database.setup_df)
-
         # add a check to see that something about the cage has been filled in
         if not (self.cat_combo_box.currentIndex() == 0 or self.setup_name.text() is None):
             # first fill row with NA
-            database.setup_df.loc[entry_nr] = ["none"] * len(database.setup_df.columns)
+            setup_row = dict.fromkeys(database.setup_df.columns, "none")
 
             # get and set the USB port key
-            COM = self.cat_combo_box.itemText(self.cat_combo_box.currentIndex())
-            database.setup_df.loc[entry_nr, "COM"] = COM
-
-            COM_AC = self.cact_combo_box.itemText(self.cact_combo_box.currentIndex())
-            database.setup_df.loc[entry_nr, "COM_AC"] = COM_AC
+            setup_row["COM"] = self.cat_combo_box.itemText(self.cat_combo_box.currentIndex())
+            setup_row["COM_AC"] = self.cact_combo_box.itemText(self.cact_combo_box.currentIndex())
 
             # get the name of the setup
-            database.setup_df.loc[entry_nr, "Setup_ID"] = self.setup_name.text()
+            setup_row["Setup_ID"] = self.setup_name.text()
+            database.insert("setups", setup_row)
 
         # self.parent()._refresh_tables()
         database.update_table_queue = ["all"]
 
-        database.setup_df.to_csv(user_folder("setup_dir_dataframe_filepath"))
-
     def _refresh(self):
         """Find which pyControl Boards are available"""
 
@@ -240,7 +233,7 @@ class SetupsOverviewTab(QWidget):
             sure = AreYouSureDialog(question_text="Are you should you would like to remove the selected setups?")
             sure.exec()
             if sure.GO:
-                database.setup_df = database.setup_df.drop(database.setup_df.index[isChecked])
+                database.delete("setups", "Setup_ID", database.setup_df["Setup_ID"][isChecked].tolist())
                 self.setup_table_widget.fill_table()
         else:
             info = InformationDialog(info_text="No setups were selected to be removed")
@@ -1,7 +1,7 @@
 import os
 import json
 
-VERSION = "2.0.2"
+VERSION = "2.0.3"
 
 # Get DATA_DIR  from the config file
 config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "configs", "config.json")
@@ -39,9 +39,13 @@ def get_setting(setting_type, setting_name, want_default=False):
             "setup_dir_dataframe_filepath": os.path.join(DATA_DIR, "setups", "setups.csv"),  # Setups df filepath
             "mice_dir": os.path.join(DATA_DIR, "mice"),  # Mice directory
             "mice_dataframe_filepath": os.path.join(DATA_DIR, "mice", "mice.csv"),  # Mice df filepath
+            "database_filepath": os.path.join(DATA_DIR, "homecage.db"),  # Mice, setups, experiments and tasks
             "data_dir": os.path.join(DATA_DIR, "data"),
             "AC_logger_dir": os.path.join(DATA_DIR, "loggers"),
             "protocol_dir": os.path.join(DATA_DIR, "prot"),
+            "mpy_cache_dir": os.path.join(DATA_DIR, "mpy_cache"),  # Compiled .mpy files
+            "session_cache_dir": os.path.join(DATA_DIR, "session_cache"),  # Parsed session files
+            "device_index_filepath": os.path.join(DATA_DIR, "device_index.json"),  # Device dependency cache
             # Package paths
             # "framework_dir": os.path.join(package_path, "pyControl"),
             # "devices_dir": os.path.join(package_path, "devices"),
@@ -58,13 +62,19 @@ def get_setting(setting_type, setting_name, want_default=False):
             "ui_font_size": 11,
             "log_font_size": 9,
         },
+        "pyboard": {
+            "compile_mpy": False,  # Upload framework, device and task files as precompiled .mpy bytecode.
+        },
+        "data_logging": {
+            "binary_session_file": False,  # Also save sessions as binary .session files (see utils/session_file.py).
+        },
     }
 
     json_path = os.path.join("config", "settings.json")
     if os.path.exists(json_path) and not want_default:  # user has a settings.json
         with open(json_path, "r", encoding="utf-8") as f:
             custom_settings = json.loads(f.read())
-        if setting_name in custom_settings[setting_type]:
+        if setting_name in custom_settings.get(setting_type, {}):
             return custom_settings[setting_type][setting_name]
         else:
             return default_user_settings[setting_type][setting_name]
@@ -0,0 +1,69 @@
+# Binary message format used by the access control board to send messages to the computer.
+# This module is imported both on the pyboard (MicroPython) and on the computer, so that the
+# key and state tables used to encode and decode messages can not get out of sync.
+#
+# Each message is sent as a frame:
+#     b'\x07' + checksum (2 bytes) + message_len (2 bytes) + message
+# where message = timestamp (4 bytes) + key (1 byte) + payload type (1 byte) + payload.
+# The checksum is the sum of the message bytes & 0xFFFF.  All integers are little endian.
+
+import struct
+
+FRAME_START = 0x07
+HEADER_LEN = 5  # Start byte + 2 checksum bytes + 2 message length bytes.
+MAX_PAYLOAD_LEN = 256  # Longer string payloads are truncated.
+MAX_MESSAGE_LEN = 6 + MAX_PAYLOAD_LEN  # Longer message lengths are not valid frames.
+
+# Message keys, sent as their index in this tuple.
+MSG_KEYS = (
+    "error",
+    "state",
+    "weight",
+    "raw_weigh",
+    "baseline_esitimate",
+    "door0_closed",
+    "door0_open",
+    "temp_w",
+    "temp_w_out",
+    "RFID",
+    "calT",
+    "calC",
+    "calW",
+)
+
+# Access control states, sent as their index in this tuple by the 'state' key.
+STATES = (
+    "allow_entry",
+    "wait_close",
+    "check_mouse",
+    "enter_training_chamber",
+    "check_mouse_in_training",
+    "mouse_training",
+    "check_mouse_in_ac",
+    "allow_exit",
+    "check_exit",
+    "error_state",
+)
+
+# Payload types.
+FLOAT = 0x66  # b'f' 4 byte float.
+INT = 0x69  # b'i' 4 byte signed integer.
+ENUM = 0x65  # b'e' 1 byte index into STATES.
+STRING = 0x73  # b's' utf-8 string.
+NONE = 0x6E  # b'n' no payload.
+
+
+def encode_msg(timestamp, key, value):
+    """Return the frame for message with key from MSG_KEYS and value."""
+    if value is None:
+        payload_type, payload = NONE, b""
+    elif isinstance(value, float):
+        payload_type, payload = FLOAT, struct.pack("<f", value)
+    elif isinstance(value, int) and -0x80000000 <= value < 0x80000000:
+        payload_type, payload = INT, struct.pack("<i", value)
+    elif key == "state" and value in STATES:
+        payload_type, payload = ENUM, bytes([STATES.index(value)])
+    else:
+        payload_type, payload = STRING, str(value).encode()[:MAX_PAYLOAD_LEN]
+    message = struct.pack("<IBB", timestamp & 0xFFFFFFFF, MSG_KEYS.index(key), payload_type) + payload
+    return struct.pack("<BHH", FRAME_START, sum(message) & 0xFFFF, len(message)) + message
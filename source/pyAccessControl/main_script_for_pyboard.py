@@ -2,6 +2,7 @@ import pyb
 from pyAccessControl.access_control_1_0 import Access_control_upy
 import time
 from pyAccessControl.pin_classes import signal_pin, magnet_pin
+from pyAccessControl.ac_protocol import encode_msg
 
 
 class handler:
@@ -54,11 +55,11 @@ class handler:
         TWO_MICE = 100
         NEWSTATE = True
         state = "allow_entry"
-        build_msg = (
-            lambda x: "start_" + x + "_end"
-        )  # function to wrap messages sent to the main computer from microcontroller
+        send_msg = lambda key, value: com.write(
+            encode_msg(pyb.millis(), key, value)
+        )  # function to send framed messages to the main computer from microcontroller
 
-        com.write(build_msg("state:" + state))
+        send_msg("state", state)
         for mag in [0, 1, 2, 3]:
             MAGs[mag].value(0)  # this should be 0
 
@@ -82,15 +83,15 @@ class handler:
                 # Update baseline every second
                 if pyb.elapsed_millis(baseline_counter) >= 1000:
                     AC_handler.loadcell.update_baseline()
-                    com.write(build_msg("weight:" + str(AC_handler.loadcell.weigh())))
-                    com.write(build_msg("raw_weigh:" + str(AC_handler.loadcell.weigh(raw=True))))
-                    com.write(build_msg("baseline_esitimate:" + str(AC_handler.loadcell.baseline)))
+                    send_msg("weight", AC_handler.loadcell.weigh())
+                    send_msg("raw_weigh", AC_handler.loadcell.weigh(raw=True))
+                    send_msg("baseline_esitimate", AC_handler.loadcell.baseline)
                     baseline_counter = micros.counter()
 
                 if state == "allow_entry":
                     # last_weight = self.baseline_alpha*AC_handler.loadcell.weigh(times=1) + (1-self.baseline_alpha)*last_weight
                     if NEWSTATE:
-                        com.write(build_msg("state:" + state))
+                        send_msg("state", state)
                         NEWSTATE = False
 
                     for mag in range(4):
@@ -110,11 +111,11 @@ class handler:
 
                 if state == "wait_close":
                     if NEWSTATE:
-                        com.write(build_msg("state:" + state))
+                        send_msg("state", state)
                         NEWSTATE = False
 
                     if P_read_en1.value() == 0:  # if entry door is closed again
-                        com.write(build_msg("door0_closed:" + str(P_read_en1.measured_value)))
+                        send_msg("door0_closed", P_read_en1.measured_value)
                         ## This is an extra check step to try to help prevent the door from being unnecessarily closed
                         weight = AC_handler.loadcell.weigh()
                         if weight < ONE_MOUSE:
@@ -131,7 +132,7 @@ class handler:
                             pyb.delay(self.forced_delay)
                             last_check = micros.counter()
                     else:
-                        com.write(build_msg("door0_open:" + str(P_read_en1.measured_value)))
+                        send_msg("door0_open", P_read_en1.measured_value)
                     weight = AC_handler.loadcell.weigh()
                     # if weight>ONE_MOUSE:
                     #    if millis_since_check_wait_close is None:
@@ -148,13 +149,13 @@ class handler:
                 if state == "check_mouse":
                     if NEWSTATE:
                         millis_since_check_wait_close = None
-                        com.write(build_msg("state:" + state))
+                        send_msg("state", state)
                         NEWSTATE = False
 
                     weights = []
                     for _ in range(50):
                         weight = AC_handler.loadcell.weigh(times=1)
-                        com.write(build_msg("temp_w:" + str(weight)))
+                        send_msg("temp_w", weight)
                         pyb.delay(10)
                         weights.append(weight)
 
@@ -176,7 +177,7 @@ class handler:
 
                     weight = weight - self.baseline_read
                     # weight = 25
-                    com.write(build_msg("weight:" + str(weight)))
+                    send_msg("weight", weight)
 
                     # if more than one mouse got in
                     if weight > TWO_MICE:
@@ -191,7 +192,7 @@ class handler:
                         pyb.delay(self.forced_delay)
                     else:
                         com.write("1 mice")
-                        com.write(build_msg("weight:" + str(weight)))
+                        send_msg("weight", weight)
                         getRFID = True
                         st_check = time.time()
                         com.write("confirmed")
@@ -200,7 +201,7 @@ class handler:
                             pyb.delay(50)
                             # if read an RFID TAG
                             if rfid is not None:
-                                com.write(build_msg("RFID:" + str(rfid)))
+                                send_msg("RFID", rfid)
                                 getRFID = False
                                 state = "enter_training_chamber"
                                 NEWSTATE = True
@@ -219,7 +220,7 @@ class handler:
                 # opened leave this state
                 if state == "enter_training_chamber":
                     if NEWSTATE:
-                        com.write(build_msg("state:" + state))
+                        send_msg("state", state)
                         NEWSTATE = False
                     for mag in range(4):
                         if mag in [0, 2, 3]:
@@ -237,7 +238,7 @@ class handler:
                 # the mouse has left
                 if state == "check_mouse_in_training":
                     if NEWSTATE:
-                        com.write(build_msg("state:" + state))
+                        send_msg("state", state)
                         NEWSTATE = False
                         MAGs[1].value(1)
 
@@ -257,7 +258,7 @@ class handler:
 
                 if state == "mouse_training":  # now the mouse is in the training apparatus
                     if NEWSTATE:
-                        com.write(build_msg("state:" + state))
+                        send_msg("state", state)
                         NEWSTATE = False
 
                     for mag in range(4):
@@ -275,7 +276,7 @@ class handler:
 
                 if state == "check_mouse_in_ac":
                     if NEWSTATE:
-                        com.write(build_msg("state:" + state))
+                        send_msg("state", state)
                         NEWSTATE = False
 
                     if P_read_ex1.value() == 0:
@@ -294,11 +295,11 @@ class handler:
                             pyb.delay(self.forced_delay)
                 if state == "allow_exit":
                     if NEWSTATE:
-                        com.write(build_msg("state:" + state))
+                        send_msg("state", state)
                         NEWSTATE = False
 
                     weight = AC_handler.loadcell.weigh(times=1)
-                    com.write(build_msg("temp_w_out:" + str(weight)))
+                    send_msg("temp_w_out", weight)
 
                     for mag in range(4):
                         if mag in [0, 1, 2]:
@@ -315,7 +316,7 @@ class handler:
 
                 if state == "check_exit":
                     if NEWSTATE:
-                        com.write(build_msg("state:" + state))
+                        send_msg("state", state)
                         NEWSTATE = False
 
                     if P_read_ex2.value() == 0:  # if exit door is closed
@@ -333,7 +334,7 @@ class handler:
 
                 if state == "error_state":
                     if not has_send_error:
-                        com.write(build_msg("state:" + "error_state"))
+                        send_msg("state", "error_state")
                         has_send_error = True
                     for mag in range(4):
                         MAGs[mag].value(0)
@@ -346,34 +347,34 @@ class handler:
                         AC_handler.loadcell.tare()
                         weight = AC_handler.loadcell.weigh()
                         pyb.delay(10)
-                        com.write(build_msg("calT:" + str(weight)))
+                        send_msg("calT", weight)
                     elif "calibrate" in sent_data:
                         w_ = float(sent_data[10:])
                         AC_handler.loadcell.calibrate(weight=w_)
                         # com.write(build_message(str(sent_data)))
                         weight = AC_handler.loadcell.weigh()
                         pyb.delay(10)
-                        com.write(build_msg("calC:" + str(weight)))
+                        send_msg("calC", weight)
                     elif sent_data == "weigh":
                         weight = AC_handler.loadcell.weigh()
                         pyb.delay(10)
-                        com.write(build_msg("calW:" + str(weight)))
+                        send_msg("calW", weight)
                     elif sent_data == "read_tag":
                         start_time = time.time()
                         while time.time() - start_time < 10:
                             rfid = AC_handler.rfid.read_tag()
                             pyb.delay(500)
                             if rfid is not None:
-                                com.write(build_msg("RFID:" + str(rfid)))
+                                send_msg("RFID", rfid)
                                 break
                         else:
-                            com.write(build_msg("RFID:" + str(None)))
+                            send_msg("RFID", None)
         except Exception as e:
             for mag in range(4):
                 MAGs[mag].value(0)  # Open all doors by default
             state = "error_state"
-            com.write(build_msg("state:" + str(state)))
-            com.write(build_msg(str(e)))
+            send_msg("state", state)
+            send_msg("error", str(e))
             r_led.off()
 
 
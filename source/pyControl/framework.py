@@ -6,7 +6,7 @@ from . import state_machine as sm
 from . import hardware as hw
 from . import utility as ut
 
-VERSION = "2.0.2"
+VERSION = "2.0.3"
 
 
 class pyControlError(BaseException):  # Exception for pyControl errors.
@@ -116,6 +116,14 @@ def receive_data():
                 v_name = data_str[1:]
                 v_value = sm.get_variable(v_name)
                 data_output_queue.put(Datatuple(current_time, VARBL_TYP, "g", ujson.dumps({v_name: v_value})))
+            elif data_str[0] == "S":  # Set multiple variables, output those set OK in one message.
+                v_dict = eval(data_str[2:])
+                set_OK = sm.set_variables(v_dict)
+                set_dict = {v_name: v_value for v_name, v_value in v_dict.items() if set_OK[v_name]}
+                data_output_queue.put(Datatuple(current_time, VARBL_TYP, data_str[1], ujson.dumps(set_dict)))
+            elif data_str[0] == "G":  # Get multiple variables.
+                v_dict = sm.get_variables(eval(data_str[1:]))
+                data_output_queue.put(Datatuple(current_time, VARBL_TYP, "g", ujson.dumps(v_dict)))
         elif new_byte == EVENT_TYP:  # Trigger event command.
             subtype = data_str[0]
             event_ID = int(data_str[1:])
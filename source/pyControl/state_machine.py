@@ -109,3 +109,15 @@ def get_variable(v_name):
         return getattr(variables, v_name)
     except Exception:
         return None  # Bad variable name
+
+
+def set_variables(v_dict):
+    # Set values of variables {v_name: v_value}, return dict {v_name: set_OK}.
+    return {v_name: set_variable(v_name, v_value) for v_name, v_value in v_dict.items()}
+
+
+def get_variables(v_names=None):
+    # Return dict {v_name: v_value} of specified variables, or of all variables if v_names is None.
+    if v_names is None:
+        return {k: v for k, v in variables.__dict__.items() if not hasattr(v, "__init__")}
+    return {v_name: get_variable(v_name) for v_name in v_names}
@@ -1,9 +1,7 @@
-import time
 from typing import List
 
 from PyQt6 import QtCore, QtWidgets
 import db as database
-from source.gui.settings import user_folder
 
 
 class ExperimentOverviewTable(QtWidgets.QTableWidget):
@@ -95,18 +93,14 @@ class ExperimentOverviewTable(QtWidgets.QTableWidget):
                     print(exp_name)
                     handler_ = [setup_ for k, setup_ in database.controllers.items() if k == setup][0]
 
-                    handler_.board.stop_framework()
-                    time.sleep(0.05)
-                    handler_.board.process_data()
-                    handler_.close_files()
-                    handler_.board.reset()
+                    with handler_.serial_lock:
+                        handler_.stop_session()
+                        handler_.board.reset()
 
-                    database.exp_df.loc[database.exp_df["Name"] == exp_name, "Active"] = False
-                    database.setup_df.loc[database.setup_df["Setup_ID"] == setup, "Experiment"] = None
-                    database.setup_df.to_csv(user_folder("setup_dir_dataframe_filepath"))
-                    database.exp_df.to_csv(user_folder("experiment_dataframe_filepath"))
+                    database.update("experiments", "Name", exp_name, {"Active": False})
+                    database.update("setups", "Setup_ID", setup, {"Experiment": None})
 
                     print("CLOSED")
 
                 for subject in eval(database.exp_df.loc[database.exp_df["Name"] == exp_name, "Subjects"].values[0]):
-                    database.mouse_df.loc[database.mouse_df["Mouse_ID"] == subject, "in_system"] = False
+                    database.update("mice", "Mouse_ID", subject, {"in_system": False})
@@ -4,7 +4,6 @@ from PyQt6 import QtCore, QtWidgets
 
 from ..utils import get_tasks
 import db as database
-from source.gui.settings import user_folder
 
 
 class MouseTable(QtWidgets.QTableWidget):
@@ -90,9 +89,6 @@ class MouseTable(QtWidgets.QTableWidget):
     def change_mouse_task(self, combo: QtWidgets.QComboBox) -> None:
         """Change what task mouse is doing within the mouse_df"""
 
-        database.mouse_df.loc[database.mouse_df["RFID"] == combo.RFID, "Task"] = combo.currentText()
-
-        # Save the updated dataframe to disk
-        database.mouse_df.to_csv(user_folder("mice_dataframe_filepath"))
+        database.update("mice", "RFID", combo.RFID, {"Task": combo.currentText()})
         # fill the table again since the data has been updated
         self.fill_table()
@@ -106,7 +106,7 @@ class SetupTable(QTableWidget):
                 database.controllers[setup_id].disconnect()
                 print(f"Disconnected from Setup {setup_id}")
                 del database.controllers[setup_id]
-                database.setup_df.loc[database.setup_df["Setup_ID"] == setup_id, "connected"] = False
+                database.update("setups", "Setup_ID", setup_id, {"connected": False})
                 self.fill_table()
         elif action == calibration_action:
             if setup_id not in database.controllers:
@@ -183,6 +183,7 @@ class SetupTable(QTableWidget):
             send_name = self.sender().name
             self._fill_setup_df_row(send_name)
             database.controllers[setup_id] = SC
+            SC.stage_experiment_tasks()
             time.sleep(0.05)
             self.tab.callibrate_dialog = CalibrationDialog(access_control_pyboard=access_control_board)
             # database.print_consumers[MessageRecipient.calibrate_dialog] = self.tab.callibrate_dialog.print_msg
@@ -223,9 +224,8 @@ class SetupTable(QTableWidget):
 
     def _fill_setup_df_row(self, sender_name: list[str]) -> None:
         _, com_, _ = sender_name
-        database.setup_df["connected"].loc[database.setup_df["COM"] == com_] = True  # Connected to AC board
-        database.setup_df["in_use"].loc[database.setup_df["COM"] == com_] = False  # Setup not in use on init
-        database.setup_df["n_mice"].loc[database.setup_df["COM"] == com_] = 0  # Number of mice in setup on init
+        # Connected to AC board, setup not in use and no mice in setup on init.
+        database.update("setups", "COM", com_, {"connected": True, "in_use": False, "n_mice": 0})
 
     def _refresh(self):
         """Refresh the table.
@@ -0,0 +1,76 @@
+import os
+import numpy as np
+
+# ----------------------------------------------------------------------------------------
+#  Analog_times
+# ----------------------------------------------------------------------------------------
+
+
+class Analog_times:
+    """Times in seconds of the samples of an analog recording, computed from the recording's
+    time segments when indexed, so the times of a long recording are never all held in memory
+    unless asked for.  Supports len(), integer, slice and array indexing and np.asarray()."""
+
+    def __init__(self, segments, n_samples):
+        self.segment_samples = np.asarray(segments["sample"], dtype=np.int64)
+        self.segment_times = np.asarray(segments["time"], dtype=np.float64)
+        self.sampling_rates = np.asarray(segments["sampling_rate"], dtype=np.float64)
+        self.n_samples = n_samples
+
+    def __len__(self):
+        return self.n_samples
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            samples = np.arange(*index.indices(self.n_samples))
+        else:
+            samples = np.asarray(index)
+            if samples.dtype == bool:
+                samples = np.flatnonzero(samples)
+            samples = np.where(samples < 0, samples + self.n_samples, samples)
+            if np.any((samples < 0) | (samples >= self.n_samples)):
+                raise IndexError("sample index out of range")
+        segment = np.searchsorted(self.segment_samples, samples, side="right") - 1
+        return self.segment_times[segment] + (samples - self.segment_samples[segment]) / self.sampling_rates[segment]
+
+    def __array__(self, dtype=None, copy=None):
+        return self[:].astype(dtype) if dtype else self[:]
+
+
+# ----------------------------------------------------------------------------------------
+#  Loading
+# ----------------------------------------------------------------------------------------
+
+
+def load_analog(path_stem):
+    """Return (times, data) of the analog recording saved by Analog_writer with files
+    <path_stem>.data.npy and <path_stem>.time_segments.npy (or <path_stem>.time.npy for
+    recordings saved by earlier versions).  data is memory mapped, times is an Analog_times
+    or, for earlier recordings, a memory mapped array.  Recordings whose files were not closed
+    are recovered."""
+    data = load_npy(path_stem + ".data.npy")
+    segments_path = path_stem + ".time_segments.npy"
+    if os.path.exists(segments_path):
+        times = Analog_times(np.array(load_npy(segments_path)), len(data))
+    else:
+        times = load_npy(path_stem + ".time.npy")
+    return times, data
+
+
+def load_npy(file_path):
+    """Return the 1D array in the .npy file at file_path memory mapped.  If the file was not
+    closed by its Npy_writer (e.g. the program stopped during a session) its header has not
+    been updated, the number of samples is then found from the file size."""
+    with open(file_path, "rb") as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        data_offset = f.tell()
+        n_samples = (os.fstat(f.fileno()).st_size - data_offset) // dtype.itemsize
+    if len(shape) == 1 and n_samples > shape[0]:
+        shape = (n_samples,)  # Header was not updated.
+    if not np.prod(shape):  # Empty arrays can not be memory mapped.
+        return np.zeros(shape, dtype)
+    return np.memmap(file_path, dtype, "r", data_offset, shape, order="F" if fortran_order else "C")
@@ -0,0 +1,507 @@
+import os
+import math
+import sqlite3
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+import pandas as pd
+
+# ----------------------------------------------------------------------------------------
+#  Table definitions.
+# ----------------------------------------------------------------------------------------
+
+# {table_name: {"columns": default columns, "indexes": indexed columns,
+#               "bool_columns": columns holding True/False,
+#               "dtypes": {column: dtype of column in DataFrames, other columns hold python objects}}}
+TABLES = {
+    "tasks": {
+        "columns": ["Name", "User_added"],
+        "indexes": ["Name"],
+        "bool_columns": ["User_added"],
+        "dtypes": {},
+    },
+    "experiments": {
+        "columns": ["Name", "Setups", "Subjects", "n_subjects", "User", "Protocol", "Active", "Persistent_variables"],
+        "indexes": ["Name"],
+        "bool_columns": ["Active"],
+        "dtypes": {"User": "category", "n_subjects": "int64"},
+    },
+    "setups": {
+        "columns": [
+            "Setup_ID",
+            "COM",
+            "COM_AC",
+            "in_use",
+            "connected",
+            "User",
+            "Experiment",
+            "Protocol",
+            "Mouse_training",
+            "AC_state",
+            "Door_Mag",
+            "Door_Sensor",
+            "n_mice",
+            "mice_in_setup",
+            "logger_path",
+        ],
+        "indexes": ["Setup_ID", "COM", "COM_AC"],
+        "bool_columns": ["in_use", "connected"],
+        "dtypes": {"Setup_ID": "category", "User": "category", "Experiment": "category"},
+    },
+    "setup_status": {  # Access control state published by the GUI, read by the security daemon.
+        "columns": ["Setup_ID", "Logger_start", "Last_message", "Last_message_time", "State"],
+        "indexes": ["Setup_ID"],
+        "bool_columns": [],
+        "dtypes": {},
+    },
+    "mice": {
+        "columns": [
+            "Mouse_ID",
+            "RFID",
+            "Sex",
+            "Age",
+            "Experiment",
+            "Protocol",
+            "Stage",
+            "Task",
+            "User",
+            "Start_date",
+            "Current_weight",
+            "Start_weight",
+            "is_training",
+            "is_assigned",
+            "training_log",
+            "Setup_ID",
+            "in_system",
+            "summary_variables",
+            "persistent_variables",
+            "set_variables",
+        ],
+        "indexes": ["Mouse_ID", "RFID", "Setup_ID"],
+        "bool_columns": ["is_training", "is_assigned", "in_system", "RUN_ERROR"],
+        "dtypes": {
+            "RFID": "int64",
+            "Setup_ID": "category",
+            "User": "category",
+            "Experiment": "category",
+            "Current_weight": "float64",
+            "Start_weight": "float64",
+        },
+    },
+    "variables": {  # Rows identified by Key, see variable_store.py.
+        "columns": ["Key", "Mouse_ID", "Task", "Kind", "Version", "Value"],
+        "indexes": ["Key", "Mouse_ID"],
+        "bool_columns": [],
+        "dtypes": {},
+    },
+}
+
+
+def _to_sql(value):
+    """Convert a DataFrame value to a type that can be stored by sqlite, missing values are stored as NULL."""
+    if hasattr(value, "item") and not isinstance(value, (str, bytes)):
+        value = value.item()  # numpy scalar.
+    if value is None or value is pd.NA or value is pd.NaT or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, (bool, int, float, str, bytes)):
+        return value
+    return str(value)
+
+
+def apply_schema(df, table):
+    """Convert the columns of df to the dtypes in the table definition.  Columns whose values
+    do not fit the dtype (e.g. an int64 column with missing values) are left unchanged."""
+    for column, dtype in TABLES[table]["dtypes"].items():
+        if column in df:
+            try:
+                df[column] = df[column].astype(dtype)
+            except (TypeError, ValueError):
+                pass
+    return df
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+# ----------------------------------------------------------------------------------------
+#  Database_store
+# ----------------------------------------------------------------------------------------
+
+
+class Database_store:
+    """SQLite database holding the tasks, experiments, setups and mice tables.
+
+    The database is opened in WAL mode so other processes (e.g. the security daemon) can read
+    while the GUI writes.  Rows are read and written individually via indexed columns, so the
+    cost of a write does not grow with the size of the tables.  Columns are untyped, values are
+    stored with the type they have in the DataFrames and columns not in the default schema are
+    added when first written.  The connection is shared by all threads, access is serialised
+    with a lock.  Each table has a version that is incremented by every transaction that writes
+    to it, so other processes can find which tables have changed (see Change_listener).
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(db_path, timeout=10, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self._columns = {}  # {table_name: [column_names]}
+        self._changed_tables = set()  # Tables written by the current transaction.
+        with self._transaction():
+            self.connection.execute("CREATE TABLE IF NOT EXISTS _imported_csv (table_name TEXT PRIMARY KEY)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS _table_versions (table_name TEXT PRIMARY KEY, version INTEGER)"
+            )
+            for table, schema in TABLES.items():
+                columns = ", ".join(_quote(c) for c in schema["columns"])
+                self.connection.execute("CREATE TABLE IF NOT EXISTS {} ({})".format(_quote(table), columns))
+                for column in schema["indexes"]:
+                    self.connection.execute(
+                        "CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(
+                            _quote(table + "_" + column), _quote(table), _quote(column)
+                        )
+                    )
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+                for table in self._changed_tables:
+                    self.connection.execute("INSERT OR IGNORE INTO _table_versions VALUES (?, 0)", (table,))
+                    self.connection.execute(
+                        "UPDATE _table_versions SET version = version + 1 WHERE table_name = ?", (table,)
+                    )
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            finally:
+                self._changed_tables.clear()
+            self.connection.execute("COMMIT")
+
+    @contextmanager
+    def snapshot(self):
+        """Context manager in which all reads see the same state of the database, unaffected by
+        changes other connections commit meanwhile."""
+        with self.lock:
+            self.connection.execute("BEGIN")
+            try:
+                yield
+            finally:
+                self.connection.execute("COMMIT")
+
+    def data_version(self):
+        """Return a number that changes when another connection commits changes to the database."""
+        with self.lock:
+            return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def table_versions(self):
+        """Return dict {table_name: version} of the tables that have been written."""
+        with self.lock:
+            return dict(self.connection.execute("SELECT table_name, version FROM _table_versions").fetchall())
+
+    # ------------------------------------------------------------------------------------
+    # Columns.
+    # ------------------------------------------------------------------------------------
+
+    def columns(self, table):
+        """Return list of the column names of table."""
+        if table not in self._columns:
+            with self.lock:
+                info = self.connection.execute("PRAGMA table_info({})".format(_quote(table))).fetchall()
+            self._columns[table] = [row[1] for row in info]
+        return self._columns[table]
+
+    def _add_columns(self, table, columns):
+        """Add any of columns that are not already in table."""
+        for column in columns:
+            if column not in self.columns(table):
+                self.connection.execute("ALTER TABLE {} ADD COLUMN {}".format(_quote(table), _quote(column)))
+                self._columns[table].append(column)
+
+    # ------------------------------------------------------------------------------------
+    # Reading.
+    # ------------------------------------------------------------------------------------
+
+    def read_table(self, table):
+        """Return the contents of table as a DataFrame with rows in insertion order.  Columns
+        have the dtypes in the table definition, other columns hold the values as stored (so
+        e.g. integers with missing values are not converted to floats)."""
+        columns = self.columns(table)
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT {} FROM {} ORDER BY rowid".format(", ".join(_quote(c) for c in columns), _quote(table))
+            ).fetchall()
+        df = pd.DataFrame(rows, columns=columns, dtype=object)
+        for column in TABLES[table]["bool_columns"]:  # sqlite stores True/False as 1/0.
+            if column in df:
+                i = columns.index(column)
+                values = [bool(row[i]) if isinstance(row[i], int) else row[i] for row in rows]
+                df[column] = pd.Series(values, dtype=object)
+        return apply_schema(df, table)
+
+    def n_rows(self, table):
+        """Return the number of rows in table."""
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM " + _quote(table)).fetchone()[0]
+
+    def get_rows(self, table, column, value):
+        """Return list of dicts {column: value} of the rows of table where column == value."""
+        columns = self.columns(table)
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT {} FROM {} WHERE {} = ? ORDER BY rowid".format(
+                    ", ".join(_quote(c) for c in columns), _quote(table), _quote(column)
+                ),
+                (_to_sql(value),),
+            ).fetchall()
+        bool_columns = TABLES[table]["bool_columns"]
+        return [
+            {c: bool(v) if c in bool_columns and isinstance(v, int) else v for c, v in zip(columns, row)}
+            for row in rows
+        ]
+
+    # ------------------------------------------------------------------------------------
+    # Writing.
+    # ------------------------------------------------------------------------------------
+
+    def _insert(self, table, rows):
+        self._changed_tables.add(table)
+        for row in rows:
+            self._add_columns(table, row.keys())
+            self.connection.execute(
+                "INSERT INTO {} ({}) VALUES ({})".format(
+                    _quote(table), ", ".join(_quote(c) for c in row), ", ".join("?" * len(row))
+                ),
+                [_to_sql(v) for v in row.values()],
+            )
+
+    def _update(self, table, column, value, values):
+        if not values:
+            return
+        self._changed_tables.add(table)
+        self._add_columns(table, values.keys())
+        self.connection.execute(
+            "UPDATE {} SET {} WHERE {} = ?".format(
+                _quote(table), ", ".join(_quote(c) + " = ?" for c in values), _quote(column)
+            ),
+            [_to_sql(v) for v in values.values()] + [_to_sql(value)],
+        )
+
+    def _replace(self, table, column, value, rows):
+        where = " WHERE {} = ?".format(_quote(column))
+        n_rows = self.connection.execute("SELECT COUNT(*) FROM " + _quote(table) + where, (_to_sql(value),))
+        if n_rows.fetchone()[0] == len(rows) == 1:  # Update in place to keep the row's position.
+            self._update(table, column, value, rows[0])
+        else:
+            self.connection.execute("DELETE FROM " + _quote(table) + where, (_to_sql(value),))
+            self._insert(table, rows)
+
+    def _delete(self, table, column, values):
+        self._changed_tables.add(table)
+        self.connection.executemany(
+            "DELETE FROM {} WHERE {} = ?".format(_quote(table), _quote(column)), [(_to_sql(v),) for v in values]
+        )
+
+    def insert_rows(self, table, rows):
+        """Append rows, a list of dicts {column: value}, to table."""
+        with self._transaction():
+            self._insert(table, rows)
+
+    def update_rows(self, table, column, value, values):
+        """Set values {column: value} in the rows of table where column == value."""
+        with self._transaction():
+            self._update(table, column, value, values)
+
+    def replace_rows(self, table, column, value, rows):
+        """Replace the rows of table where column == value with rows, a list of dicts {column: value}."""
+        with self._transaction():
+            self._replace(table, column, value, rows)
+
+    def delete_rows(self, table, column, values):
+        """Delete the rows of table where column is in values."""
+        with self._transaction():
+            self._delete(table, column, values)
+
+    def apply(self, operations):
+        """Apply a list of write operations [(operation, table, *args)], where operation is one
+        of 'insert', 'update', 'replace' or 'delete', in a single transaction."""
+        methods = {"insert": self._insert, "update": self._update, "replace": self._replace, "delete": self._delete}
+        with self._transaction():
+            for operation, table, *args in operations:
+                methods[operation](table, *args)
+
+    # ------------------------------------------------------------------------------------
+    # Import.
+    # ------------------------------------------------------------------------------------
+
+    def is_imported(self, name):
+        """Return True if data name from an earlier version has been imported."""
+        with self.lock:
+            return bool(self.connection.execute("SELECT 1 FROM _imported_csv WHERE table_name = ?", (name,)).fetchone())
+
+    def mark_imported(self, name):
+        with self._transaction():
+            self.connection.execute("INSERT OR IGNORE INTO _imported_csv VALUES (?)", (name,))
+
+    def import_csv(self, table, csv_path):
+        """Import the rows of a table saved as csv file by earlier versions of the GUI. Each
+        table is only imported once."""
+        if self.is_imported(table):
+            return
+        rows = []
+        if os.path.exists(csv_path):
+            df = pd.read_csv(csv_path)
+            df = df.loc[:, ~df.columns.str.contains("^Unnamed")]
+            rows = df.to_dict("records")
+            int_columns = [c for c, dtype in TABLES[table]["dtypes"].items() if dtype == "int64"]
+            for row in rows:
+                for column in int_columns:  # Undo conversion of integer columns with missing values to float.
+                    if isinstance(row.get(column), float) and row[column].is_integer():
+                        row[column] = int(row[column])
+                for column in TABLES[table]["bool_columns"]:
+                    if row.get(column) in ("True", "False"):
+                        row[column] = row[column] == "True"
+        with self._transaction():
+            self._insert(table, rows)
+            self.connection.execute("INSERT INTO _imported_csv VALUES (?)", (table,))
+
+
+# ----------------------------------------------------------------------------------------
+#  Write_behind
+# ----------------------------------------------------------------------------------------
+
+
+class Write_behind:
+    """Queues writes to a Database_store and applies them on a background thread, so callers on
+    the GUI and serial data paths do not wait for the disk.
+
+    Writes are applied in the order they were made, at most once every flush_interval seconds,
+    with all writes queued since the last flush applied in a single transaction.  Repeated
+    updates of the same rows are merged into one update until an insert, replace or delete on the
+    table is queued after them.  flush() applies queued writes immediately and must be called
+    before the program exits.  If a flush fails the writes are kept and retried on the next one.
+    """
+
+    def __init__(self, store, flush_interval=1):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.pending = []  # [[operation, table, *args]]
+        self.pending_updates = {}  # {(table, column, value): pending update operation}
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.closed = False
+        self.thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self.thread.start()
+
+    def _queue(self, operation):
+        with self.condition:
+            if operation[0] != "update":  # Later updates must not be merged into ones queued before this.
+                self.pending_updates = {k: v for k, v in self.pending_updates.items() if k[0] != operation[1]}
+            self.pending.append(operation)
+            self.condition.notify()
+
+    def insert_rows(self, table, rows):
+        self._queue(["insert", table, [dict(row) for row in rows]])
+
+    def update_rows(self, table, column, value, values):
+        with self.condition:
+            operation = self.pending_updates.get((table, column, value))
+            if operation is not None:
+                operation[4].update(values)
+                return
+            operation = ["update", table, column, value, dict(values)]
+            self.pending_updates[(table, column, value)] = operation
+            self._queue(operation)
+
+    def replace_rows(self, table, column, value, rows):
+        self._queue(["replace", table, column, value, [dict(row) for row in rows]])
+
+    def delete_rows(self, table, column, values):
+        self._queue(["delete", table, column, list(values)])
+
+    def flush(self):
+        """Apply all queued writes to the database."""
+        with self.flush_lock:
+            with self.condition:
+                operations, self.pending, self.pending_updates = self.pending, [], {}
+            if not operations:
+                return
+            try:
+                self.store.apply(operations)
+            except Exception:
+                traceback.print_exc()
+                with self.condition:  # Keep the writes to retry them on the next flush.
+                    self.pending[:0] = operations
+                raise
+
+    def _flush_loop(self):
+        while True:
+            with self.condition:
+                while not (self.pending or self.closed):
+                    self.condition.wait()
+                if self.closed:
+                    return
+            time.sleep(self.flush_interval)  # Bound the flush rate, coalescing writes made meanwhile.
+            try:
+                self.flush()
+            except Exception:
+                pass  # Already reported, retried on the next flush.
+
+    def close(self):
+        """Stop the background thread and apply any queued writes."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.flush()
+
+
+# ----------------------------------------------------------------------------------------
+#  Change_listener
+# ----------------------------------------------------------------------------------------
+
+
+class Change_listener:
+    """Finds the tables of a Database_store that have been changed by other processes, e.g. so
+    the security daemon can react to changes made by the GUI.  Checking for changes only reads
+    sqlite's data version, the table versions are only read when it has changed."""
+
+    def __init__(self, store, tables, poll_interval=1):
+        self.store = store
+        self.tables = tables
+        self.poll_interval = poll_interval
+        self.data_version = None
+        self.versions = {}  # {table_name: version when last checked}
+
+    def changed_tables(self):
+        """Return the set of tables changed since the last call, all tables on the first call."""
+        data_version = self.store.data_version()
+        if data_version == self.data_version:
+            return set()
+        versions = self.store.table_versions()
+        if self.data_version is None:
+            changed = set(self.tables)
+        else:
+            changed = {table for table in self.tables if versions.get(table, 0) != self.versions.get(table, 0)}
+        self.data_version = data_version
+        self.versions = versions
+        return changed
+
+    def wait(self, timeout):
+        """Wait up to timeout seconds for any of the tables to change and return the set of
+        changed tables, empty if none changed."""
+        end_time = time.monotonic() + timeout
+        while True:
+            changed = self.changed_tables()
+            remaining = end_time - time.monotonic()
+            if changed or remaining <= 0:
+                return changed
+            time.sleep(min(self.poll_interval, remaining))
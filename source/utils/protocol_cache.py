@@ -0,0 +1,101 @@
+import os
+import ast
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+# ----------------------------------------------------------------------------------------
+#  Compiled protocols.
+# ----------------------------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class Protocol_stage:
+    """A stage of a training protocol."""
+
+    task: str
+    threshold_variables: tuple  # Names of the variables whose thresholds advance the stage.
+    thresholds: np.ndarray  # Threshold of each threshold variable (read only).
+    default_variables: tuple  # ((v_name, value), ...) set at the start of every session.
+    tracked_variables: tuple  # Names of the variables carried over from the last session.
+
+    def n_thresholds_reached(self, variables):
+        """Return the number of the stage's thresholds reached by variables {v_name: value}."""
+        if not self.threshold_variables:
+            return 0
+        values = np.array([float(variables[v_name]) for v_name in self.threshold_variables])
+        return int(np.count_nonzero(values >= self.thresholds))
+
+
+@dataclass(frozen=True)
+class Protocol:
+    """Training protocol saved by the protocol assembly tab, compiled from the protocol file."""
+
+    name: str
+    stages: tuple  # Protocol_stage for each stage.
+
+    @property
+    def tasks(self):
+        """Tuple of the tasks used by the protocol's stages."""
+        return tuple(dict.fromkeys(stage.task for stage in self.stages))
+
+    def session_setup(self, stage, last_variables=None):
+        """Return (stage, task, variables) for a session of a mouse at stage, where last_variables
+        are the variables {v_name: value} at the end of the mouse's last session, or None if it
+        has not run a session.  The stage advances by one for each of its thresholds reached in
+        the last session, the tracked variables are carried over if the stage does not change."""
+        new_stage = False
+        if last_variables is not None:
+            n_reached = self.stages[stage].n_thresholds_reached(last_variables)
+            new_stage = n_reached > 0
+            stage = min(stage + n_reached, len(self.stages) - 1)
+        protocol_stage = self.stages[stage]
+        variables = dict(protocol_stage.default_variables)
+        if last_variables is not None and not new_stage:
+            for v_name in protocol_stage.tracked_variables:
+                variables[v_name] = float(last_variables[v_name])
+        return stage, protocol_stage.task, variables
+
+
+def _parse_list(list_str):
+    """Parse a list saved as its repr in a protocol file, missing values are empty lists."""
+    return ast.literal_eval(list_str) if isinstance(list_str, str) else []
+
+
+def compile_protocol(protocol_path):
+    """Read the protocol file at protocol_path and return it as a Protocol."""
+    protocol_df = pd.read_csv(protocol_path, index_col=0)
+    stages = []
+    for _, row in protocol_df.iterrows():
+        thresholds = _parse_list(row["threshV"])
+        threshold_array = np.array([float(threshold) for _, threshold in thresholds], dtype=float)
+        threshold_array.flags.writeable = False
+        stages.append(
+            Protocol_stage(
+                task=row["task"],
+                threshold_variables=tuple(v_name for v_name, _ in thresholds),
+                thresholds=threshold_array,
+                default_variables=tuple((v_name, float(value)) for v_name, value in _parse_list(row["defaultV"])),
+                tracked_variables=tuple(_parse_list(row["trackV"])),
+            )
+        )
+    return Protocol(name=os.path.basename(protocol_path), stages=tuple(stages))
+
+
+# ----------------------------------------------------------------------------------------
+#  Protocol cache.
+# ----------------------------------------------------------------------------------------
+
+_protocol_cache = {}  # {protocol_path: ((mtime_ns, size), Protocol)}
+
+
+def load_protocol(protocol_path):
+    """Return the compiled protocol saved at protocol_path.  Protocols are cached and only
+    compiled again when the protocol file changes."""
+    stat = os.stat(protocol_path)
+    file_stat = (stat.st_mtime_ns, stat.st_size)
+    cached = _protocol_cache.get(protocol_path)
+    if cached is None or cached[0] != file_stat:
+        cached = (file_stat, compile_protocol(protocol_path))
+        _protocol_cache[protocol_path] = cached
+    return cached[1]
@@ -0,0 +1,190 @@
+import os
+import json
+import struct
+import numpy as np
+
+# ----------------------------------------------------------------------------------------
+#  Binary session file format.
+# ----------------------------------------------------------------------------------------
+
+# A binary session file holds the same records as a session's tsv file, written by
+# Session_file_writer in data_logger.py.  All values are little endian.
+#
+#   HEADER_START            magic, length of the header JSON.
+#   header JSON             Session and state machine information, padded to 8 bytes.
+#   records                 RECORD_DTYPE array in the order the records were received, which
+#                           may differ slightly from time order.
+#   heap                    utf-8 contents of the print, variable, warning and error records.
+#   type index              uint64 start of each type in the indices, followed by the uint32
+#                           indices of the records sorted by type then time.
+#   time index              uint32 indices of the records sorted by time, followed by the uint32
+#                           position in that order of the first record at or after each
+#                           TIME_INDEX_INTERVAL.
+#   footer JSON             Information known at the end of the session.
+#   TRAILER                 Offsets of the sections, magic.
+#
+# While the session is running the heap is written to <file>.heap and the file ends after the
+# records, the heap, indices and footer are added when the file is closed.
+
+MAGIC = b"PYCSES02"
+HEADER_START = struct.Struct("<8sQ")
+TRAILER = struct.Struct("<6Q8s")  # n_records, heap, type index, time index, footer offsets, footer length, magic.
+RECORD_DTYPE = np.dtype(
+    [
+        ("time", "<i4"),  # ms.
+        ("type", "u1"),  # Index in RECORD_TYPES.
+        ("subtype", "u1"),  # Index in SUBTYPES.
+        ("ID", "<u2"),  # State or event ID.
+        ("offset", "<u4"),  # Start of the content in the heap.
+        ("length", "<u4"),  # Length of the content in the heap.
+    ]
+)
+RECORD_TYPES = ("state", "event", "print", "variable", "warning", "error", "stop")
+EVENT_SUBTYPES = ("input", "timer", "publish", "user", "api", "sync")
+PRINT_SUBTYPES = ("task", "api", "user")
+VARIABLE_SUBTYPES = ("get", "user_set", "api_set", "print", "run_start", "run_end")
+SUBTYPES = tuple(dict.fromkeys(("",) + EVENT_SUBTYPES + PRINT_SUBTYPES + VARIABLE_SUBTYPES))
+TIME_INDEX_INTERVAL = 1000  # ms
+
+
+def encode_header(header):
+    """Return the start of a session file with header, a JSON serialisable dict."""
+    header_json = json.dumps(header, default=str).encode()
+    header_json += b" " * (-len(header_json) % 8)
+    return HEADER_START.pack(MAGIC, len(header_json)) + header_json
+
+
+def build_indices(records):
+    """Return (type_index, time_index) bytes for records, an array of RECORD_DTYPE."""
+    counts = np.bincount(records["type"], minlength=len(RECORD_TYPES))
+    type_starts = np.concatenate([[0], np.cumsum(counts)]).astype("<u8")
+    type_order = np.lexsort((records["time"], records["type"])).astype("<u4")  # Stable sort.
+    time_order = np.argsort(records["time"], kind="stable").astype("<u4")
+    times = records["time"][time_order]
+    interval_starts = np.arange(0, int(times[-1]) + 1, TIME_INDEX_INTERVAL) if len(times) else []
+    time_index = np.searchsorted(times, interval_starts, side="left").astype("<u4")
+    return type_starts.tobytes() + type_order.tobytes(), time_order.tobytes() + time_index.tobytes()
+
+
+# ----------------------------------------------------------------------------------------
+#  Session_file
+# ----------------------------------------------------------------------------------------
+
+
+class Session_file:
+    """Reader for binary session files.  The records are memory mapped, so opening a session
+    only reads its header and footer, and selecting records by type or time only reads the
+    records selected.  Files not closed by the writer (e.g. if the program stopped) are read
+    from the records written and the .heap file, with the indices built when opened.
+
+    Attributes:
+        header:  dict of session and state machine information.
+        footer:  dict of information written at the end of the session, empty if not closed.
+        closed:  True if the file was closed by the writer.
+        records: array of RECORD_DTYPE, fields time, type, subtype, ID, offset and length.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        with open(file_path, "rb") as f:
+            magic, header_len = HEADER_START.unpack(f.read(HEADER_START.size))
+            if magic != MAGIC:
+                raise ValueError(file_path + " is not a session file.")
+            self.header = json.loads(f.read(header_len))
+            records_offset = HEADER_START.size + header_len
+            file_size = os.fstat(f.fileno()).st_size
+            trailer = None
+            if file_size - records_offset >= TRAILER.size:
+                f.seek(file_size - TRAILER.size)
+                trailer = TRAILER.unpack(f.read(TRAILER.size))
+            self.closed = bool(trailer) and trailer[-1] == MAGIC
+            if self.closed:
+                n_records, heap_offset, type_index_offset, time_index_offset, footer_offset, footer_len, _ = trailer
+                f.seek(footer_offset)
+                self.footer = json.loads(f.read(footer_len))
+            else:  # File was not closed.
+                n_records = (file_size - records_offset) // RECORD_DTYPE.itemsize
+                self.footer = {}
+        self.records = self._map(RECORD_DTYPE, records_offset, n_records)
+        if self.closed:
+            n_types = len(RECORD_TYPES)
+            self.heap = self._map("u1", heap_offset, type_index_offset - heap_offset)
+            self._type_starts = self._map("<u8", type_index_offset, n_types + 1)
+            self._type_order = self._map("<u4", type_index_offset + 8 * (n_types + 1), n_records)
+            self._time_order = self._map("<u4", time_index_offset, n_records)
+            time_index_len = (footer_offset - time_index_offset) // 4 - n_records
+            self._time_index = self._map("<u4", time_index_offset + 4 * n_records, time_index_len)
+        else:
+            heap_path = file_path + ".heap"
+            self.heap = np.fromfile(heap_path, "u1") if os.path.exists(heap_path) else np.zeros(0, "u1")
+            type_index, time_index = build_indices(self.records)
+            self._type_starts = np.frombuffer(type_index, "<u8", len(RECORD_TYPES) + 1)
+            self._type_order = np.frombuffer(type_index, "<u4", offset=8 * (len(RECORD_TYPES) + 1))
+            self._time_order = np.frombuffer(time_index, "<u4", len(self.records))
+            self._time_index = np.frombuffer(time_index, "<u4", offset=4 * len(self.records))
+
+    def _map(self, dtype, offset, count):
+        """Return a read only memory mapped array of count items of dtype at offset in the file."""
+        if count == 0:  # Empty arrays can not be memory mapped.
+            return np.zeros(0, dtype)
+        return np.memmap(self.file_path, dtype, "r", offset, (count,))
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def times(self):
+        """Record times in seconds."""
+        return self.records["time"] / 1000
+
+    def indices_of_type(self, record_type):
+        """Return the indices in time order of the records of record_type, one of RECORD_TYPES."""
+        code = RECORD_TYPES.index(record_type)
+        return np.asarray(self._type_order[self._type_starts[code] : self._type_starts[code + 1]])
+
+    def of_type(self, record_type):
+        """Return the records of record_type, one of RECORD_TYPES."""
+        return self.records[self.indices_of_type(record_type)]
+
+    def time_order(self):
+        """Return the indices of the records sorted by time, records with equal times in the
+        order they were received."""
+        return np.asarray(self._time_order)
+
+    def time_slice(self, start_ms, end_ms):
+        """Return the slice of time_order() of the records with start_ms <= time < end_ms."""
+        n_records = len(self.records)
+
+        def first_at(t):  # Use the time index to find the interval then search within it.
+            interval = max(int(t) // TIME_INDEX_INTERVAL, 0)
+            if interval >= len(self._time_index):
+                return n_records
+            lo = int(self._time_index[interval])
+            hi = int(self._time_index[interval + 1]) if interval + 1 < len(self._time_index) else n_records
+            times = self.records["time"][self._time_order[lo:hi]]
+            return lo + int(np.searchsorted(times, t, side="left"))
+
+        return slice(first_at(start_ms), first_at(end_ms))
+
+    def between(self, start_ms, end_ms):
+        """Return the records with start_ms <= time < end_ms in time order."""
+        return self.records[self._time_order[self.time_slice(start_ms, end_ms)]]
+
+    def names(self, records):
+        """Return array of the state or event names of records."""
+        ID2name = {ID: name for name, ID in {**self.header["states"], **self.header["events"]}.items()}
+        lookup = np.array([ID2name.get(ID, "") for ID in range(max(ID2name, default=0) + 1)], dtype=object)
+        return lookup[records["ID"]]
+
+    def subtypes(self, records):
+        """Return array of the subtype names of records."""
+        return np.array(self.header["subtypes"], dtype=object)[records["subtype"]]
+
+    def content(self, record):
+        """Return the content string of a print, variable, warning or error record."""
+        return bytes(self.heap[record["offset"] : record["offset"] + record["length"]]).decode()
+
+
+def load_session_files(file_paths):
+    """Return list of Session_files for file_paths."""
+    return [Session_file(file_path) for file_path in file_paths]
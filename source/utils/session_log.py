@@ -0,0 +1,111 @@
+import os
+import ast
+import json
+import struct
+import pandas as pd
+
+INDEX_ENTRY = struct.Struct("<Q")  # End offset in the log file of a session line.
+
+# ----------------------------------------------------------------------------------------
+#  Session_log
+# ----------------------------------------------------------------------------------------
+
+
+class Session_log:
+    """Append-only log of the sessions run by a mouse, stored as one JSON object per line in
+    <mouse_ID>.jsonl.  The end offset of each line in the log is stored in the index file
+    <mouse_ID>.idx, so appending a session and reading any session (e.g. the last one with
+    log[-1]) take the same time however many sessions have been logged.  Lines not yet in the
+    index (e.g. if the program stopped between writing the log and the index) are found by
+    reading the log after the last indexed line and added to the index on the next append.
+    A log saved as a csv file by earlier versions is converted when it is first opened.
+    """
+
+    def __init__(self, log_dir, mouse_ID):
+        self.log_path = os.path.join(log_dir, mouse_ID + ".jsonl")
+        self.index_path = os.path.join(log_dir, mouse_ID + ".idx")
+        csv_path = os.path.join(log_dir, mouse_ID + ".csv")
+        if not os.path.exists(self.log_path) and os.path.exists(csv_path):
+            convert_csv_log(csv_path, self)
+
+    def _read_index(self, first, n):
+        """Return list of n index entries starting at entry first."""
+        with open(self.index_path, "rb") as f:
+            f.seek(first * INDEX_ENTRY.size)
+            data = f.read(n * INDEX_ENTRY.size)
+        return [entry[0] for entry in INDEX_ENTRY.iter_unpack(data)]
+
+    def _locate(self):
+        """Return (n_indexed, unindexed_ends, log_end) where n_indexed is the number of valid
+        index entries, unindexed_ends the end offsets of the complete lines after the last
+        indexed line and log_end the end offset of the last complete line."""
+        log_size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        n_indexed = os.path.getsize(self.index_path) // INDEX_ENTRY.size if os.path.exists(self.index_path) else 0
+        log_end = self._read_index(n_indexed - 1, 1)[0] if n_indexed else 0
+        if log_end > log_size:  # Log file has been replaced, index is not valid.
+            n_indexed, log_end = 0, 0
+        unindexed_ends = []
+        if log_end < log_size:
+            with open(self.log_path, "rb") as f:
+                f.seek(log_end)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # Partly written line.
+                    log_end += len(line)
+                    unindexed_ends.append(log_end)
+        return n_indexed, unindexed_ends, log_end
+
+    def __len__(self):
+        n_indexed, unindexed_ends, _ = self._locate()
+        return n_indexed + len(unindexed_ends)
+
+    def __getitem__(self, i):
+        """Return session i as a dict, negative indices count back from the last session."""
+        n_indexed, unindexed_ends, _ = self._locate()
+        n_sessions = n_indexed + len(unindexed_ends)
+        if i < 0:
+            i += n_sessions
+        if not 0 <= i < n_sessions:
+            raise IndexError("session index out of range")
+        if i == 0:
+            start, end = 0, (self._read_index(0, 1) if n_indexed else unindexed_ends)[0]
+        elif i < n_indexed:
+            start, end = self._read_index(i - 1, 2)
+        else:
+            ends = ([self._read_index(n_indexed - 1, 1)[0]] if n_indexed else [0]) + unindexed_ends
+            start, end = ends[i - n_indexed], ends[i - n_indexed + 1]
+        with open(self.log_path, "rb") as f:
+            f.seek(start)
+            return json.loads(f.read(end - start))
+
+    def append(self, session):
+        """Append session, a dict of JSON serialisable values, to the log."""
+        n_indexed, unindexed_ends, log_end = self._locate()
+        line = (json.dumps(session, default=str) + "\n").encode()
+        with open(self.log_path, "ab") as f:
+            f.truncate(log_end)  # Remove any partly written line.
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.index_path, "ab") as f:
+            f.truncate(n_indexed * INDEX_ENTRY.size)
+            f.write(b"".join(INDEX_ENTRY.pack(end) for end in unindexed_ends + [log_end + len(line)]))
+
+    def clear(self):
+        """Remove all sessions from the log."""
+        for file_path in (self.log_path, self.index_path):
+            open(file_path, "wb").close()
+
+
+def convert_csv_log(csv_path, session_log):
+    """Append the sessions in a mouse log csv file saved by earlier versions to session_log."""
+    df = pd.read_csv(csv_path)
+    df = df.loc[:, ~df.columns.str.contains("^Unnamed")]
+    for row in df.to_dict("records"):
+        session = {k: None if pd.isnull(v) else v for k, v in row.items()}
+        if isinstance(session.get("Variables"), str):  # Variables dict was saved as its repr.
+            try:
+                session["Variables"] = ast.literal_eval(session["Variables"])
+            except (ValueError, SyntaxError):
+                pass
+        session_log.append(session)
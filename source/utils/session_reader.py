@@ -0,0 +1,197 @@
+import os
+import glob
+import json
+import hashlib
+from itertools import repeat
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from source.gui.settings import user_folder
+from source.utils.session_file import RECORD_TYPES, SUBTYPES
+from source.utils.analog_data import load_analog
+
+TYPE_CODES = {record_type: i for i, record_type in enumerate(RECORD_TYPES)}
+SUBTYPE_CODES = {subtype: i for i, subtype in enumerate(SUBTYPES)}
+NAMED_TYPES = [TYPE_CODES[t] for t in ("state", "event")]
+CONTENT_TYPES = [TYPE_CODES[t] for t in ("print", "variable", "warning", "error")]
+CACHE_VERSION = 1  # Increment if the parsed arrays change, so sessions cached earlier are parsed again.
+
+# ----------------------------------------------------------------------------------------
+#  Session
+# ----------------------------------------------------------------------------------------
+
+
+@dataclass
+class Session:
+    """Data from a session tsv file written by Data_logger, one array item per record."""
+
+    file_path: str
+    info: dict  # {name: value} of the info rows, e.g. 'task_name', 'subject_id', 'start_time'.
+    times: np.ndarray  # float64 time of each record in seconds.
+    types: np.ndarray  # uint8 index of each record's type in RECORD_TYPES.
+    subtypes: np.ndarray  # uint8 index of each record's subtype in SUBTYPES.
+    IDs: np.ndarray  # int16 index in names of state and event records, -1 for other records.
+    names: np.ndarray  # Names of the states and events in the session.
+    contents: np.ndarray  # Content of print, variable, warning and error records, '' for other records.
+    analog: dict = field(default_factory=dict)  # {input name: (times, data)}, see analog_data.load_analog.
+
+    def of_type(self, record_type):
+        """Return the indices of the records of record_type, one of RECORD_TYPES."""
+        return np.flatnonzero(self.types == TYPE_CODES[record_type])
+
+    def record_names(self, indices):
+        """Return the state or event names of the records at indices."""
+        return self.names[self.IDs[indices]]
+
+
+def parse_session_tsv(file_path):
+    """Parse the session tsv file at file_path into a Session, without its analog data."""
+    with open(file_path, "r", encoding="utf-8") as f:
+        lines = f.read().split("\n")  # Not splitlines(), which also splits at e.g. '\u2028' in print content.
+    if not lines[-1]:
+        lines.pop()  # Empty string after the final newline.
+    lines = pd.Series(lines[1:], dtype=object)  # First line holds the column names.
+    columns = lines.str.split("\t", n=3, expand=True).reindex(columns=range(4)).fillna("")
+    times = pd.to_numeric(columns[0], errors="coerce")
+    is_info = (columns[1] == "info").to_numpy()
+    info = dict(zip(columns[2][is_info], columns[3][is_info]))
+    types = columns[1].map(TYPE_CODES)
+    records = (types.notna() & times.notna()).to_numpy()  # Excludes info and malformed rows.
+    types = types[records].to_numpy(dtype=np.uint8)
+    contents = columns[3][records].to_numpy(dtype=object, copy=True)
+    is_named = np.isin(types, NAMED_TYPES)
+    IDs = np.full(len(types), -1, dtype=np.int16)
+    IDs[is_named], names = pd.factorize(contents[is_named])
+    contents[~np.isin(types, CONTENT_TYPES)] = ""
+    return Session(
+        file_path=file_path,
+        info=info,
+        times=times[records].to_numpy(dtype=np.float64),
+        types=types,
+        subtypes=columns[2][records].map(SUBTYPE_CODES).fillna(0).to_numpy(dtype=np.uint8),
+        IDs=IDs,
+        names=np.asarray(names, dtype=object),
+        contents=contents,
+    )
+
+
+# ----------------------------------------------------------------------------------------
+#  Parse cache
+# ----------------------------------------------------------------------------------------
+
+ARRAY_FIELDS = ("times", "types", "subtypes", "IDs")
+
+
+def _cache_path(cache_dir, file_path):
+    return os.path.join(cache_dir, hashlib.sha1(os.path.abspath(file_path).encode()).hexdigest() + ".npz")
+
+
+def _join_contents(contents):
+    """Return (data, ends) where data is a uint8 array of the utf-8 encoded contents joined
+    together and ends the end position of each content in data."""
+    encoded = [content.encode("utf-8") for content in contents]
+    ends = np.cumsum([len(content) for content in encoded], dtype=np.int64)
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), ends
+
+
+def _split_contents(data, ends):
+    """Return object array of the contents joined by _join_contents."""
+    data = data.tobytes()
+    contents = np.empty(len(ends), dtype=object)
+    contents[:] = [data[start:end].decode("utf-8") for start, end in zip([0] + ends[:-1].tolist(), ends.tolist())]
+    return contents
+
+
+def _file_key(file_path):
+    stat = os.stat(file_path)
+    return np.array([CACHE_VERSION, stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def load_session_tsv(file_path, cache_dir=None):
+    """Return the Session for the tsv file at file_path, without its analog data.  If cache_dir
+    is specified parsed sessions are saved there and used until the file's size or
+    modification time changes."""
+    if cache_dir is None:
+        return parse_session_tsv(file_path)
+    cache_path = _cache_path(cache_dir, file_path)
+    file_key = _file_key(file_path)
+    if os.path.exists(cache_path):
+        try:
+            with np.load(cache_path) as cached:
+                if np.array_equal(cached["key"], file_key):
+                    return Session(
+                        file_path=file_path,
+                        info=json.loads(str(cached["info"])),
+                        names=cached["names"].astype(object),
+                        contents=_split_contents(cached["contents"], cached["content_ends"]),
+                        **{name: cached[name] for name in ARRAY_FIELDS},
+                    )
+        except (OSError, ValueError, KeyError):
+            pass  # Cache file is not valid, parse the session again.
+    session = parse_session_tsv(file_path)
+    contents, content_ends = _join_contents(session.contents)
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_path = cache_path + ".temp"
+    with open(temp_path, "wb") as f:
+        np.savez(
+            f,
+            key=file_key,
+            info=json.dumps(session.info),
+            names=session.names.astype(str),
+            contents=contents,
+            content_ends=content_ends,
+            **{name: getattr(session, name) for name in ARRAY_FIELDS},
+        )
+    os.replace(temp_path, cache_path)
+    return session
+
+
+# ----------------------------------------------------------------------------------------
+#  Loading sessions
+# ----------------------------------------------------------------------------------------
+
+
+def attach_analog(session):
+    """Add the analog data saved with session, memory mapped, to session.analog."""
+    path_stem = os.path.splitext(session.file_path)[0]
+    for data_path in sorted(glob.glob(glob.escape(path_stem) + "_*.data.npy")):
+        analog_stem = data_path[: -len(".data.npy")]
+        session.analog[analog_stem[len(path_stem) + 1 :]] = load_analog(analog_stem)
+    return session
+
+
+def find_session_files(data_dir, experiment="*", mouse="*", protocol="*"):
+    """Return the paths of the session tsv files in data_dir/<experiment>/<mouse>/<protocol>/, each
+    session is saved in its own folder there by run_mouse_task.  Arguments not specified match
+    all folders."""
+    return sorted(glob.glob(os.path.join(data_dir, experiment, mouse, protocol, "*", "*.tsv")))
+
+
+def load_sessions(file_paths, use_cache=True, cache_dir=None, n_processes=None, analog=True):
+    """Return list of Sessions for the tsv files at file_paths, parsed in parallel by a pool of
+    n_processes processes (default one per CPU).  Parsed sessions are cached in cache_dir
+    (default the session cache folder) unless use_cache is False.  If analog is True each
+    session's analog data is memory mapped in this process."""
+    if use_cache and cache_dir is None:
+        cache_dir = user_folder("session_cache_dir")
+    elif not use_cache:
+        cache_dir = None
+    if len(file_paths) > 1 and n_processes != 1:
+        with ProcessPoolExecutor(n_processes) as pool:
+            chunksize = max(1, len(file_paths) // (4 * (n_processes or os.cpu_count() or 1)))
+            sessions = list(pool.map(load_session_tsv, file_paths, repeat(cache_dir), chunksize=chunksize))
+    else:
+        sessions = [load_session_tsv(file_path, cache_dir) for file_path in file_paths]
+    if analog:
+        for session in sessions:
+            attach_analog(session)
+    return sessions
+
+
+def load_experiment_sessions(experiment, mouse="*", protocol="*", data_dir=None, **kwargs):
+    """Return list of Sessions of an experiment, optionally only those of one mouse or protocol,
+    from the data folder.  Keyword arguments are passed to load_sessions."""
+    if data_dir is None:
+        data_dir = user_folder("data_dir")
+    return load_sessions(find_session_files(data_dir, experiment, mouse, protocol), **kwargs)
@@ -26,6 +26,17 @@ def custom_excepthook(type_, exception, traceback_, filepath):
     sys._excepthook(type_, exception, traceback)
 
 
+def write_csv_atomic(df: pd.DataFrame, file_path: str, **kwargs) -> None:
+    """Write df to a csv file via a temporary file that replaces file_path once it is complete,
+    so the file is never left half written if the program or computer stops."""
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "w", newline="") as f:
+        df.to_csv(f, **kwargs)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, file_path)
+
+
 # --------------------------------------------------------------------------------
 def get_user_path():
     return get_data_dir_path() + "users.txt"
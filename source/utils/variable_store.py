@@ -0,0 +1,111 @@
+import ast
+import json
+import threading
+import pandas as pd
+
+KINDS = ("persistent", "set", "summary")
+ALL_TASKS = ""  # Task of variables used for tasks that no variables have been saved for.
+
+
+def parse_value(value_str):
+    """Convert a variable value string entered in the GUI (e.g. '5', '[1, 2]', "'a'") to the
+    value it represents.  Strings that are not python literals are returned unchanged."""
+    if not isinstance(value_str, str):
+        return value_str
+    try:
+        return ast.literal_eval(value_str.strip())
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return value_str.strip()
+
+
+def _parse_dict_str(dict_str):
+    """Parse a dict saved as a JSON or repr string in the mice table by earlier versions."""
+    if not isinstance(dict_str, str) or not dict_str.strip():
+        return {}
+    try:
+        return json.loads(dict_str)
+    except ValueError:
+        try:
+            return ast.literal_eval(dict_str)
+        except (ValueError, SyntaxError):
+            return {}
+
+
+# ----------------------------------------------------------------------------------------
+#  Variable_store
+# ----------------------------------------------------------------------------------------
+
+
+class Variable_store:
+    """Typed store of the persistent, set and summary task variables of each mouse.
+
+    Variables are stored per mouse, kind and task as dicts {'v.name': value} holding the
+    decoded values, saved in the database's variables table as JSON.  Variables saved with task
+    ALL_TASKS are used when the mouse runs a task no variables have been saved for.
+    Each mouse's variables are read from the database the first time they are needed and then
+    served from an in-memory cache, so starting a session does not parse any strings.  Every
+    change increments the version of the changed variables.
+    """
+
+    def __init__(self, store, writer):
+        self.store = store
+        self.writer = writer
+        self.lock = threading.Lock()
+        self.cache = {}  # {mouse_ID: {(kind, task): {"version": int, "values": dict}}}
+
+    def _mouse_cache(self, mouse_ID):
+        if mouse_ID not in self.cache:
+            mouse_cache = {}
+            for row in self.store.get_rows("variables", "Mouse_ID", mouse_ID):
+                values = json.loads(row["Value"])
+                mouse_cache[(row["Kind"], row["Task"])] = {"version": row["Version"], "values": values}
+            self.cache[mouse_ID] = mouse_cache
+        return self.cache[mouse_ID]
+
+    def get(self, mouse_ID, kind, task=ALL_TASKS):
+        """Return dict {'v.name': value} of the variables of kind for the mouse running task,
+        the returned dict must not be modified."""
+        with self.lock:
+            mouse_cache = self._mouse_cache(mouse_ID)
+            entry = mouse_cache.get((kind, task)) or mouse_cache.get((kind, ALL_TASKS))
+        return entry["values"] if entry else {}
+
+    def version(self, mouse_ID, kind, task=ALL_TASKS):
+        """Return the version of the variables of kind saved for task, 0 if none have been saved."""
+        with self.lock:
+            entry = self._mouse_cache(mouse_ID).get((kind, task))
+        return entry["version"] if entry else 0
+
+    def set(self, mouse_ID, kind, values, task=ALL_TASKS):
+        """Replace the variables of kind saved for task with values {'v.name': value}."""
+        assert kind in KINDS, "kind must be one of {}".format(KINDS)
+        with self.lock:
+            mouse_cache = self._mouse_cache(mouse_ID)
+            entry = mouse_cache.get((kind, task))
+            version = entry["version"] + 1 if entry else 1
+            mouse_cache[(kind, task)] = {"version": version, "values": dict(values)}
+        row = {
+            "Key": "/".join([mouse_ID, kind, task]),
+            "Mouse_ID": mouse_ID,
+            "Task": task,
+            "Kind": kind,
+            "Version": version,
+            "Value": json.dumps(values, default=str),
+        }
+        self.writer.replace_rows("variables", "Key", row["Key"], [row])
+
+    def import_mouse_columns(self):
+        """Import the variables saved as strings in the persistent_variables, set_variables and
+        summary_variables columns of the mice table by earlier versions. Only done once."""
+        if self.store.is_imported("variables"):
+            return
+        for _, mouse_row in self.store.read_table("mice").iterrows():
+            for kind in KINDS:
+                dict_str = mouse_row.get(kind + "_variables")
+                if pd.isnull(dict_str):
+                    continue
+                values = {name: parse_value(value) for name, value in _parse_dict_str(dict_str).items()}
+                if values:
+                    self.set(mouse_row["Mouse_ID"], kind, values)
+        self.writer.flush()
+        self.store.mark_imported("variables")
@@ -0,0 +1,59 @@
+"""
+Shared fixtures of the pytest tests, run from the pycontrol_homecage folder with:
+    python -m pytest test
+"""
+
+import os
+import sys
+from datetime import datetime
+from types import SimpleNamespace
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from source.communication import data_logger
+from source.communication.message import MsgType, Datatuple
+
+SM_INFO = SimpleNamespace(
+    name="reversal_learning",
+    task_hash=1234,
+    framework_version="2.0.2",
+    micropython_version="1.19.1",
+    states={"wait": 1, "reward": 2},
+    events={"poke": 3, "lick": 4},
+    ID2name={1: "wait", 2: "reward", 3: "poke", 4: "lick"},
+    analog_inputs={5: {"name": "weight", "fs": 100, "dtype": "H"}},
+)
+
+SESSION_DATA = [
+    Datatuple(time=0, type=MsgType.STATE, content=1),
+    Datatuple(time=0, type=MsgType.ANLOG, content=(5, np.arange(50, dtype="H"))),
+    Datatuple(time=120, type=MsgType.EVENT, subtype="input", content=3),
+    Datatuple(time=150, type=MsgType.VARBL, subtype="user_set", content='{"reward_ms": 50}'),
+    Datatuple(time=200, type=MsgType.PRINT, subtype="task", content="trial 1\tstarted"),
+    Datatuple(time=500, type=MsgType.ANLOG, content=(5, np.arange(50, 100, dtype="H"))),
+    Datatuple(time=1250, type=MsgType.STATE, content=2),
+    Datatuple(time=1300, type=MsgType.EVENT, subtype="timer", content=4),
+    Datatuple(time=1400, type=MsgType.WARNG, content="low weight"),
+    Datatuple(time=1500, type=MsgType.STOPF),
+]
+
+
+@pytest.fixture
+def write_session():
+    """Return function that writes SESSION_DATA with a Data_logger to a session folder in
+    data_dir/<experiment>/<mouse>/<protocol>/, as system_controller.run_mouse_task does, and
+    returns the path of the session's tsv file."""
+
+    def write(data_dir, experiment="exp", mouse="m1", protocol="prot", start=datetime(2024, 1, 1), binary=False):
+        file_name = "_".join([mouse, experiment, SM_INFO.name, start.strftime("%Y-%m-%d-%H%M%S")])
+        session_dir = os.path.join(data_dir, experiment, mouse, protocol, file_name)
+        os.makedirs(session_dir, exist_ok=True)
+        logger = data_logger.Data_logger(SimpleNamespace(sm_info=SM_INFO))
+        logger.save_session_file = binary
+        logger.open_data_file(session_dir, experiment, "setup_1", mouse, datetime_now=start)
+        logger.process_data(SESSION_DATA)
+        logger.close_files()
+        return logger.file_path
+
+    return write
@@ -0,0 +1,57 @@
+import os
+import asyncio
+from types import SimpleNamespace
+import source.gui  # noqa: F401, imported before pycboard as by the GUI, as the GUI package imports pycboard.
+from source.communication.async_pyboard import AsyncPyboard
+from source.communication.pycboard import _djb2_file
+from source.communication.message import MsgType
+from virtual_pyboard import Virtual_cage
+
+TASK_PATH = os.path.join("tasks", "reversal_learning.py")
+
+
+async def setup_board(serial_port):
+    """Connect to the board at serial_port and set up the task on it."""
+    board = AsyncPyboard(serial_port)
+    await board.reset()
+    await board.exec("from pyControl import *; import devices")
+    await board.transfer_file(TASK_PATH, "task_file.py")
+    await board.exec("import task_file")
+    await board.exec("sm.setup_state_machine(task_file)")
+    board.sm_info = SimpleNamespace(analog_inputs={}, variables={})
+    return board
+
+
+async def run_board(board, n_events=5):
+    """Run the framework until n_events events are received, return the data received."""
+    received = []
+    await board.start_framework()
+    async for new_data in board.data_stream():
+        received.extend(new_data)
+        if sum(nd.type == MsgType.EVENT for nd in received) >= n_events:
+            board.stop_framework()
+    return received
+
+
+def test_concurrent_boards():
+    cages = [Virtual_cage(event_rate=50, preload=True, seed=seed) for seed in range(3)]
+
+    async def run():
+        boards = await asyncio.gather(*[setup_board(cage.pycboard.port) for cage in cages])
+        try:
+            for board in boards:
+                assert await board.get_file_hash("task_file.py") == _djb2_file(TASK_PATH)
+                assert "task_file.py" in await board.get_folder_manifest("")
+            return await asyncio.wait_for(asyncio.gather(*[run_board(board) for board in boards]), timeout=10)
+        finally:
+            for board in boards:
+                board.close()
+
+    try:
+        for received in asyncio.run(run()):
+            assert sum(nd.type == MsgType.EVENT for nd in received) >= 5
+            assert received[-1].type == MsgType.STOPF
+            assert not any(nd.type in (MsgType.WARNG, MsgType.ERROR) for nd in received)
+    finally:
+        for cage in cages:
+            cage.close()
@@ -0,0 +1,35 @@
+import pytest
+from source.communication.data_logger import Buffered_writer
+
+
+class Failing_file:
+    """Wraps a file, writing at most max_write bytes per call, raising OSError after n_writes calls."""
+
+    def __init__(self, file, max_write, n_writes):
+        self.file = file
+        self.max_write = max_write
+        self.n_writes = n_writes
+
+    def write(self, data):
+        if self.n_writes == 0:
+            raise OSError("No space left on device")
+        self.n_writes -= 1
+        return self.file.write(data[: self.max_write])
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+def test_partial_commit_retried(tmp_path):
+    file_path = tmp_path / "data.bin"
+    writer = Buffered_writer(str(file_path), max_delay=60)
+    file = writer.file
+    writer.file = Failing_file(file, max_write=3, n_writes=2)
+    writer.write(b"0123456789")
+    with pytest.raises(OSError):
+        writer.flush()
+    assert file_path.read_bytes() == b"012345"
+    writer.file = file
+    writer.write(b"abc")
+    writer.close()
+    assert file_path.read_bytes() == b"0123456789abc"
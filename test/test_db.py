@@ -0,0 +1,56 @@
+import sys
+import importlib
+import pandas as pd
+import pytest
+from source.gui import settings
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """The db module imported with its database and the csv files of earlier versions in tmp_path."""
+    monkeypatch.setattr(settings, "user_folder", lambda folder_name: str(tmp_path / folder_name))
+    pd.DataFrame(
+        {
+            "Mouse_ID": ["m1", "m2"],
+            "RFID": [116000039961, 116000039962],
+            "Setup_ID": ["s1", None],
+            "Experiment": ["exp", None],
+            "Current_weight": [20.5, None],
+            "is_training": ["False", "True"],
+        }
+    ).to_csv(tmp_path / "mice_dataframe_filepath")
+    monkeypatch.delitem(sys.modules, "db", raising=False)
+    db = importlib.import_module("db")
+    yield db
+    db.writer.close()
+    db.store.close()
+    sys.modules.pop("db", None)
+
+
+def test_tables_loaded_on_first_use(db):
+    assert "mouse_df" not in vars(db)
+    assert db.mouse_df["RFID"].tolist() == [116000039961, 116000039962]
+    assert db.mouse_df["RFID"].dtype == "int64"
+    assert isinstance(db.mouse_df["Setup_ID"].dtype, pd.CategoricalDtype)
+    assert db.mouse_df["Current_weight"].dtype == "float64"
+    assert db.mouse_df["is_training"].tolist() == [False, True]
+    assert "setup_df" not in vars(db)
+    assert db.setup_df.empty
+
+
+def test_update_insert_and_indexes(db):
+    db.update("mice", "Mouse_ID", "m2", {"Setup_ID": "s5", "Experiment": "new_exp"})  # New categories.
+    assert db.mouse_df["Setup_ID"].tolist() == ["s1", "s5"]
+    assert db.mouse_index.find("Setup_ID", "s5") == db.mouse_index.find("Mouse_ID", "m2")
+    db.insert("mice", {"Mouse_ID": "m3", "RFID": 116000039963, "Setup_ID": "s1"})
+    mouse_row = db.mouse_index.row("RFID", 116000039963)
+    assert mouse_row["Mouse_ID"] == "m3"
+    mouse_row.update({"Current_weight": 21.0})
+    assert [db.mouse_df.at[label, "Mouse_ID"] for label in db.mouse_index.find("Setup_ID", "s1")] == ["m1", "m3"]
+    db.delete("mice", "Mouse_ID", ["m1"])
+    assert db.mouse_index.find("Mouse_ID", "m1") == []
+    db.flush()
+    saved = db.store.read_table("mice").set_index("Mouse_ID")
+    assert sorted(saved.index) == ["m2", "m3"]
+    assert saved.at["m2", "Experiment"] == "new_exp"
+    assert saved.at["m3", "Current_weight"] == 21.0
@@ -0,0 +1,39 @@
+from source.communication.frame_decoder import AC_frame_decoder
+from source.pyAccessControl.ac_protocol import encode_msg, MAX_PAYLOAD_LEN
+
+FRAMES = [encode_msg(1000, "state", "allow_entry"), encode_msg(1020, "weight", 21.5), encode_msg(1040, "RFID", 1234)]
+MESSAGES = ["state:allow_entry", "weight:21.5", "RFID:1234"]
+
+
+def decode(decoder, data):
+    decoder.feed(data)
+    return decoder.decode()
+
+
+def test_split_frames():
+    decoder = AC_frame_decoder()
+    stream = b"".join(FRAMES)
+    messages = []
+    for i in range(0, len(stream), 3):  # Frames split across serial reads, including within the header.
+        messages += decode(decoder, stream[i : i + 3])
+    assert messages == MESSAGES
+    assert decoder.timestamp == 1040
+    assert len(decoder.buffer) == 0
+
+
+def test_bad_checksum():
+    decoder = AC_frame_decoder()
+    bad_frame = bytearray(FRAMES[1])
+    bad_frame[1] ^= 0xFF
+    assert decode(decoder, FRAMES[0] + bytes(bad_frame) + FRAMES[2]) == [MESSAGES[0], MESSAGES[2]]
+
+
+def test_bogus_length():
+    decoder = AC_frame_decoder()
+    # A start byte in plain text output followed by a length longer than any message is not
+    # waited for, the frames that follow it are decoded.
+    assert decode(decoder, b"text\x07\x00\x00\xff\xff" + FRAMES[0]) == [MESSAGES[0]]
+    assert decode(decoder, b"\x07\x00\x00\x01\x00" + FRAMES[1] + FRAMES[2]) == MESSAGES[1:]
+    assert len(decoder.buffer) == 0
+    # Strings are truncated by the board so their frames are within the maximum length.
+    assert decode(decoder, encode_msg(0, "error", "x" * 1000)) == ["x" * MAX_PAYLOAD_LEN]
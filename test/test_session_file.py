@@ -0,0 +1,63 @@
+import os
+import numpy as np
+from conftest import SM_INFO, SESSION_DATA
+from source.communication.message import MsgType, Datatuple
+from source.communication.data_logger import Session_file_writer
+from source.utils.session_file import Session_file, RECORD_TYPES, SUBTYPES
+
+
+def check_records(session_file):
+    """Check the records of SESSION_DATA read from session_file."""
+    assert len(session_file) == 8
+    assert np.allclose(session_file.times, [0, 0.12, 0.15, 0.2, 1.25, 1.3, 1.4, 1.5])
+    assert list(session_file.names(session_file.of_type("state"))) == ["wait", "reward"]
+    events = session_file.of_type("event")
+    assert list(session_file.names(events)) == ["poke", "lick"]
+    assert list(session_file.subtypes(events)) == ["input", "timer"]
+    assert [session_file.content(record) for record in session_file.of_type("print")] == ["trial 1\tstarted"]
+    assert [session_file.content(record) for record in session_file.of_type("variable")] == ['{"reward_ms": 50}']
+    assert list(session_file.between(1000, 1400)["time"]) == [1250, 1300]
+    assert session_file.time_slice(1600, 5000) == slice(8, 8)
+
+
+def test_session_file(tmp_path, write_session):
+    tsv_path = write_session(tmp_path, binary=True)
+    session_file = Session_file(os.path.splitext(tsv_path)[0] + ".session")
+    assert session_file.closed
+    assert session_file.header["task_name"] == "reversal_learning"
+    assert session_file.footer["end_timestamp"] == 1500
+    check_records(session_file)
+
+
+def test_unclosed_session_file(tmp_path):
+    file_path = str(tmp_path / "m1.session")
+    header = {"states": SM_INFO.states, "events": SM_INFO.events, "record_types": RECORD_TYPES, "subtypes": SUBTYPES}
+    writer = Session_file_writer(file_path, header)
+    writer.write(SESSION_DATA)
+    writer.flush()
+    session_file = Session_file(file_path)  # Read as if the program stopped during the session.
+    assert not session_file.closed
+    assert session_file.footer == {}
+    check_records(session_file)
+    writer.close({"end_timestamp": 1500})
+    assert Session_file(file_path).closed
+    assert not os.path.exists(file_path + ".heap")
+
+
+def test_records_out_of_time_order(tmp_path):
+    file_path = str(tmp_path / "m1.session")
+    header = {"states": SM_INFO.states, "events": SM_INFO.events, "record_types": RECORD_TYPES, "subtypes": SUBTYPES}
+    writer = Session_file_writer(file_path, header)
+    times = [0, 500, 400, 1200, 1100, 1100, 2500]  # e.g. records timestamped by the computer.
+    writer.write([Datatuple(time=t, type=MsgType.EVENT, subtype="input", content=3) for t in times])
+    writer.flush()
+    for closed in (False, True):
+        if closed:
+            writer.close({})
+        session_file = Session_file(file_path)
+        assert session_file.closed == closed
+        assert list(session_file.records["time"]) == times  # Records are kept in the order received.
+        assert list(session_file.time_order()) == [0, 2, 1, 4, 5, 3, 6]
+        assert list(session_file.between(400, 1150)["time"]) == [400, 500, 1100, 1100]
+        assert list(session_file.between(1150, 5000)["time"]) == [1200, 2500]
+        assert list(session_file.of_type("event")["time"]) == sorted(times)
@@ -0,0 +1,34 @@
+import pandas as pd
+from source.utils.session_log import Session_log
+
+
+def test_append_and_read(tmp_path):
+    log = Session_log(tmp_path, "m1")
+    sessions = [{"Date": f"2024-01-0{i + 1}", "Stage": i, "Variables": {"v.n_rewards": i * 10}} for i in range(5)]
+    for session in sessions:
+        log.append(session)
+    assert len(log) == len(sessions)
+    assert [log[i] for i in range(len(log))] == sessions
+    assert log[-1] == sessions[-1]
+    assert Session_log(tmp_path, "m1")[2] == sessions[2]
+
+
+def test_unindexed_and_partly_written_lines(tmp_path):
+    log = Session_log(tmp_path, "m1")
+    log.append({"Stage": 0})
+    with open(log.log_path, "a") as f:  # Line written without updating the index, then a partly written line.
+        f.write('{"Stage": 1}\n{"Sta')
+    assert len(log) == 2
+    assert log[1] == {"Stage": 1}
+    log.append({"Stage": 2})
+    assert [log[i]["Stage"] for i in range(len(log))] == [0, 1, 2]
+
+
+def test_convert_csv_log(tmp_path):
+    pd.DataFrame(
+        {"Date": ["2024-01-01", "2024-01-02"], "Stage": [0, 1], "Variables": ["{'v.n_rewards': 5}", None]}
+    ).to_csv(tmp_path / "m1.csv")
+    log = Session_log(tmp_path, "m1")
+    assert len(log) == 2
+    assert log[0] == {"Date": "2024-01-01", "Stage": 0, "Variables": {"v.n_rewards": 5}}
+    assert log[1]["Variables"] is None
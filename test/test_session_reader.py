@@ -0,0 +1,56 @@
+from datetime import datetime
+import numpy as np
+from source.utils import session_reader
+
+
+def test_find_session_files(tmp_path, write_session):
+    m1_sessions = [write_session(tmp_path, mouse="m1", start=datetime(2024, 1, day)) for day in (1, 2)]
+    m2_session = write_session(tmp_path, mouse="m2")
+    write_session(tmp_path, experiment="other_exp")
+    assert session_reader.find_session_files(tmp_path, "exp") == sorted(m1_sessions + [m2_session])
+    assert session_reader.find_session_files(tmp_path, "exp", mouse="m1") == m1_sessions
+    assert session_reader.find_session_files(tmp_path, "exp", protocol="other_prot") == []
+
+
+def test_load_session(tmp_path, write_session):
+    file_path = write_session(tmp_path)
+    (session,) = session_reader.load_sessions([file_path], use_cache=False)
+    assert session.info["task_name"] == "reversal_learning"
+    assert session.info["subject_id"] == "m1"
+    assert np.allclose(session.times, [0, 0.12, 0.15, 0.2, 1.25, 1.3, 1.4])
+    assert list(session.record_names(session.of_type("state"))) == ["wait", "reward"]
+    assert list(session.record_names(session.of_type("event"))) == ["poke", "lick"]
+    assert list(session.contents[session.of_type("print")]) == ["trial 1\tstarted"]
+    assert list(session.contents[session.of_type("variable")]) == ['{"reward_ms": 50}']
+    assert list(session.contents[session.of_type("warning")]) == ["low weight"]
+    times, data = session.analog["weight"]
+    assert np.array_equal(data, np.arange(100))
+    assert np.allclose(times[[0, 49, 50, 99]], [0, 0.49, 0.5, 0.99])
+
+
+def test_session_cache(tmp_path, write_session):
+    file_paths = [write_session(tmp_path / "data", mouse=mouse) for mouse in ("m1", "m2", "m3")]
+    parsed = session_reader.load_sessions(file_paths, use_cache=False, analog=False)
+    cache_dir = tmp_path / "cache"
+    for n_processes in (2, 1):  # Parse and cache sessions in parallel, then load them from the cache.
+        sessions = session_reader.load_sessions(file_paths, cache_dir=cache_dir, n_processes=n_processes, analog=False)
+        for session, parsed_session in zip(sessions, parsed):
+            assert session.info == parsed_session.info
+            for name in ("times", "types", "subtypes", "IDs", "names", "contents"):
+                assert np.array_equal(getattr(session, name), getattr(parsed_session, name))
+    assert len(list(cache_dir.iterdir())) == len(file_paths)
+
+
+def test_load_experiment_sessions(tmp_path, write_session):
+    for mouse in ("m1", "m2"):
+        write_session(tmp_path, mouse=mouse)
+    sessions = session_reader.load_experiment_sessions("exp", mouse="m2", data_dir=tmp_path, use_cache=False)
+    assert [session.info["subject_id"] for session in sessions] == ["m2"]
+
+
+def test_line_separators_in_content(tmp_path):
+    file_path = tmp_path / "m1.tsv"
+    file_path.write_text("time\ttype\tsubtype\tcontent\n0.1\tprint\tuser\ta\u2028b\x1cc\n0.2\tprint\tuser\td\n", "utf-8")
+    session = session_reader.parse_session_tsv(str(file_path))
+    assert np.allclose(session.times, [0.1, 0.2])
+    assert list(session.contents) == ["a\u2028b\x1cc", "d"]
@@ -0,0 +1,64 @@
+import pandas as pd
+import pytest
+from source.utils.database_store import Database_store, Write_behind
+from source.utils.variable_store import Variable_store, parse_value
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = Database_store(str(tmp_path / "homecage.db"))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def writer(store):
+    writer = Write_behind(store)
+    yield writer
+    writer.close()
+
+
+def test_parse_value():
+    assert parse_value("5") == 5
+    assert parse_value(" [1, 2.5] ") == [1, 2.5]
+    assert parse_value("'a'") == "a"
+    assert parse_value("abc") == "abc"
+    assert parse_value(3) == 3
+
+
+def test_set_and_get(store, writer):
+    variables = Variable_store(store, writer)
+    variables.set("m1", "persistent", {"v.n_rewards": 10, "v.isi": [3, 15]})
+    variables.set("m1", "persistent", {"v.n_rewards": 20}, task="reversal_learning")
+    variables.set("m1", "persistent", {"v.n_rewards": 30}, task="reversal_learning")
+    assert variables.get("m1", "persistent", "reversal_learning") == {"v.n_rewards": 30}
+    assert variables.get("m1", "persistent", "other_task") == {"v.n_rewards": 10, "v.isi": [3, 15]}
+    assert variables.get("m1", "set") == {}
+    assert variables.version("m1", "persistent", "reversal_learning") == 2
+    writer.flush()
+    saved = Variable_store(store, writer)  # Variables read back from the database.
+    assert saved.get("m1", "persistent", "reversal_learning") == {"v.n_rewards": 30}
+    assert saved.get("m1", "persistent") == {"v.n_rewards": 10, "v.isi": [3, 15]}
+    assert saved.version("m1", "persistent", "reversal_learning") == 2
+
+
+def test_import_mouse_columns(tmp_path, store, writer):
+    csv_path = tmp_path / "mice.csv"
+    pd.DataFrame(
+        {
+            "Mouse_ID": ["m1", "m2"],
+            "RFID": [1, 2],
+            "persistent_variables": ['{"v.n_rewards": "5"}', None],
+            "set_variables": ["{'v.isi': '[3, 15]', 'v.side': 'left'}", "{}"],
+        }
+    ).to_csv(csv_path)
+    store.import_csv("mice", str(csv_path))
+    Variable_store(store, writer).import_mouse_columns()
+    variables = Variable_store(store, writer)
+    assert variables.get("m1", "persistent") == {"v.n_rewards": 5}
+    assert variables.get("m1", "set") == {"v.isi": [3, 15], "v.side": "left"}
+    assert variables.get("m2", "set") == {}
+    variables.set("m1", "persistent", {"v.n_rewards": 6})
+    variables.import_mouse_columns()  # Columns are only imported once.
+    writer.flush()
+    assert Variable_store(store, writer).get("m1", "persistent") == {"v.n_rewards": 6}
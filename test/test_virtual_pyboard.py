@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import pytest
+from source.gui.settings import user_folder
+from source.communication import pycboard
+from source.communication.message import MsgType
+from virtual_pyboard import Virtual_cage
+
+
+@pytest.fixture
+def board(tmp_path, monkeypatch):
+    """Pycboard connected to a virtual pyboard with the pyControl framework loaded."""
+    folders = {"device_index_filepath": str(tmp_path / "device_index.json"), "mpy_cache_dir": str(tmp_path / "mpy")}
+    monkeypatch.setattr(pycboard, "user_folder", lambda name: folders.get(name) or user_folder(name))
+    monkeypatch.setattr(pycboard.Pycboard, "device_index", None)
+    cage = Virtual_cage(event_rate=50, analog_rate=200, seed=1)
+    board = pycboard.Pycboard(cage.pycboard.port, print_func=lambda *args, **kwargs: None)
+    board.load_framework()
+    yield board
+    board.close()
+    cage.close()
+
+
+def read_run_data(board, until, timeout=5):
+    """Return list of the Datatuples read from board until until(Datatuple) is True."""
+    received = []
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        new_data, error_message = board.read_data()
+        assert error_message is None
+        received.extend(new_data)
+        if any(until(nd) for nd in new_data):
+            return received
+        time.sleep(0.01)
+    raise TimeoutError("Data not received from board.")
+
+
+def test_transfer_folder(board, tmp_path):
+    folder = tmp_path / "upload"
+    folder.mkdir()
+    for file_name, content in {"a.py": "x = 1\n", "b.py": "y = 2\n" * 2000, "c.txt": "text"}.items():
+        (folder / file_name).write_text(content)
+    board.transfer_folder(str(folder), file_type="py")
+    assert board.get_folder_manifest("upload") == {
+        file_name: (os.path.getsize(folder / file_name), pycboard._djb2_file(str(folder / file_name)))
+        for file_name in ("a.py", "b.py")
+    }
+    # Files removed from the folder are removed from the pyboard, files in subfolders are kept.
+    board.exec("os.mkdir('upload/sub')")
+    board.write_file("upload/sub/d.py", "z = 3\n")
+    (folder / "a.py").unlink()
+    board.transfer_folder(str(folder), file_type="py")
+    assert sorted(board.get_folder_manifest("upload")) == ["b.py", "sub/d.py"]
+
+
+def test_transfer_file_retry(board, tmp_path, monkeypatch):
+    file_path = tmp_path / "data.py"
+    file_path.write_text("x = 1\n" * 1000)
+    serial_write = board.serial.write
+    writes = []
+
+    def drop_a_chunk(data):  # Lose the second chunk of the first attempt, so the board times out.
+        writes.append(data)
+        if len(writes) != 4:
+            serial_write(data)
+
+    monkeypatch.setattr(board.serial, "write", drop_a_chunk)
+    board.transfer_file(str(file_path), "data.py", check_existing=False)
+    assert board.get_file_hash("data.py") == pycboard._djb2_file(str(file_path))
+    assert sum(data.startswith(b"_receive_file") for data in writes) == 2
+
+
+def test_setup_state_machine(board):
+    board.setup_state_machine("reversal_learning")
+    assert board.sm_info.name == "reversal_learning"
+    assert board.sm_info.ID2name[board.sm_info.states["inter_stimulus_interval"]] == "inter_stimulus_interval"
+    assert board.sm_info.variables["max_trials"] == 3
+    assert board.set_variables({"max_trials": 5, "n_trials": 1}) == {"max_trials": True, "n_trials": True}
+    assert board.get_variables(["max_trials"]) == {"max_trials": 5}
+    board.stage_tasks(["reversal_learning"])
+    assert "reversal_learning.py" in board.get_folder_contents("tasks")
+    board.setup_state_machine("reversal_learning")  # Imported from the tasks folder.
+    assert board.sm_info.variables["max_trials"] == 3
+    board.load_framework()
+    assert board.staged_tasks == {}
+
+
+def test_data_framing(board):
+    board.setup_state_machine("reversal_learning")
+    board.start_framework()
+    received = read_run_data(board, lambda nd: nd.type == MsgType.ANLOG)
+    # The bytes of the command sum to more than 0xFFFF, so its checksum is masked to 16 bits.
+    variables = {"n_trials": 7, "isi": list(range(2000))}
+    board.set_variables(variables)
+    is_set = lambda nd: nd.type == MsgType.VARBL and nd.subtype == "user_set"
+    received += read_run_data(board, is_set)
+    assert [json.loads(nd.content) for nd in received if is_set(nd)] == [variables]
+    board.stop_framework()
+    received += read_run_data(board, lambda nd: nd.type == MsgType.STOPF)
+    events = [nd for nd in received if nd.type == MsgType.EVENT]
+    assert events and all(board.sm_info.ID2name[nd.content] in board.sm_info.events for nd in events)
+    analog = [nd for nd in received if nd.type == MsgType.ANLOG]
+    assert analog and all(nd.content[0] in board.sm_info.analog_inputs for nd in analog)
+    times = [nd.time for nd in received if nd.type != MsgType.ANLOG]
+    assert times == sorted(times)
@@ -0,0 +1,690 @@
+"""
+Virtual pyboard
+Simulates pyboards running the pyControl framework and the access control framework on
+pseudo-terminals, so that Pycboard, Access_control and system_controller can be run and load
+tested without hardware.  Linux and macOS only.
+
+Each virtual board emulates the raw REPL and executes the commands sent by the computer against
+a model of the board whose filesystem is a folder on the computer, so the file transfer, folder
+manifest and framework import code run as they would on a real board.  Running pyControl tasks
+output variables, events, state transitions and analog data at configurable rates, and access
+control boards cycle simulated mice through the access control states.
+
+Example usage, run from the pycontrol_homecage folder:
+    python test/virtual_pyboard.py --cages 50 --event-rate 20 --analog-rate 1000
+prints the serial ports of the simulated boards, which can be used in place of the COM ports
+of real boards in the setups table.  Use --preload to start the boards with the frameworks
+already on them.  From a script:
+    cage = Virtual_cage(event_rate=20)
+    board = Pycboard(cage.pycboard.port)
+"""
+
+import os
+import re
+import sys
+import ast
+import pty
+import tty
+import json
+import math
+import time
+import random
+import select
+import shutil
+import argparse
+import builtins
+import tempfile
+import threading
+from array import array
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from source.pyAccessControl.ac_protocol import encode_msg
+
+RAW_REPL_PROMPT = b"raw REPL; CTRL-B to exit\r\n>"
+TIME_UNITS = {"ms": 1, "second": 1000, "minute": 60 * 1000, "hour": 60 * 60 * 1000}  # pyControl.utility units.
+
+
+class _Closed(BaseException):
+    """Raised in the board thread when the virtual board is closed."""
+
+
+class _Hard_reset(BaseException):
+    """Raised by pyb.hard_reset() and pyb.bootloader()."""
+
+
+def _parse_task(file_path):
+    """Return the states, events, initial state and variables of a pyControl task file.  The
+    task is parsed rather than run, variables whose value is not a literal expression
+    (optionally using the pyControl time units) are ignored."""
+    with open(file_path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    task = SimpleNamespace(states=[], events=[], initial_state=None, variables={})
+    for node in tree.body:
+        if not isinstance(node, ast.Assign):
+            continue
+        for target in node.targets:
+            try:
+                if isinstance(target, ast.Name) and target.id in ("states", "events", "initial_state"):
+                    setattr(task, target.id, ast.literal_eval(node.value))
+                elif isinstance(target, ast.Attribute) and getattr(target.value, "id", None) == "v":
+                    expression = compile(ast.Expression(body=node.value), file_path, "eval")
+                    task.variables[target.attr] = eval(expression, {"__builtins__": {}}, dict(TIME_UNITS))
+            except (ValueError, NameError, TypeError, SyntaxError):
+                pass
+    return task
+
+
+# ----------------------------------------------------------------------------------------
+#  Virtual_pyboard class.
+# ----------------------------------------------------------------------------------------
+
+
+class _USB_VCP:
+    """Virtual board's USB serial connection to the computer, mirrors pyb.USB_VCP."""
+
+    def __init__(self, board):
+        self.board = board
+
+    def setinterrupt(self, char):
+        self.board.interrupt_enabled = char == 3
+
+    def any(self):
+        return bool(self.board.rx) or self.board._fill(0)
+
+    def recv(self, data, timeout=5000):
+        """Receive data, an integer number of bytes or a buffer to fill, waiting up to timeout ms."""
+        n_bytes = data if isinstance(data, int) else len(data)
+        received = self.board._recv(n_bytes, timeout / 1000)
+        if isinstance(data, int):
+            return received
+        data[: len(received)] = received
+        return len(received)
+
+    def read(self, n_bytes=-1):
+        if not self.any():
+            return None
+        n_bytes = len(self.board.rx) if n_bytes < 0 else n_bytes
+        data = bytes(self.board.rx[:n_bytes])
+        del self.board.rx[:n_bytes]
+        return data
+
+    def readline(self):
+        if not self.any():
+            return None
+        end = self.board.rx.find(b"\n") + 1 or len(self.board.rx)
+        data = bytes(self.board.rx[:end])
+        del self.board.rx[:end]
+        return data
+
+    def write(self, data):
+        self.board._write(data)
+        return len(data)
+
+    send = write
+
+
+class Virtual_pyboard:
+    """Pyboard emulated on a pseudo-terminal.  The serial port to connect to is given by the
+    port attribute.  The board runs a raw REPL in a background thread, commands are executed
+    as python with the MicroPython modules used by the computer replaced by models that act on
+    the board's filesystem folder (root_dir, a temporary folder by default)."""
+
+    micropython_version = (1, 22, 0)
+
+    def __init__(self, root_dir=None, unique_id=None, fs_size=2 * 1024 * 1024, seed=None):
+        self.temp_dir = root_dir is None
+        self.root_dir = tempfile.mkdtemp(prefix="virtual_pyboard_") if self.temp_dir else root_dir
+        self.unique_id = unique_id or os.urandom(12)
+        self.fs_size = fs_size
+        self.random = random.Random(seed)
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)  # The slave is kept open so the pty persists while the computer reconnects.
+        self.port = os.ttyname(self.slave)
+        self.rx = bytearray()  # Bytes received from the computer but not yet consumed.
+        self.interrupt_enabled = True
+        self.usb = _USB_VCP(self)
+        self.start_time = time.monotonic()
+        self.closed = False
+        self._soft_reset()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.closed = True
+        self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+        if self.temp_dir:
+            shutil.rmtree(self.root_dir, ignore_errors=True)
+
+    # ------------------------------------------------------------------------------------
+    # Serial connection.
+    # ------------------------------------------------------------------------------------
+
+    def _write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        with memoryview(bytes(data)) as mv:
+            while mv:
+                mv = mv[os.write(self.master, mv) :]
+
+    def _fill(self, timeout):
+        """Wait up to timeout seconds for data from the computer and add it to rx, return True
+        if data was received.  Raises KeyboardInterrupt if ctrl-C is received while enabled."""
+        if self.closed:
+            raise _Closed
+        if not select.select([self.master], [], [], min(timeout, 0.1))[0]:
+            return False
+        data = os.read(self.master, 4096)
+        if self.interrupt_enabled and b"\x03" in data:
+            self.rx = bytearray(data[data.rfind(b"\x03") + 1 :])  # Input before ctrl-C is discarded.
+            raise KeyboardInterrupt
+        self.rx += data
+        return bool(data)
+
+    def _recv(self, n_bytes, timeout):
+        """Return up to n_bytes received from the computer, waiting up to timeout seconds."""
+        deadline = time.monotonic() + timeout
+        while len(self.rx) < n_bytes:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._fill(remaining)
+        data = bytes(self.rx[:n_bytes])
+        del self.rx[:n_bytes]
+        return data
+
+    def _millis(self):
+        return int((time.monotonic() - self.start_time) * 1000) & 0x3FFFFFFF
+
+    # ------------------------------------------------------------------------------------
+    # Raw REPL.
+    # ------------------------------------------------------------------------------------
+
+    def _run(self):
+        raw_mode = False
+        command = bytearray()
+        try:
+            while True:
+                if not self.rx:
+                    try:
+                        self._fill(0.1)
+                    except KeyboardInterrupt:
+                        command.clear()
+                    continue
+                byte = self.rx.pop(0)
+                if byte == 0x01:  # ctrl-A: enter raw REPL.
+                    raw_mode = True
+                    command.clear()
+                    self._write(RAW_REPL_PROMPT)
+                elif byte == 0x02:  # ctrl-B: exit raw REPL.
+                    raw_mode = False
+                    self._write(b"\r\nMicroPython (virtual pyboard)\r\n>>> ")
+                elif byte == 0x03:  # ctrl-C.
+                    command.clear()
+                elif not raw_mode:
+                    continue
+                elif byte == 0x04:  # ctrl-D: execute command, soft reset if no command.
+                    if command:
+                        self._write(b"OK")
+                        try:
+                            error = self._execute(bytes(command))
+                            self._write(b"\x04" + error + b"\x04>")
+                        except _Hard_reset:
+                            self._soft_reset()
+                            raw_mode = False
+                        command.clear()
+                    else:
+                        self._soft_reset()
+                        self._write(b"OK\r\nMPY: soft reboot\r\n" + RAW_REPL_PROMPT)
+                else:
+                    command.append(byte)
+        except _Closed:
+            pass
+
+    def _execute(self, command):
+        """Execute command, output is written to the serial line as it is printed, the error
+        output is returned."""
+        self.interrupt_enabled = True
+        try:
+            exec(compile(self._translate(command.decode()), "<stdin>", "exec"), self.namespace)
+        except (_Closed, _Hard_reset):
+            raise
+        except BaseException as e:
+            error = 'Traceback (most recent call last):\r\n  File "<stdin>", line 1, in <module>\r\n'
+            return (error + "{}: {}\r\n".format(type(e).__name__, e)).encode()
+        finally:
+            self.interrupt_enabled = True
+        return b""
+
+    def _translate(self, source):
+        """Adapt MicroPython specific code to run in CPython.  Values of builtin types have no
+        __init__ attribute in MicroPython, which the computer uses to filter out functions."""
+        return re.sub(r"hasattr\((\w+),\s*['\"]__init__['\"]\)", r"callable(\1)", source)
+
+    def _print(self, *args, sep=" ", end="\n", file=None, flush=False):
+        self._write((sep.join(str(arg) for arg in args) + end).replace("\n", "\r\n"))
+
+    def _soft_reset(self):
+        """Clear the interpreter state, as after a soft reboot."""
+        self.modules = {}
+        self.rx.clear()
+        self.namespace = {
+            "__name__": "__main__",
+            "__builtins__": dict(vars(builtins), __import__=self._import, open=self._open, print=self._print),
+        }
+
+    # ------------------------------------------------------------------------------------
+    # Filesystem and modules.
+    # ------------------------------------------------------------------------------------
+
+    def _path(self, path):
+        """Return the location on the computer of a path on the board."""
+        path = str(path)
+        if path.startswith("/flash"):
+            path = path[len("/flash") :]
+        path = os.path.normpath(path.lstrip("/")) if path.strip("/") else ""
+        if path.startswith(".."):
+            raise OSError(2, "ENOENT")
+        return os.path.join(self.root_dir, path)
+
+    def _open(self, path, mode="r", *args, **kwargs):
+        return open(self._path(path), mode, *args, **kwargs)
+
+    def _exists(self, path):
+        return os.path.exists(self._path(path))
+
+    def _used_space(self):
+        return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(self.root_dir) for f in files)
+
+    def _make_os(self):
+        def ilistdir(path=""):
+            for name in sorted(os.listdir(self._path(path))):
+                file_path = os.path.join(self._path(path), name)
+                is_dir = os.path.isdir(file_path)
+                yield (name, 0x4000 if is_dir else 0x8000, 0, 0 if is_dir else os.path.getsize(file_path))
+
+        def statvfs(path=""):
+            free_blocks = max(0, self.fs_size - self._used_space()) // 512
+            return (512, 512, self.fs_size // 512, free_blocks, free_blocks, 0, 0, 0, 0, 255)
+
+        return SimpleNamespace(
+            listdir=lambda path="": sorted(os.listdir(self._path(path))),
+            ilistdir=ilistdir,
+            mkdir=lambda path: os.mkdir(self._path(path)),
+            rmdir=lambda path: os.rmdir(self._path(path)),
+            remove=lambda path: os.remove(self._path(path)),
+            rename=lambda old, new: os.rename(self._path(old), self._path(new)),
+            stat=lambda path: tuple(os.stat(self._path(path))),
+            statvfs=statvfs,
+            sep="/",
+        )
+
+    def _make_pyb(self):
+        def hard_reset():
+            raise _Hard_reset
+
+        return SimpleNamespace(
+            USB_VCP=lambda *args: self.usb,
+            unique_id=lambda: self.unique_id,
+            usb_mode=lambda *args, **kwargs: "VCP+MSC",
+            millis=self._millis,
+            elapsed_millis=lambda start: (self._millis() - start) & 0x3FFFFFFF,
+            delay=lambda ms: time.sleep(ms / 1000),
+            hard_reset=hard_reset,
+            bootloader=hard_reset,
+        )
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        """Import a board module, modules not on the board raise ImportError."""
+        if name not in self.modules:
+            module = self._load_module(name)
+            if module is None:
+                raise ImportError("no module named '{}'".format(name))
+            if "." in name:
+                parent_name, child_name = name.rsplit(".", 1)
+                setattr(self._import(parent_name, fromlist=True), child_name, module)
+            self.modules[name] = module
+        return self.modules[name] if fromlist else self.modules[name.split(".")[0]]
+
+    def _load_module(self, name):
+        """Return the module called name, or None if it is not available on the board."""
+        if name == "os":
+            return self._make_os()
+        elif name == "pyb":
+            return self._make_pyb()
+        elif name == "gc":
+            return SimpleNamespace(collect=lambda: None, mem_free=lambda: 100000)
+        elif name == "sys":
+            implementation = SimpleNamespace(name="micropython", version=self.micropython_version)
+            return SimpleNamespace(implementation=implementation, platform="pyboard")
+        module_path = name.replace(".", "/")
+        if os.path.isdir(self._path(module_path)) or self._exists(module_path + ".py"):
+            return SimpleNamespace()  # Board file that is not modelled, import has no effect.
+        return None
+
+    def preload(self, folder_path, target_folder, file_type="py"):
+        """Copy files from a folder on the computer to a folder on the board."""
+        os.makedirs(self._path(target_folder), exist_ok=True)
+        for file_name in os.listdir(folder_path):
+            if file_name.endswith("." + file_type):
+                shutil.copy(os.path.join(folder_path, file_name), self._path(target_folder))
+
+
+# ----------------------------------------------------------------------------------------
+#  Virtual_pycboard class.
+# ----------------------------------------------------------------------------------------
+
+
+class Virtual_pycboard(Virtual_pyboard):
+    """Virtual pyboard running the pyControl framework.  While a task runs, events occur at
+    event_rate per second with a random state transition after half of them, and n_analog
+    analog inputs stream data sampled at analog_rate."""
+
+    def __init__(self, event_rate=10.0, analog_rate=0, n_analog=1, **kwargs):
+        self.event_rate = event_rate
+        self.analog_rate = analog_rate
+        self.n_analog = n_analog if analog_rate else 0
+        super().__init__(**kwargs)
+
+    def preload_framework(self):
+        self.preload(os.path.join("source", "pyControl"), "pyControl")
+        self.preload("devices", "devices")
+
+    def _load_module(self, name):
+        if name == "pyControl" and self._exists("pyControl/framework.py"):
+            with self._open("pyControl/framework.py") as f:
+                version = re.search(r"VERSION\s*=\s*['\"](.*)['\"]", f.read())
+            self.fw = SimpleNamespace(VERSION=version.group(1) if version else "", data_output=True, run=self._run_task)
+            self.sm = SimpleNamespace(
+                states={},
+                events={},
+                variables=SimpleNamespace(),
+                setup_state_machine=self._setup_state_machine,
+                set_variable=self._set_variable,
+                get_variable=lambda v_name: getattr(self.sm.variables, v_name, None),
+                set_variables=lambda v_dict: {k: self._set_variable(k, v) for k, v in v_dict.items()},
+                get_variables=self._get_variables,
+            )
+            self.hw = SimpleNamespace(get_analog_inputs=lambda: self._print(self._analog_inputs()))
+            return SimpleNamespace(fw=self.fw, sm=self.sm, hw=self.hw, ut=SimpleNamespace())
+        elif name == "task_file" or name.startswith("tasks."):
+            module_path = name.replace(".", "/") + ".py"
+            return _parse_task(self._path(module_path)) if self._exists(module_path) else None
+        return super()._load_module(name)
+
+    def _setup_state_machine(self, task_file):
+        self.task = task_file
+        self.sm.states = {s: i + 1 for i, s in enumerate(task_file.states)}
+        self.sm.events = {e: i + 1 + len(task_file.states) for i, e in enumerate(task_file.events)}
+        self.sm.variables = SimpleNamespace(**task_file.variables)
+
+    def _set_variable(self, v_name, v_value):
+        if not hasattr(self.sm.variables, v_name):
+            return False
+        setattr(self.sm.variables, v_name, v_value)
+        return True
+
+    def _get_variables(self, v_names=None):
+        if v_names is None:
+            return dict(vars(self.sm.variables))
+        return {v_name: getattr(self.sm.variables, v_name, None) for v_name in v_names}
+
+    def _analog_inputs(self):
+        return {
+            ID: {"name": "analog_{}".format(ID), "fs": self.analog_rate, "dtype": "H", "plot": True}
+            for ID in range(1, self.n_analog + 1)
+        }
+
+    def _output(self, timestamp, msg_type, subtype, content):
+        """Send a message in the pyControl framework data format."""
+        if not self.fw.data_output:
+            return
+        subtype_byte = subtype.encode() if subtype else b"_"
+        content_bytes = str(content).encode() if content else b""
+        message = timestamp.to_bytes(4, "little") + msg_type + subtype_byte + content_bytes
+        checksum = sum(message) & 0xFFFF
+        self._write(b"\x07" + checksum.to_bytes(2, "little") + len(message).to_bytes(2, "little") + message)
+
+    def _output_analog(self, timestamp, ID, data):
+        """Send a buffer of analog data in the pyControl framework format."""
+        if not self.fw.data_output:
+            return
+        header = timestamp.to_bytes(4, "little") + b"A_" + ID.to_bytes(2, "little")
+        checksum = (sum(header) + sum(data)) & 0xFFFF
+        message_len = len(header) + data.itemsize * len(data)
+        self._write(b"\x07" + checksum.to_bytes(2, "little") + message_len.to_bytes(2, "little") + header)
+        self._write(data.tobytes())
+
+    def _run_task(self):
+        """Run the framework until the stop command is received from the computer."""
+        self.usb.setinterrupt(-1)
+        start_time = time.monotonic()
+        run_time = lambda: int((time.monotonic() - start_time) * 1000)
+        event_IDs = list(self.sm.events.values())
+        state_IDs = list(self.sm.states.values())
+        self._output(0, b"V", "t", json.dumps(vars(self.sm.variables)))
+        if self.task.initial_state in self.sm.states:
+            self._output(0, b"S", "", self.sm.states[self.task.initial_state])
+        next_event = start_time + self.random.expovariate(self.event_rate) if self.event_rate else math.inf
+        # Analog data is sent in buffers as by the framework, samples are taken from a 1 second waveform.
+        buffer_size = max(4, min(256 // 2, self.analog_rate // 10)) if self.analog_rate else 0
+        waveform = array(
+            "H", (int(2048 + 1000 * math.sin(2 * math.pi * i / self.analog_rate)) for i in range(self.analog_rate))
+        )
+        samples_sent = 0
+        next_buffer = start_time + buffer_size / self.analog_rate if self.analog_rate else math.inf
+        running = True
+        while running:
+            now = time.monotonic()
+            if now >= next_event:
+                if event_IDs:
+                    self._output(run_time(), b"E", "i", self.random.choice(event_IDs))
+                    if state_IDs and self.random.random() < 0.5:
+                        self._output(run_time(), b"S", "", self.random.choice(state_IDs))
+                next_event += self.random.expovariate(self.event_rate)
+            elif now >= next_buffer:
+                buffer_start = samples_sent % self.analog_rate
+                data = waveform[buffer_start : buffer_start + buffer_size]
+                if len(data) < buffer_size:
+                    data += waveform[: buffer_size - len(data)]
+                timestamp = int(1000 * samples_sent / self.analog_rate)
+                for ID in range(1, self.n_analog + 1):
+                    self._output_analog(timestamp, ID, data)
+                samples_sent += buffer_size
+                next_buffer += buffer_size / self.analog_rate
+            elif self.rx or self._fill(max(0, min(next_event, next_buffer) - now)):
+                running = self._receive_data(run_time)
+        self._output(run_time(), b"V", "e", json.dumps(vars(self.sm.variables)))
+        self._output(run_time(), b"X", "", "")
+
+    def _receive_data(self, run_time):
+        """Process a command from the computer, return False if the run should stop."""
+        new_byte = self._recv(1, 0)
+        if new_byte == b"\x03":  # Stop run.
+            return False
+        elif new_byte in (b"V", b"E"):
+            data_len = int.from_bytes(self._recv(2, 1), "little")
+            data_and_checksum = self._recv(data_len + 2, 1)
+            if int.from_bytes(data_and_checksum[-2:], "little") != sum(data_and_checksum[:-2]) & 0xFFFF:
+                return True  # Bad checksum.
+            data_str = data_and_checksum[:-2].decode()
+            if new_byte == b"V":
+                if data_str[0] in ("s", "a"):  # Set variable.
+                    v_name, v_value = ast.literal_eval(data_str[1:])
+                    if self._set_variable(v_name, v_value):
+                        self._output(run_time(), b"V", data_str[0], json.dumps({v_name: v_value}))
+                elif data_str[0] == "g":  # Get variable.
+                    v_value = getattr(self.sm.variables, data_str[1:], None)
+                    self._output(run_time(), b"V", "g", json.dumps({data_str[1:]: v_value}))
+                elif data_str[0] == "S":  # Set multiple variables.
+                    v_dict = ast.literal_eval(data_str[2:])
+                    set_dict = {k: v for k, v in v_dict.items() if self._set_variable(k, v)}
+                    self._output(run_time(), b"V", data_str[1], json.dumps(set_dict))
+                elif data_str[0] == "G":  # Get multiple variables.
+                    v_dict = self._get_variables(ast.literal_eval(data_str[1:]))
+                    self._output(run_time(), b"V", "g", json.dumps(v_dict))
+            else:  # Trigger event.
+                self._output(run_time(), b"E", data_str[0], int(data_str[1:]))
+        return True
+
+
+# ----------------------------------------------------------------------------------------
+#  Virtual_access_control class.
+# ----------------------------------------------------------------------------------------
+
+
+class Virtual_access_control(Virtual_pyboard):
+    """Virtual pyboard running the access control framework.  A mouse enters on average every
+    entry_interval seconds, trains for session_duration seconds and then leaves, each entry
+    uses the next of the rfids in turn.  The loadcell readings are sent every second as by
+    the access control framework."""
+
+    def __init__(self, rfids=("116000039961",), entry_interval=60.0, session_duration=300.0, **kwargs):
+        self.rfids = list(rfids)
+        self.entry_interval = entry_interval
+        self.session_duration = session_duration
+        self.mouse_weight = None  # Weight of the mouse on the loadcell, None if no mouse.
+        self.loadcell = SimpleNamespace(
+            tare=lambda: None,
+            calibrate=lambda weight: None,
+            weigh=lambda raw=False: (self.mouse_weight or 0.0) + self.random.gauss(0, 0.05),
+        )
+        super().__init__(**kwargs)
+
+    def preload_framework(self):
+        self.preload(os.path.join("source", "pyAccessControl"), "pyAccessControl")
+        shutil.copy(os.path.join("source", "pyAccessControl", "main_script_for_pyboard.py"), self._path("main.py"))
+
+    def _load_module(self, name):
+        if name == "pyAccessControl.access_control_1_0" and self._exists("pyAccessControl/access_control_1_0.py"):
+            hardware = SimpleNamespace(loadcell=self.loadcell, rfid=SimpleNamespace(read_tag=self._read_tag))
+            return SimpleNamespace(Access_control_upy=lambda: hardware)
+        elif name == "main" and self._exists("main.py"):
+            return SimpleNamespace(handler=lambda: SimpleNamespace(run=self._run_access_control))
+        return super()._load_module(name)
+
+    def _read_tag(self):
+        return self.rfids[0] if self.mouse_weight else None
+
+    def _entry_steps(self):
+        """Return list of (delay, key, value) messages sent as a mouse passes through the access control."""
+        rfid = self.rfids[0]
+        self.rfids.append(self.rfids.pop(0))
+        return [
+            (0.5, "state", "wait_close"),
+            (0.5, "state", "check_mouse"),
+            (1.0, "weight", self.mouse_weight),
+            (0.5, "RFID", rfid),
+            (0.1, "state", "enter_training_chamber"),
+            (0.5, "state", "mouse_training"),
+            (self.session_duration, "state", "check_mouse_in_ac"),
+            (0.5, "state", "allow_exit"),
+            (1.0, "state", "check_exit"),
+            (1.0, "state", "allow_entry"),
+        ]
+
+    def _run_access_control(self):
+        """Run the access control state machine until interrupted by the computer."""
+        send_msg = lambda key, value: self._write(encode_msg(self._millis(), key, value))
+        send_msg("state", "allow_entry")
+        steps = []
+        next_step = time.monotonic() + self.random.expovariate(1 / self.entry_interval)
+        next_telemetry = time.monotonic() + 1
+        while True:
+            now = time.monotonic()
+            if now >= next_telemetry:
+                send_msg("weight", self.loadcell.weigh())
+                send_msg("raw_weigh", self.loadcell.weigh(raw=True))
+                send_msg("baseline_esitimate", 0.0)
+                next_telemetry += 1
+            elif now >= next_step:
+                if not steps:  # Mouse enters.
+                    self.mouse_weight = self.random.uniform(20, 30)
+                    steps = self._entry_steps()
+                else:
+                    delay, key, value = steps.pop(0)
+                    send_msg(key, value)
+                    if value == "allow_exit":
+                        self.mouse_weight = None
+                if steps:
+                    next_step += steps[0][0]
+                else:
+                    next_step += self.random.expovariate(1 / self.entry_interval)
+            elif self.rx or self._fill(max(0, min(next_step, next_telemetry) - now)):
+                sent_data = self.usb.read().decode()
+                if sent_data == "tare":
+                    send_msg("calT", self.loadcell.weigh())
+                elif "calibrate" in sent_data:
+                    send_msg("calC", self.loadcell.weigh())
+                elif sent_data == "weigh":
+                    send_msg("calW", self.loadcell.weigh())
+                elif sent_data == "read_tag":
+                    send_msg("RFID", self._read_tag())
+
+
+# ----------------------------------------------------------------------------------------
+#  Virtual_cage class.
+# ----------------------------------------------------------------------------------------
+
+
+class Virtual_cage:
+    """A virtual pyControl board and access control board pair."""
+
+    def __init__(
+        self,
+        event_rate=10.0,
+        analog_rate=0,
+        n_analog=1,
+        rfids=("116000039961",),
+        entry_interval=60.0,
+        session_duration=300.0,
+        preload=False,
+        seed=None,
+    ):
+        self.pycboard = Virtual_pycboard(event_rate=event_rate, analog_rate=analog_rate, n_analog=n_analog, seed=seed)
+        self.access_control = Virtual_access_control(
+            rfids=rfids, entry_interval=entry_interval, session_duration=session_duration, seed=seed
+        )
+        if preload:
+            self.pycboard.preload_framework()
+            self.access_control.preload_framework()
+
+    def close(self):
+        self.pycboard.close()
+        self.access_control.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run virtual pyControl and access control boards.")
+    parser.add_argument("--cages", type=int, default=1, help="Number of cages to simulate.")
+    parser.add_argument("--event-rate", type=float, default=10.0, help="Task events per second.")
+    parser.add_argument("--analog-rate", type=int, default=0, help="Analog input sampling rate (Hz).")
+    parser.add_argument("--analog-inputs", type=int, default=1, help="Analog inputs per task.")
+    parser.add_argument("--entry-interval", type=float, default=60.0, help="Mean seconds between mouse entries.")
+    parser.add_argument("--session-duration", type=float, default=300.0, help="Seconds a mouse stays training.")
+    parser.add_argument("--rfids", nargs="+", default=["116000039961"], help="RFIDs of the simulated mice.")
+    parser.add_argument("--preload", action="store_true", help="Start boards with the frameworks loaded.")
+    args = parser.parse_args()
+
+    cages = [
+        Virtual_cage(
+            event_rate=args.event_rate,
+            analog_rate=args.analog_rate,
+            n_analog=args.analog_inputs,
+            rfids=args.rfids[i::args.cages] or args.rfids,
+            entry_interval=args.entry_interval,
+            session_duration=args.session_duration,
+            preload=args.preload,
+        )
+        for i in range(args.cages)
+    ]
+    for i, cage in enumerate(cages):
+        print("cage {}: COM {}  COM_AC {}".format(i, cage.pycboard.port, cage.access_control.port))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        for cage in cages:
+            cage.close()